@@ -0,0 +1,210 @@
+"""
+End-to-end and micro benchmarks for the irail CLI.
+
+Every command is run in a fresh process against the
+local stand-in server from tests.fakeserver, so the
+numbers include interpreter start-up and imports but
+not the real network. For each command we measure the
+time to the first row of output and the total time;
+cold start is `irail --help`. The micro benchmarks time
+the parsing and formatting helpers in-process.
+
+Results are written to benchmarks/results/<label>.json
+(the label defaults to `git describe`), and can be
+compared against an earlier run:
+
+    python -m benchmarks.run --latency 0.05
+    python -m benchmarks.run --compare v0.0.9
+
+The exit status is 1 when any measurement got slower
+than the threshold allows.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(ROOT, "benchmarks", "results")
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from tests.fakeserver import FakeIRail, FIXTURES
+
+
+COMMANDS = {
+    "liveboard": ["liveboard", "Gent-Sint-Pieters", "-f", "ndjson"],
+    "liveboard-stream": ["liveboard", "Gent-Sint-Pieters", "-f", "ndjson", "--stream"],
+    "liveboard-merged": ["liveboard", "Gent-Sint-Pieters", "Gent-Dampoort", "-m", "-f", "ndjson"],
+    "route": ["route", "Gent-Sint-Pieters", "Brussel-Zuid", "-f", "ndjson"],
+    "vehicle": ["vehicle", "IC1530", "-f", "ndjson"],
+    "vehicle-stream": ["vehicle", "IC1530", "-f", "ndjson", "--stream"],
+}
+
+RUN_CLI = "from irail.cli import cli; cli(prog_name='irail')"
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def run_command(args, env):
+    """
+    Run the CLI once and return the seconds until
+    the first line of output and until it exited.
+    """
+    start = time.time()
+    process = subprocess.Popen([sys.executable, "-c", RUN_CLI] + args,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, cwd=ROOT)
+    first = process.stdout.readline()
+    first_row = time.time() - start
+    process.stdout.read()
+    process.stderr.read()
+    if process.wait() != 0 or not first:
+        raise RuntimeError("irail {} failed".format(" ".join(args)))
+    return first_row, time.time() - start
+
+
+def environment(fake, home, cache):
+    env = dict(os.environ)
+    env.update(fake.environ())
+    env["IRAIL_HOME"] = home
+    env["IRAIL_CACHE"] = "1" if cache else "0"
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def benchmark_commands(fake, repeat, cache):
+    results = {}
+    home = tempfile.mkdtemp(prefix="irail-bench-")
+    try:
+        env = environment(fake, home, cache)
+        # download the station catalogue once, like an installed CLI would have
+        run_command(COMMANDS["vehicle"], env)
+        results["cold_start"] = median([run_command(["--help"], env)[1] for _ in range(repeat)])
+        for name, args in sorted(COMMANDS.items()):
+            timings = [run_command(args, env) for _ in range(repeat)]
+            results[name + ".first_row"] = median([first for first, _ in timings])
+            results[name + ".total"] = median([total for _, total in timings])
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+    return results
+
+
+def load(name):
+    with open(os.path.join(FIXTURES, name + ".json")) as f:
+        return json.load(f)
+
+
+def benchmark_helpers(number):
+    """
+    Seconds per call of the parsing and formatting
+    helpers, on the recorded payloads.
+    """
+    from irail.commands import utils
+    from irail.commands.records import parse_liveboard, parse_connections, parse_vehicle_journey
+    liveboard = load("liveboard_gent_sint_pieters")
+    connections = load("connections_gent_brussel")["connection"]
+    vehicle = load("vehicle_IC1530")
+    epochs = [int(item["time"]) for item in liveboard["departures"]["departure"]] * 50
+    cases = {
+        "timestamp_to_human_readable_time": lambda: utils.timestamp_to_human_readable_time("1462782000"),
+        "format_times": lambda: utils.format_times(epochs),
+        "human_readable_delay": lambda: utils.human_readable_delay(360),
+        "parse_vehicle_type": lambda: utils.parse_vehicle_type("BE.NMBS.IC1530"),
+        "parse_liveboard": lambda: parse_liveboard(liveboard),
+        "parse_connections": lambda: parse_connections(connections),
+        "parse_vehicle_journey": lambda: parse_vehicle_journey(vehicle),
+    }
+    results = {}
+    for name, case in sorted(cases.items()):
+        best = min(timeit.repeat(case, number=number, repeat=5))
+        results["micro." + name] = best / number
+    return results
+
+
+def default_label():
+    try:
+        output = subprocess.check_output(["git", "describe", "--always", "--dirty"],
+                                         cwd=ROOT, stderr=subprocess.STDOUT)
+        return output.decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, baseline, threshold):
+    """
+    Print every measurement next to the baseline and
+    return the names of the ones that regressed.
+    """
+    regressions = []
+    for name in sorted(results):
+        value = results[name]
+        before = baseline.get(name)
+        if not before:
+            print("{:<40} {:>12.6f}".format(name, value))
+            continue
+        ratio = value / before
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print("{:<40} {:>12.6f} {:>12.6f} {:>7.2f}x{}".format(name, value, before, ratio, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the irail CLI")
+    parser.add_argument("--label", default=None,
+                        help="Name of the results file (defaults to git describe)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Runs per command; the median is kept")
+    parser.add_argument("--number", type=int, default=1000,
+                        help="Calls per micro benchmark")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    parser.add_argument("--cache", action="store_true",
+                        help="Keep the response cache on between runs")
+    parser.add_argument("--micro-only", action="store_true")
+    parser.add_argument("--compare", default=None,
+                        help="Label of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Slowdown factor that counts as a regression")
+    args = parser.parse_args()
+
+    results = benchmark_helpers(args.number)
+    if not args.micro_only:
+        with FakeIRail(latency=args.latency, jitter=args.jitter,
+                       chunk_delay=args.chunk_delay, seed=0) as fake:
+            results.update(benchmark_commands(fake, args.repeat, args.cache))
+
+    label = args.label or default_label()
+    if not os.path.isdir(RESULTS):
+        os.makedirs(RESULTS)
+    with open(os.path.join(RESULTS, label + ".json"), "w") as f:
+        json.dump({"label": label, "created": time.time(), "python": sys.version.split()[0],
+                   "settings": {"latency": args.latency, "jitter": args.jitter,
+                                "chunk_delay": args.chunk_delay, "cache": args.cache},
+                   "results": results}, f, indent=2, sort_keys=True)
+
+    baseline = {}
+    if args.compare:
+        with open(os.path.join(RESULTS, args.compare + ".json")) as f:
+            baseline = json.load(f)["results"]
+    if compare(results, baseline, args.threshold):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
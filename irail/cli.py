@@ -2,21 +2,53 @@ import click
 import os
 import sys
 
+try:
+    from shutil import get_terminal_size
+except ImportError:
+    get_terminal_size = click.get_terminal_size
+
 
 CONTEXT_SETTINGS = dict(auto_envvar_prefix='IRAIL')
 
 class Context:
     def __init__(self):
-        self.terminal_width, self.terminal_height = click.get_terminal_size()
+        self.terminal_width, self.terminal_height = get_terminal_size()
 
 
 commands_folder = os.path.join(os.path.dirname(__file__), 'commands')
 pass_context = click.make_pass_decorator(Context, ensure=True)
 
 
+def load_manifest():
+    """
+    Commands and their help texts, as generated
+    at build time by irail/manifest.py. None when
+    the manifest is missing (e.g. in a fresh checkout).
+    """
+    try:
+        from irail.commands._manifest import COMMANDS
+    except ImportError:
+        return None
+    return COMMANDS
+
+
+def short_help(help, limit):
+    """
+    First sentence of a help text,
+    cut off at limit characters.
+    """
+    sentence = " ".join(help.split()).split(". ")[0].rstrip(".")
+    if len(sentence) <= limit:
+        return sentence
+    return sentence[:limit - 3].rsplit(" ", 1)[0] + "..."
+
+
 class ComplexCLI(click.MultiCommand):
     @staticmethod
     def list_commands(ctx):
+        manifest = load_manifest()
+        if manifest is not None:
+            return sorted(manifest)
         rv = []
         for filename in os.listdir(commands_folder):
             if filename.endswith('.py') and \
@@ -25,6 +57,20 @@ class ComplexCLI(click.MultiCommand):
         rv.sort()
         return rv
 
+    def format_commands(self, ctx, formatter):
+        """
+        List the commands from the manifest, so that
+        showing the help doesn't import every command.
+        """
+        manifest = load_manifest()
+        if manifest is None:
+            return click.MultiCommand.format_commands(self, ctx, formatter)
+        limit = formatter.width - 6 - max(len(name) for name in manifest)
+        rows = [(name, short_help(manifest[name], limit))
+                for name in sorted(manifest)]
+        with formatter.section('Commands'):
+            formatter.write_dl(rows)
+
     @staticmethod
     def get_command(ctx, name):
         try:
@@ -38,10 +84,26 @@ class ComplexCLI(click.MultiCommand):
 
 
 @click.command(cls=ComplexCLI, context_settings=CONTEXT_SETTINGS)
+@click.option('--timings', is_flag=True,
+              help="Print how long each phase took when the command ends")
+@click.option('--trace', 'trace_file', type=click.Path(dir_okay=False), default=None,
+              allow_from_autoenv=False,
+              help="Write a Chrome trace of the command to this file")
 @pass_context
-def cli(context):
+def cli(context, timings, trace_file):
     """
     IRail command line interface
     """
-    pass
+    from irail.commands.trace import tracer, trace_settings
+    enabled, trace_file = trace_settings(timings, trace_file)
+    if not enabled:
+        return
+    tracer.enable()
+
+    def report():
+        click.echo(tracer.format_summary(), err=True)
+        if trace_file:
+            tracer.export(trace_file)
+
+    click.get_current_context().call_on_close(report)
 
@@ -0,0 +1,12 @@
+# Generated by irail/manifest.py, do not edit.
+COMMANDS = {
+    'batch': 'Run many queries at once and print one JSON result per line.\nQueries are read as JSON lines from a file or stdin:',
+    'liveboard': 'Show the upcoming trains for a certain trainstation.\nVery similar to what you would see on the screen\nin the station.\nExample:\nirail liveboard Gent-Sint-Pieters',
+    'network': 'Show the delays across the whole network right now.\nThe liveboards of all stations are fetched and\nsummed up per station and per line (train type\nand destination); a train seen at several\nstations counts once for its line.',
+    'prefetch': 'Prefetch your favourite liveboards and routes.\nFavourites are read from favourites.json in the\nirail data directory, with the times you usually\nneed them (see the README):',
+    'route': 'Find connections between two stations.\nExample:\nirail route Gent-Sint-Pieters Brussel-Zuid',
+    'serve': 'Keep irail warm in the background for faster commands.\nWhile it runs, liveboard, route and vehicle are\nhanded to this process, which keeps the station\ncatalogue, the response cache and the connections\nto the API around between commands:',
+    'stats': 'Show punctuality and delays from the recorded history.\nLiveboards and vehicles you look up are only\nrecorded when IRAIL_RECORD=1 is set, e.g. for a\nboard that keeps running:',
+    'timetable': 'Build the local timetable used by route --local.\nWithout options, show what is in it.',
+    'vehicle': 'Show the stops of a vehicle.\nExample:\nirail vehicle IC1530',
+}
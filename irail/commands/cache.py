@@ -0,0 +1,225 @@
+import json
+import os
+import threading
+import time
+from irail.commands.paths import data_path
+
+
+CACHE_FILE = "responses.sqlite"
+MAX_SIZE = 20 * 1024 * 1024
+
+# Seconds a response stays fresh, per feature.
+TTLS = {"liveboard": 30,
+        "vehicle": 30,
+        "connections": 60,
+        "station": 3 * 24 * 3600}
+DEFAULT_TTL = 30
+
+# How stale accessed_at may get before a read updates it. Eviction
+# doesn't need it any more precise, and every update is a write that
+# takes the database lock all irail processes share.
+ACCESS_INTERVAL = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    feature TEXT NOT NULL,
+    body TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    expires_at REAL,
+    etag TEXT,
+    last_modified TEXT,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    prefetched_at REAL
+)
+"""
+
+
+def make_key(feature, params):
+    """
+    Build a cache key from the feature and its
+    parameters. Parameters that are not set are
+    dropped and the rest is sorted, so the order in
+    which they were passed doesn't matter. Values
+    are formatted as text, so station names that
+    aren't ASCII work on Python 2 as well.
+    """
+    items = sorted((u"%s" % k, u"%s" % v) for k, v in params.items() if v is not None)
+    return feature + u"?" + u"&".join(k + u"=" + v for k, v in items)
+
+
+def ttl_for(feature, data, now=None):
+    """
+    Return how long a response stays fresh, or None
+    if it never expires. Connections that have all
+    arrived already are history and cannot change.
+    """
+    if feature == "connections":
+        now = now or time.time()
+        try:
+            arrivals = [int(c["arrival"]["time"]) for c in data["connection"]]
+        except (KeyError, TypeError, ValueError):
+            arrivals = []
+        if arrivals and max(arrivals) < now:
+            return None
+    return TTLS.get(feature, DEFAULT_TTL)
+
+
+class CacheEntry(object):
+    __slots__ = ("data", "stored_at", "expires_at", "etag", "last_modified")
+
+    def __init__(self, data, stored_at, expires_at, etag, last_modified):
+        self.data = data
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def is_fresh(self, now=None, max_age=None):
+        now = now or time.time()
+        if max_age is not None and now - self.stored_at > max_age:
+            return False
+        return self.expires_at is None or self.expires_at > now
+
+    def validators(self):
+        """
+        Headers for a conditional request
+        revalidating this entry.
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache(object):
+    """
+    Persistent cache of decoded API responses,
+    stored in SQLite so that it is shared between
+    invocations. Entries expire after a per-feature
+    TTL and the least recently used ones are evicted
+    when the total size goes over max_size.
+    """
+
+    def __init__(self, path, max_size=MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        import sqlite3
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._db.execute(SCHEMA)
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(responses)")]
+        if "prefetched_at" not in columns:
+            # Caches from before irail prefetch.
+            self._db.execute("ALTER TABLE responses ADD COLUMN prefetched_at REAL")
+        self._db.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, stored_at, expires_at, etag, last_modified, accessed_at "
+                "FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            now = time.time()
+            if now - row[5] > ACCESS_INTERVAL:
+                self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?",
+                                 (now, key))
+                self._db.commit()
+        body, stored_at, expires_at, etag, last_modified, _ = row
+        entry = CacheEntry(json.loads(body), stored_at, expires_at, etag, last_modified)
+        if entry.is_fresh():
+            self.hits += 1
+        else:
+            self.misses += 1
+        return entry
+
+    def store(self, key, feature, data, headers=None, ttl=None, prefetched=False):
+        """
+        Store a response; prefetched ones (by irail
+        prefetch) remember when, see prefetched_at.
+        """
+        headers = headers or {}
+        now = time.time()
+        if ttl is None:
+            ttl = ttl_for(feature, data, now)
+        expires_at = None if ttl is None else now + ttl
+        body = json.dumps(data, separators=(",", ":"))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, feature, body, now, expires_at, headers.get("ETag"),
+                 headers.get("Last-Modified"), now, len(body), now if prefetched else None))
+            self._evict()
+            self._db.commit()
+
+    def refresh(self, key, feature, entry):
+        """
+        Mark an entry as fresh again after
+        the server answered 304 Not Modified.
+        Confirmed just now, it no longer counts
+        as prefetched.
+        """
+        self.store(key, feature, entry.data,
+                   {"ETag": entry.etag, "Last-Modified": entry.last_modified})
+
+    def prefetched_at(self, key):
+        """
+        When irail prefetch stored the response
+        for a key, or None when it didn't.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT prefetched_at FROM responses WHERE key = ?",
+                                   (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_size:
+            return
+        rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed_at")
+        victims = []
+        for key, size in rows:
+            if total <= self.max_size:
+                break
+            victims.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", victims)
+
+    def responses(self, feature):
+        """
+        Yield every stored response for a feature,
+        fresh or not.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT body FROM responses WHERE feature = ?",
+                                    (feature,)).fetchall()
+        for (body,) in rows:
+            yield json.loads(body)
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+
+_cache = None
+
+
+def get_cache():
+    """
+    Return the shared response cache, or None
+    when it is disabled with IRAIL_CACHE=0.
+    """
+    global _cache
+    if os.environ.get("IRAIL_CACHE", "1") == "0":
+        return None
+    if _cache is None:
+        _cache = ResponseCache(data_path(CACHE_FILE))
+    return _cache
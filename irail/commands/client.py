@@ -0,0 +1,478 @@
+import codecs
+import os
+import random
+import socket
+import threading
+import time
+from collections import Counter
+from irail.commands.cache import get_cache, make_key
+from irail.commands.history import record_response
+from irail.commands.latency import LatencyTracker
+from irail.commands.ratelimit import get_limiter, parse_retry_after, MAX_BACKOFF
+from irail.commands.singleflight import SingleFlight
+from irail.commands.trace import tracer
+
+
+API_URL = "http://api.irail.be/{}/"
+STATIONS_URL = "https://irail.be/stations/NMBS"
+
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 15
+POOL_SIZE = 10
+CHUNK_SIZE = 4096
+
+# Responses telling us to slow down, and how often
+# we try again before giving up.
+THROTTLE_STATUSES = (429, 503)
+THROTTLE_RETRIES = 3
+THROTTLE_BACKOFF = 1.0
+
+# Requests that failed on the way (a dropped connection, a
+# timeout, a garbled body) are sent again this many times, after
+# a random wait of up to RETRY_BACKOFF * 2 ** attempt seconds.
+RETRIES = 2
+RETRY_BACKOFF = 0.25
+MAX_RETRY_BACKOFF = 4.0
+
+class APIError(Exception):
+    """
+    Base class for everything that can go wrong
+    while talking to the iRail API. The message
+    is meant to be shown to the user as is.
+    """
+
+
+class OfflineError(APIError):
+    pass
+
+
+class APIUnavailableError(APIError):
+    pass
+
+
+class APIConnectionError(APIUnavailableError):
+    pass
+
+
+class APITimeoutError(APIUnavailableError):
+    pass
+
+
+class APIResponseError(APIError):
+    pass
+
+
+class MalformedResponseError(APIResponseError):
+    pass
+
+
+class APIServerError(APIResponseError):
+    pass
+
+
+# Failures that may well go away when we simply ask again.
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, MalformedResponseError, APIServerError)
+
+
+def is_name_resolution_error(exc):
+    """
+    Walk the chain of wrapped exceptions
+    (requests -> urllib3 -> socket) and check
+    whether the hostname could not be resolved.
+    A failed DNS lookup means we never left the
+    machine, so there is no need to probe an
+    outside host to tell the two cases apart.
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, socket.gaierror):
+            return True
+        if "NameResolution" in type(exc).__name__:
+            return True
+        nested = getattr(exc, "reason", None)
+        if nested is None and exc.args and isinstance(exc.args[0], BaseException):
+            nested = exc.args[0]
+        exc = nested or getattr(exc, "__context__", None)
+    return False
+
+
+class APIClient(object):
+    """
+    Thin wrapper around a requests session, shared by
+    every command. Connections to api.irail.be and
+    irail.be are kept alive and pooled per host, so
+    repeated calls skip the TCP/TLS handshake.
+
+    Requests go through the rate limiter when one is
+    given, and identical requests that are in flight
+    at the same time are sent only once.
+
+    Failed requests are retried with jittered
+    exponential backoff. With hedge, a request that
+    takes longer than most recent ones (the 95th
+    percentile) is sent a second time, and the first
+    answer wins. How often both happen is kept in
+    counts (and reported by --timings).
+
+    recorder, when given, is called with the feature
+    and data of every response that came from the
+    network (not from the cache), e.g. to keep the
+    delay history.
+    """
+
+    def __init__(self, api_url=API_URL, stations_url=STATIONS_URL,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 pool_size=POOL_SIZE, cache=None, limiter=None,
+                 retries=RETRIES, retry_backoff=RETRY_BACKOFF, hedge=False, recorder=None):
+        self.api_url = api_url
+        self.cache = cache
+        self.recorder = recorder
+        self.limiter = limiter
+        self.flights = SingleFlight()
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.sleep = time.sleep
+        self.hedge = hedge
+        self.latencies = LatencyTracker()
+        self.counts = Counter()
+        self._counts_lock = threading.Lock()
+        self._executor = None
+        self.pool_size = pool_size
+        self.stations_url = stations_url
+        self.timeout = (connect_timeout, read_timeout)
+
+        # requests is slow to import, only load it once we talk to the API
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept": "application/json",
+                                     "Accept-Encoding": "gzip, deflate",
+                                     "User-Agent": "irail-cli"})
+
+    def url_for(self, feature):
+        if feature == "station":
+            return self.stations_url
+        return self.api_url.format(feature)
+
+    def count(self, name, feature):
+        with self._counts_lock:
+            self.counts[name] += 1
+        tracer.count(name + "." + feature)
+
+    def retry_delay(self, attempt):
+        return random.uniform(0, min(self.retry_backoff * 2 ** attempt, MAX_RETRY_BACKOFF))
+
+    def _retrying(self, feature, function, *args):
+        """
+        Call function(*args), and again after a
+        backoff when it fails in a way worth retrying.
+        Every request we send is a GET, so sending
+        it twice does no harm.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return function(*args)
+            except RETRYABLE_ERRORS:
+                if attempt == self.retries:
+                    raise
+            self.count("retries", feature)
+            self.sleep(self.retry_delay(attempt))
+
+    def get(self, feature, params, headers=None, stream=False):
+        """
+        Perform a GET request for a feature and
+        return the raw response. Network failures
+        are translated into APIError subclasses.
+
+        When the API answers 429 or 503 we back off
+        for as long as its Retry-After header asks (or
+        exponentially when it doesn't say) and try
+        again; with a shared limiter, the other irail
+        processes hold back as well.
+        """
+        for attempt in range(THROTTLE_RETRIES + 1):
+            r = self._send(feature, params, headers, stream)
+            if r.status_code not in THROTTLE_STATUSES:
+                return r
+            r.close()
+            tracer.count("throttled." + feature)
+            delay = parse_retry_after(r.headers.get("Retry-After"))
+            if delay is None:
+                delay = THROTTLE_BACKOFF * 2 ** attempt
+            if attempt == THROTTLE_RETRIES or delay > MAX_BACKOFF:
+                break
+            if self.limiter is not None:
+                self.limiter.pause(delay)
+            else:
+                time.sleep(delay)
+        raise APIUnavailableError("The iRail API is too busy right now, try again in {} seconds."
+                                  .format(int(delay) or 1))
+
+    def _send(self, feature, params, headers, stream):
+        # The wait for the rate limiter counts neither for
+        # the hedge threshold nor for the latencies.
+        self._acquire()
+        threshold = self.latencies.threshold(feature) if self.hedge else None
+        if threshold is None:
+            return self._timed_send(feature, params, headers, stream)
+        return self._hedged_send(feature, params, headers, stream, threshold)
+
+    def _acquire(self):
+        if self.limiter is not None:
+            with tracer.span("rate limit", "http"):
+                self.limiter.acquire()
+
+    def _timed_send(self, feature, params, headers, stream):
+        started = time.time()
+        r = self._send_once(feature, params, headers, stream)
+        self.latencies.add(feature, time.time() - started)
+        return r
+
+    def _limited_send(self, feature, params, headers, stream):
+        self._acquire()
+        return self._timed_send(feature, params, headers, stream)
+
+    def _hedged_send(self, feature, params, headers, stream, threshold):
+        """
+        Send the request, and once more if there is no
+        answer after threshold seconds. The first answer
+        is returned and the other one closed; only when
+        both fail is the error raised.
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size)
+        first = self._executor.submit(self._timed_send, feature, params, headers, stream)
+        done, _ = wait([first], timeout=threshold)
+        if done:
+            return first.result()
+        self.count("hedged", feature)
+        second = self._executor.submit(self._limited_send, feature, params, headers, stream)
+        pending, error = [first, second], None
+        while pending:
+            done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+            pending = list(not_done)
+            for future in done:
+                try:
+                    r = future.result()
+                except APIError as e:
+                    error = e
+                    continue
+                if future is second:
+                    self.count("hedge_won", feature)
+                for other in pending + [f for f in done if f is not future]:
+                    other.add_done_callback(_close_response)
+                return r
+        raise error
+
+    def _send_once(self, feature, params, headers, stream):
+        import requests
+        tracer.count("requests." + feature)
+        try:
+            with tracer.span("http " + feature, "http") as span:
+                r = self.session.get(self.url_for(feature), params=params,
+                                     headers=headers, timeout=self.timeout, stream=stream)
+            if tracer.enabled:
+                # requests doesn't split DNS, connect and TLS; elapsed runs up to the headers
+                span.set(status=r.status_code, headers_ms=r.elapsed.total_seconds() * 1000,
+                         bytes=r.headers.get("Content-Length"))
+            return r
+        except requests.exceptions.ConnectionError as e:
+            if is_name_resolution_error(e):
+                raise OfflineError("Your internet connection doesn't seem to be working.")
+            raise APIConnectionError("The iRail API doesn't seem to be working.")
+        except requests.exceptions.Timeout:
+            raise APITimeoutError("The iRail API took too long to respond.")
+
+    def _decode(self, r, feature=None):
+        try:
+            with tracer.span("decode " + (feature or "response"), "decode"):
+                json_data = r.json()
+        except ValueError:
+            raise MalformedResponseError("The api doesn't seem to be working properly.")
+        if "error" in json_data:
+            error = APIServerError if r.status_code >= 500 else APIResponseError
+            raise error("The api works, but sent a {} error code: {}"
+                        .format(json_data["error"], json_data["message"]))
+        return json_data
+
+    def get_json(self, feature, params, headers=None, max_age=None):
+        """
+        Return the decoded response for a feature.
+        Fresh cached responses are returned without
+        touching the network; stale ones are revalidated
+        with a conditional request when the server gave
+        us an ETag or Last-Modified header. With max_age,
+        cached responses older than that many seconds
+        count as stale, however long they were kept.
+
+        Threads asking for the same response at the same
+        time share a single request and the decoded result,
+        which must therefore be treated as read-only.
+        """
+        flight = make_key(feature, params)
+        if headers:
+            flight += "#" + make_key("", headers)
+        if max_age is not None:
+            flight += "#{}".format(max_age)
+        json_data, shared = self.flights.do(flight, self._get_json, feature, params, headers, max_age)
+        if shared:
+            tracer.count("coalesced." + feature)
+        return json_data
+
+    def _fetch(self, feature, params, headers):
+        """
+        The response and its decoded body (None
+        when it is a 304 Not Modified).
+        """
+        r = self.get(feature, params, headers=headers)
+        if r.status_code == 304:
+            return r, None
+        return r, self._decode(r, feature)
+
+    def _get_json(self, feature, params, headers, max_age=None):
+        if self.cache is None:
+            json_data = self._retrying(feature, self._fetch, feature, params, headers)[1]
+            self._record(feature, json_data)
+            return json_data
+
+        key = make_key(feature, params)
+        with tracer.span("cache lookup", "cache"):
+            entry = self.cache.get(key)
+        if entry is not None and entry.is_fresh(max_age=max_age):
+            tracer.count("cache.hit")
+            return entry.data
+        tracer.count("cache.miss" if entry is None else "cache.stale")
+
+        request_headers = dict(headers or {})
+        if entry is not None:
+            request_headers.update(entry.validators())
+        r, json_data = self._retrying(feature, self._fetch, feature, params, request_headers)
+        if r.status_code == 304 and entry is not None:
+            tracer.count("cache.revalidated")
+            self.cache.refresh(key, feature, entry)
+            return entry.data
+        self.cache.store(key, feature, json_data, r.headers)
+        self._record(feature, json_data)
+        return json_data
+
+    def prefetch(self, feature, params, ttl):
+        """
+        Ask the server for a response, whatever the
+        cache holds, and keep it in the cache for ttl
+        seconds, marked as prefetched (see prefetched_at).
+        """
+        r, json_data = self._retrying(feature, self._fetch, feature, params, None)
+        self._record(feature, json_data)
+        if self.cache is not None:
+            self.cache.store(make_key(feature, params), feature, json_data, r.headers,
+                             ttl=ttl, prefetched=True)
+        return json_data
+
+    def prefetched_at(self, feature, params):
+        """
+        When irail prefetch put the cached response
+        for a feature in the cache, or None when it
+        didn't (or there is no cache).
+        """
+        if self.cache is None:
+            return None
+        return self.cache.prefetched_at(make_key(feature, params))
+
+    def _record(self, feature, json_data):
+        if self.recorder is not None and json_data is not None:
+            self.recorder(feature, json_data)
+
+    def iter_text(self, feature, params):
+        """
+        Yield the body of the response as text chunks,
+        as they come in. Streamed responses bypass the
+        cache, since they are never held in memory as
+        a whole.
+        """
+        import requests
+        from urllib3.exceptions import HTTPError, ReadTimeoutError
+        r = self._retrying(feature, self.get, feature, params, None, True)
+        decoder = codecs.getincrementaldecoder(r.encoding or "utf-8")()
+        try:
+            for chunk in _iter_content(r):
+                yield decoder.decode(chunk)
+            yield decoder.decode(b"", final=True)
+        except (requests.exceptions.Timeout, ReadTimeoutError):
+            # The headers are in, so the body stalled halfway.
+            raise APITimeoutError("The iRail API stopped sending its response.")
+        except (requests.exceptions.RequestException, HTTPError):
+            # A stalled read comes out of iter_content as a ConnectionError.
+            raise APIConnectionError("The iRail API stopped sending its response.")
+        finally:
+            r.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+def _iter_content(r):
+    """
+    The body of a streamed response, in chunks of
+    whatever has come in. iter_content waits for a
+    whole CHUNK_SIZE, which on a slow link is most
+    of a response; urllib3 before 2.0 can't do better.
+    """
+    read1 = getattr(r.raw, "read1", None)
+    if read1 is None:
+        for chunk in r.iter_content(CHUNK_SIZE):
+            yield chunk
+        return
+    while True:
+        chunk = read1(CHUNK_SIZE, decode_content=True)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _close_response(future):
+    """
+    Close the response of a hedged request
+    that lost the race, once it comes in.
+    """
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def retries_setting():
+    try:
+        return max(int(os.environ.get("IRAIL_RETRIES", RETRIES)), 0)
+    except ValueError:
+        return RETRIES
+
+
+def get_client():
+    """
+    Return the process-wide client,
+    creating it on first use. The base URLs
+    can be pointed elsewhere (e.g. at a local
+    stand-in server) with IRAIL_API_URL and
+    IRAIL_STATIONS_URL. IRAIL_RETRIES sets how often
+    failed requests are retried, IRAIL_HEDGE=1 turns
+    on hedged requests.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = APIClient(api_url=os.environ.get("IRAIL_API_URL", API_URL),
+                                stations_url=os.environ.get("IRAIL_STATIONS_URL", STATIONS_URL),
+                                cache=get_cache(), limiter=get_limiter(),
+                                retries=retries_setting(),
+                                hedge=os.environ.get("IRAIL_HEDGE", "0") not in ("0", ""),
+                                recorder=record_response)
+    return _client
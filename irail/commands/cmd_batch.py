@@ -0,0 +1,114 @@
+import click
+import json
+from irail.cli import pass_context
+from irail.commands.utils import *
+
+
+class QueryError(Exception):
+    pass
+
+
+def run_query(query, resolver):
+    """
+    Run one query from the batch and return the
+    raw API response.
+    """
+    try:
+        kind = query["type"]
+        if kind == "liveboard":
+            return liveboard_request(resolver.resolve(query["station"]), request=api_fetch)
+        elif kind == "route":
+            return route_request(resolver.resolve(query["from"]), resolver.resolve(query["to"]),
+                                 query.get("date"), query.get("time"),
+                                 query.get("selection", "depart"), request=api_fetch)
+        elif kind == "vehicle":
+            return vehicle_request(query["id"], request=api_fetch)
+    except KeyError as e:
+        raise QueryError("Missing field {} in query".format(e))
+    except NoConnectionsFound:
+        raise QueryError("No connections found")
+    raise QueryError("Unknown query type {}".format(kind))
+
+
+def read_queries(lines):
+    for index, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            query = json.loads(line)
+        except ValueError:
+            query = None
+        yield index, query
+
+
+def execute(index, query, resolver):
+    record = {"index": index, "query": query}
+    if not isinstance(query, dict):
+        record["error"] = "Query is not a JSON object"
+        return record
+    try:
+        record["result"] = run_query(query, resolver)
+    except (APIError, QueryError, NoStationFound) as e:
+        record["error"] = str(e)
+    return record
+
+
+def run_batch(queries, workers, ordered):
+    """
+    Run the queries on a pool of workers and yield
+    their records, in input order or as they finish.
+    At most twice as many queries as there are workers
+    are in flight, so the input can be arbitrarily long.
+    """
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    def collect():
+        if ordered:
+            return [pending.popleft().result()]
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.remove(future)
+        return [future.result() for future in done]
+
+    resolver = StationResolver()
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for index, query in queries:
+            pending.append(executor.submit(execute, index, query, resolver))
+            while len(pending) >= 2 * workers:
+                for record in collect():
+                    yield record
+        while pending:
+            for record in collect():
+                yield record
+
+
+@click.command()
+@click.argument('queries', type=click.File('r'), default='-')
+@click.option('--workers', '-w', default=8, show_default=True,
+              help="Number of queries to run at the same time")
+@click.option('--ordered', '-o', is_flag=True,
+              help="Output results in input order instead of as soon as they are done")
+@pass_context
+def cli(context, queries, workers, ordered):
+    """
+    Run many queries at once and print one JSON result per line.
+    Queries are read as JSON lines from a file or stdin:
+
+    \b
+    {"type": "liveboard", "station": "Gent-Sint-Pieters"}
+    {"type": "route", "from": "Gent", "to": "Brussel-Zuid", "time": "0830"}
+    {"type": "vehicle", "id": "IC1530"}
+
+    Stations are resolved to their best match
+    without asking. Every output line holds the index
+    and query, and either the API "result" or an "error".
+    """
+    failed = False
+    for record in run_batch(read_queries(queries), max(workers, 1), ordered):
+        failed = failed or "error" in record
+        click.echo(json.dumps(record, separators=(",", ":")))
+    if failed:
+        raise SystemExit(1)
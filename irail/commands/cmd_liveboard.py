@@ -1,45 +1,219 @@
 import click
-import requests
 from time import sleep
 from irail.cli import pass_context
 from irail.commands.utils import *
+from irail.commands.cache import TTLS
+from irail.commands.favourites import human_readable_age, prefetched_age
+from irail.commands.polling import AdaptivePoller
+from irail.commands.records import parse_liveboard, parse_liveboard_departure
+from irail.commands.output import FORMATS, RowWriter, DEPARTURE_FIELDS, departure_row
+from irail.commands.render import layout, style
+from irail.commands.screen import Screen
+from irail.commands.trace import tracer
 
 
-def get_direction_from_connection(connection):
-    return connection["stationinfo"]["name"]
-
-
-def get_platform_from_connection(connection):
-    return connection["platforminfo"]["name"], not(bool(connection["platforminfo"]["normal"]))
-
-
-def make_station_header(json_object, destination_filter, context):
+def make_station_header(board, destination_filter, context, age=None):
     """
     Make a header much like an actual
     liveboard in a train station.
     """
-    name = json_object["stationinfo"]["standardname"]
-    station_time = timestamp_to_human_readable_time(json_object["timestamp"])
+    return make_header(board.station, board.timestamp, destination_filter, context, age)
+
+
+def make_header(name, timestamp, destination_filter, context, age=None):
+    station_time = format_time(timestamp)
     direction = destination_filter or "all"
     title = name + " (direction: " + direction + ")"
-    click.secho(station_time + " " +
-                title.center(context.terminal_width - 6),
-                reverse=True)
-    return name
+    if age is not None:
+        title += ", " + human_readable_age(age)
+    return style(station_time + " " +
+                 title.center(context.terminal_width - 6),
+                 reverse=True)
+
+
+def filter_trains(trains, destination, train_type, show_vehicle):
+    """
+    Drop the trains that don't match the
+    destination or train type filters.
+    """
+    destination = [d.lower() for d in destination]
+    for train in trains:
+        if train_type and not any(train.vehicle_type.startswith(tt) for tt in train_type):
+            continue
+        if destination and not any(train.direction.lower().startswith(d) for d in destination):
+            continue
+        yield train
+
+
+# Time, delay, train type and the rest: direction and platform.
+TRAIN_COLUMNS = (5, 3, 7, None)
+
+
+def format_train(context, train, show_vehicle, station_name=None):
+    columns = layout(context.terminal_width, TRAIN_COLUMNS)
+    type_of_train = human_readable_vehicle(train, include_number=show_vehicle)
+    normal_departure_time = format_time(train.time)
+    delay = "   " if train.cancelled else human_readable_delay(train.delay)
+    platform = train.platform.name
+    direction = train.direction
+    if station_name:
+        direction = station_name + " > " + direction
+
+    message = (normal_departure_time +
+               " " + delay + " " + type_of_train.rjust(columns.widths[2]) + " " + direction +
+               " " * (columns.widths[3] - len(platform) - len(direction)))
+
+    if train.cancelled:
+        message += platform
+        message = style(u'\u0336'.join(message), fg="red", blink=True)
+    else:
+        message += style(platform, reverse=train.platform.changed)
+
+    return message
+
+
+def board_lines(context, board, destination, train_type, show_vehicle, max_rows, age=None):
+    """
+    Lines showing the departures of one station.
+    Returns the lines and the trains on them.
+    """
+    lines = [make_station_header(board, ','.join(destination), context, age)]
+    if not board.departures:
+        return lines + ["No trains!"], []
+    shown = []
+    for train in filter_trains(board.departures, destination, train_type, show_vehicle):
+        if len(shown) >= max_rows:
+            break
+        lines.append(format_train(context, train, show_vehicle))
+        shown.append(train)
+    return lines, shown
+
+
+def merged_board_lines(context, boards, destination, train_type, show_vehicle, max_rows, age=None):
+    """
+    Lines showing the departures of several
+    stations as one board, sorted by departure time.
+    Returns the lines and the trains on them.
+    """
+    names = [board.station for board in boards]
+    timestamp = max(board.timestamp for board in boards)
+    lines = [make_header(", ".join(names), timestamp, ','.join(destination), context, age)]
+    departures = []
+    for board in boards:
+        departures.extend(filter_trains(board.departures, destination, train_type, show_vehicle))
+    departures.sort(key=lambda train: train.time)
+    shown = departures[:max_rows]
+    for train in shown:
+        lines.append(format_train(context, train, show_vehicle, station_name=train.station))
+    return lines, shown
+
+
+def show_streamed_board(context, station, destination, train_type, show_vehicle, max_rows):
+    """
+    Show the departures of one station one by one,
+    as they are decoded from the response.
+    """
+    stream = stream_request("liveboard", ("departures", "departure"), station=station)
+    header = read_stream_header(stream)
+    station_name = header["stationinfo"]["standardname"]
+    click.echo(make_header(station_name, int(header["timestamp"]), ','.join(destination), context))
+    trains = (parse_liveboard_departure(item, station_name) for item in stream_items(stream))
+    count = 0
+    for train in filter_trains(trains, destination, train_type, show_vehicle):
+        if count >= max_rows:
+            break
+        click.echo(format_train(context, train, show_vehicle))
+        count += 1
+    if count == 0:
+        click.echo("No trains!")
+
+
+def departure_state(train):
+    """
+    The part of a departure that is worth
+    refreshing the board for.
+    """
+    return (train.vehicle, train.time, train.delay, train.platform.name, train.cancelled)
+
+
+def next_departure(trains):
+    """
+    Epoch of the first actual departure
+    (scheduled time plus delay) on the board.
+    """
+    return min(train.actual_time for train in trains) if trains else None
+
+
+def refreshing_request(feature, **input_params):
+    """
+    api_request for the refreshes of a continuous
+    board: data kept by irail prefetch is only good
+    enough for the first one.
+    """
+    return api_request(feature, max_age=TTLS[feature], **input_params)
+
+
+def fetch_boards(stations, refresh=False):
+    """
+    The boards of all stations, and how long ago
+    each of them was prefetched (None when it wasn't).
+    """
+    fetch = liveboard_request
+    if refresh:
+        fetch = lambda station: liveboard_request(station, request=refreshing_request)
+    with tracer.span("liveboards"):
+        responses = run_concurrently(fetch, stations)
+    with tracer.span("parse"):
+        return ([parse_liveboard(board) for board in responses],
+                [prefetched_age([api_prefetched_at("liveboard", station=station)])
+                 for station in stations])
+
+
+def write_departures(stations, destination, train_type, merge, stream, format):
+    """
+    Write the departures of all stations as
+    machine-readable rows, without a row limit.
+    A single station can be streamed row by row.
+    """
+    streamed = stream and len(stations) == 1
+    writer = RowWriter(format, DEPARTURE_FIELDS, flush_each_row=streamed)
+    if streamed:
+        items = stream_request("liveboard", ("departures", "departure"), station=stations[0])
+        station_name = read_stream_header(items)["stationinfo"]["standardname"]
+        trains = (parse_liveboard_departure(item, station_name) for item in stream_items(items))
+        writer.write_all(departure_row(train)
+                         for train in filter_trains(trains, destination, train_type, False))
+        writer.close()
+        return
+    boards, _ = fetch_boards(stations)
+    trains = []
+    for board in boards:
+        trains.extend(filter_trains(board.departures, destination, train_type, False))
+    if merge:
+        trains.sort(key=lambda train: train.time)
+    with tracer.span("render"):
+        writer.write_all(departure_row(train) for train in trains)
+        writer.close()
 
 
 @click.command('liveboard')
-@click.argument('station')
+@click.argument('stations', nargs=-1, required=True)
 @click.option('--destination', '-d', default=None, multiple=True,
               help='Non-comprehensive but efficient filter that only checks the destination of each vehicle')
 @click.option('--train-type', '-t', default=None, multiple=True,
               help='Filter on train type (e.g. IC, L, S)')
 @click.option('--show-vehicle', '-v', is_flag=True,
               help="Show vehicle ids")
+@click.option('--merge', '-m', is_flag=True,
+              help="Merge the departures of all stations into one board")
 @click.option('--continuous', '-c', is_flag=True,
-              help='Refresh liveboard every 60 seconds',)
+              help='Keep the liveboard up to date',)
+@click.option('--stream', is_flag=True,
+              help="Show departures while the response is still coming in (single station only)")
+@click.option('--format', '-f', 'format', type=click.Choice(FORMATS), default='text',
+              help="Output format; json, ndjson and csv are unstyled and not limited to the screen")
 @pass_context
-def cli(context, station, destination, train_type, show_vehicle, continuous):
+def cli(context, stations, destination, train_type, show_vehicle, merge, continuous, stream, format):
     """
     Show the upcoming trains for a certain trainstation.
     Very similar to what you would see on the screen
@@ -47,8 +221,9 @@ def cli(context, station, destination, train_type, show_vehicle, continuous):
     Example:
     irail liveboard Gent-Sint-Pieters
 
-    You can choose to refresh the livebaord
-    every 60 seconds with the -c flag.
+    You can choose to keep the liveboard up to date
+    with the -c flag. It is refreshed more often
+    close to a departure or after a change.
     Example:
     irail liveboard Gent-Sint-Pieters -c
 
@@ -64,51 +239,60 @@ def cli(context, station, destination, train_type, show_vehicle, continuous):
     Example (all trains going to the beach):
     irail liveboard Gent-Sint-Pieters -d Oostende -d Blankenberge -d Knokke -d "De Panne"
     (note the "" for arguments with spaces in them)
+
+    You can show several stations at once, each with
+    its own section, or merged into one board with -m.
+    Example:
+    irail liveboard Gent-Sint-Pieters Gent-Dampoort -m
+
+    For scripts, the departures can be written as
+    json, ndjson or csv instead.
+    Example:
+    irail liveboard Gent-Sint-Pieters -f csv
     """
+    if format != 'text' and continuous:
+        raise click.UsageError("--continuous only works with the text format")
     # if station not found, give suggestions
-    station = get_station_from_user_input(station)
+    with tracer.span("resolve stations"):
+        stations = get_stations_from_user_input(stations)
+    if format != 'text':
+        write_departures(stations, destination, train_type, merge, stream, format)
+        return
     click.clear()
+    if stream and len(stations) == 1 and not continuous:
+        show_streamed_board(context, stations[0], destination, train_type, show_vehicle,
+                            context.terminal_height - 2)
+        return
+    screen = Screen()
+    poller = AdaptivePoller()
+    previous_state = None
+    refresh = False
     while True:
-        r = requests.get("http://api.irail.be/liveboard/",
-                         params={"fast": "true",
-                                 "format": "json",
-                                 "station": station}).json()
-        station_name = make_station_header(r, ','.join(destination), context)
-
-        trains = safe_trains_extract(r)
-
-        count = 0
-        for train in trains:
-            type_of_train = get_human_readable_vehicle_from_connection(train, include_number=show_vehicle)
-            if train_type and not any(type_of_train.startswith(tt) for tt in train_type):
-                continue
-            normal_departure_time = get_time_from_connection(train)
-            cancelled, delay = get_human_readable_delay_from_connection(train)
-            platform, platform_changed = get_platform_from_connection(train)
-            direction = get_direction_from_connection(train)
-
-            if destination and not any(direction.lower().startswith(d.lower()) for d in destination):
-                continue
-
-            message = (normal_departure_time +
-                       " " + delay + " " + type_of_train.rjust(7) + " " + direction +
-                       " " * (context.terminal_width - len(platform) - len(direction) - 18))
-
-            if cancelled:
-                message += platform
-                message = click.style(u'\u0336'.join(message), fg="red", blink=True)
-            else:
-                message += click.style(platform, reverse=(True if platform_changed else False))
-
-            click.echo(message)
-            count += 1
-            if count >= context.terminal_height - 2:
-                break
+        boards, ages = fetch_boards(stations, refresh)
+        refresh = True
+
+        available_rows = context.terminal_height - 2
+        if merge:
+            known_ages = [age for age in ages if age is not None]
+            lines, trains = merged_board_lines(context, boards, destination, train_type,
+                                               show_vehicle, available_rows,
+                                               max(known_ages) if known_ages else None)
+        else:
+            rows_per_board = max(available_rows // len(boards) - 1, 1)
+            lines, trains = [], []
+            for board, age in zip(boards, ages):
+                board_rows, board_trains = board_lines(context, board, destination, train_type,
+                                                       show_vehicle, rows_per_board, age)
+                lines.extend(board_rows)
+                trains.extend(board_trains)
+
+        with tracer.span("render"):
+            screen.update(lines)
 
         if not continuous:
             break
 
-        sleep(60)
-        CURSOR_UP_ONE = '\x1b[1A'
-        ERASE_LINE = '\x1b[2K'
-        click.echo((CURSOR_UP_ONE + ERASE_LINE) * (len(trains) + 2))
+        state = [departure_state(train) for train in trains]
+        now = max(board.timestamp for board in boards)
+        sleep(poller.next_interval(state != previous_state, now, next_departure(trains)))
+        previous_state = state
@@ -0,0 +1,94 @@
+import click
+import sys
+from irail.cli import pass_context
+from irail.commands.utils import *
+from irail.commands.network import NETWORK_FIELDS, NetworkSummary, sweep
+from irail.commands.output import FORMATS, RowWriter
+from irail.commands.records import parse_liveboard
+from irail.commands.render import Frame, format_minutes, layout
+
+
+# Name, trains, late, cancelled, average and maximum delay.
+NETWORK_COLUMNS = (None, 7, 6, 9, 7, 6)
+
+
+def network_lines(context, title, rows):
+    line = layout(context.terminal_width, NETWORK_COLUMNS).row
+    lines = [line([title, "trains", "late", "cancelled", "avg", "max"])]
+    for row in rows:
+        lines.append(line([row["group"], str(row["trains"]), str(row["late"]), str(row["cancelled"]),
+                           format_minutes(row["average_delay"]), format_minutes(row["max_delay"])]))
+    return lines
+
+
+def fetch_board(station):
+    """
+    The parsed liveboard of a station, or
+    None when it could not be fetched.
+    """
+    try:
+        return parse_liveboard(liveboard_request(station, request=api_fetch))
+    except (APIError, KeyError, TypeError, ValueError):
+        return None
+
+
+def station_names():
+    catalogue = get_catalogue()
+    if catalogue is None:
+        click.echo("Could not get the station list.")
+        raise SystemExit(1)
+    return [name for _, name, _ in catalogue.stations]
+
+
+@click.command()
+@click.option('--workers', '-w', default=MAX_WORKERS, show_default=True,
+              help="Number of liveboards to fetch at the same time")
+@click.option('--top', '-n', default=15, show_default=True,
+              help="Number of stations and lines to show, the ones with the most late trains first")
+@click.option('--format', '-f', 'format', type=click.Choice(FORMATS), default='text',
+              help="Output format; json, ndjson and csv show delays in seconds and every station and line")
+@pass_context
+def cli(context, workers, top, format):
+    """
+    Show the delays across the whole network right now.
+    The liveboards of all stations are fetched and
+    summed up per station and per line (train type
+    and destination); a train seen at several
+    stations counts once for its line.
+
+    Requests stay under the API rate limit shared by
+    all irail processes (IRAIL_RATE_LIMIT), so a full
+    sweep takes a few minutes with the default limit.
+    With IRAIL_RECORD=1 the boards are added to the
+    delay history of irail stats as well.
+    """
+    stations = station_names()
+    summary = NetworkSummary()
+    failed = 0
+    with click.progressbar(length=len(stations), label="Liveboards",
+                           file=sys.stderr) as progress:
+        for board in sweep(stations, fetch_board, max(workers, 1)):
+            if board is None:
+                failed += 1
+            else:
+                summary.add(board)
+            progress.update(1)
+
+    if format != 'text':
+        writer = RowWriter(format, NETWORK_FIELDS)
+        writer.write_all(summary.station_rows())
+        writer.write_all(summary.line_rows())
+        writer.close()
+        return
+    total = summary.total()
+    frame = Frame()
+    frame.line("{} trains on {} boards: {} late, {} cancelled, {} min average delay".format(
+        total.trains, summary.boards, total.late, total.cancelled,
+        format_minutes(total.average_delay())), reverse=True)
+    if failed:
+        frame.line("{} of {} liveboards could not be fetched.".format(failed, len(stations)))
+    frame.line()
+    frame.lines(network_lines(context, "station", summary.station_rows()[:top]))
+    frame.line()
+    frame.lines(network_lines(context, "line", summary.line_rows()[:top]))
+    frame.flush()
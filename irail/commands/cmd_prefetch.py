@@ -0,0 +1,105 @@
+import click
+from functools import partial
+from time import sleep, time
+from irail.cli import pass_context
+from irail.commands.utils import *
+from irail.commands.favourites import (HOLD, LEAD, FavouritesError, due_favourites, favourites_path,
+                                       load_favourites, seconds_until_due)
+
+
+# Never sleep longer than this with --loop, so edits to the favourites are picked up.
+MAX_WAIT = 15 * 60
+
+
+def prefetch(favourite, ttl, resolver):
+    """
+    Fetch a favourite into the response cache, the
+    same way the interactive command asks for it.
+    """
+    query = favourite.query
+    request = partial(api_prefetch, ttl=ttl)
+    if query["type"] == "liveboard":
+        liveboard_request(resolver.resolve(query["station"]), request=request)
+    else:
+        route_response(resolver.resolve(query["from"]), resolver.resolve(query["to"]),
+                       time_selection=query.get("selection", "depart"), request=request)
+
+
+def prefetch_one(due, resolver):
+    """
+    Prefetch a favourite and return the line
+    to report it with and whether it failed.
+    """
+    favourite, ttl = due
+    try:
+        prefetch(favourite, ttl, resolver)
+    except (APIError, NoStationFound, NoConnectionsFound) as e:
+        return "{}: {}".format(favourite.describe(), str(e) or "No connections found"), True
+    return favourite.describe(), False
+
+
+def read_favourites():
+    try:
+        return load_favourites(favourites_path())
+    except FavouritesError as e:
+        click.echo(str(e))
+        raise SystemExit(1)
+
+
+@click.command()
+@click.option('--loop', is_flag=True,
+              help="Keep running and refresh every favourite while it is due")
+@click.option('--lead', default=LEAD, show_default=True,
+              help="Minutes before a favourite's time to start prefetching it")
+@click.option('--interval', '-i', default=60, show_default=True,
+              help="Seconds between two refreshes of a due favourite with --loop")
+@click.option('--all', '-a', 'everything', is_flag=True,
+              help="Prefetch every favourite now, whatever its times")
+@pass_context
+def cli(context, loop, lead, interval, everything):
+    """
+    Prefetch your favourite liveboards and routes.
+    Favourites are read from favourites.json in the
+    irail data directory, with the times you usually
+    need them (see the README):
+
+    \b
+    [{"type": "liveboard", "station": "Gent-Sint-Pieters", "at": ["07:40"]},
+     {"type": "route", "from": "Gent-Sint-Pieters", "to": "Brussel-Zuid", "at": ["07:45"]}]
+
+    From a few minutes before until a quarter past
+    such a time, liveboard and route answer from the
+    prefetched data right away and say how old it is.
+    Run this every few minutes from cron, or keep it
+    running with --loop:
+
+    \b
+    */5 * * * * irail prefetch
+    irail prefetch --loop
+    """
+    while True:
+        favourites = read_favourites()
+        if not favourites:
+            click.echo("No favourites yet, add some to {}.".format(favourites_path()))
+            raise SystemExit(1)
+        now = time()
+        if everything:
+            due = [(favourite, HOLD * 60) for favourite in favourites]
+        else:
+            due = due_favourites(favourites, now, lead)
+        failed = False
+        resolver = StationResolver()
+        for line, error in iter_concurrently(partial(prefetch_one, resolver=resolver), due):
+            failed = failed or error
+            click.echo(format_time(now) + " " + line)
+        if not loop:
+            break
+        waits = [MAX_WAIT]
+        if due:
+            waits.append(max(interval, 1))
+        until_due = seconds_until_due(favourites, now, lead)
+        if until_due is not None:
+            waits.append(until_due)
+        sleep(min(waits))
+    if failed:
+        raise SystemExit(1)
@@ -1,7 +1,24 @@
 import click
+import heapq
+import itertools
 import re
 from irail.cli import pass_context
 from irail.commands.utils import *
+from irail.commands.records import parse_connections, parse_vehicle_journey
+from irail.commands.output import FORMATS, RowWriter, CONNECTION_FIELDS, connection_row
+from irail.commands.trace import tracer
+from irail.commands.render import Frame
+from irail.commands.favourites import human_readable_age, prefetched_age
+from irail.commands.screen import Screen
+from irail.commands.speculation import Speculation
+from irail.commands.times import query_parameters, query_time
+
+
+# Connections queried for a --window are asked for this many
+# seconds apart. A page holds about 6 connections, which covers
+# at least half an hour even on the busiest lines.
+PAGE_STEP = 30 * 60
+TOP_K = 10
 
 
 def duration_int_to_human_readable_duration(duration):
@@ -10,126 +27,180 @@ def duration_int_to_human_readable_duration(duration):
 
 
 def get_duration(connection):
-    return duration_int_to_human_readable_duration(connection["duration"])
+    return duration_int_to_human_readable_duration(connection.duration)
 
 
 def get_nr_of_vias(connection):
-    try:
-        return int(connection["vias"]["number"])
-    except KeyError:
-        return 0
+    return len(connection.vias)
+
+
+def generate_vehicle_string(departure, include_number):
+    vehicle = human_readable_vehicle(departure, include_number=include_number)
+
+    return u'\u2193 ' + vehicle + " (" + departure.direction + ") " + u'\u2193'
+
 
+def get_legs(connection):
+    """
+    Split a connection into the legs travelled
+    on a single vehicle. Each leg is a tuple
+    (departure, from station, to station), where
+    the departure holds the vehicle and direction.
+    """
+    return connection.legs
 
-def get_direction(connection):
-    return connection["direction"]["name"]
 
+class StopsPrefetcher(object):
+    """
+    Fetches the stop lists of the vehicles in a set
+    of connections in the background, with bounded
+    concurrency and at most one request per vehicle,
+    so expanding a connection can show its stops
+    without waiting for the network.
+    """
 
-def generate_vehicle_string(connection, include_number):
-    vehicle = get_human_readable_vehicle_from_connection(connection, include_number=include_number)
-    direction = get_direction(connection)
+    def __init__(self, max_workers=4):
+        from concurrent.futures import ThreadPoolExecutor
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.futures = {}
 
-    return u'\u2193 ' + vehicle + " (" + direction + ") " + u'\u2193'
+    def _submit(self, vehicle_id):
+        if vehicle_id not in self.futures:
+            self.futures[vehicle_id] = self.executor.submit(fetch_vehicle, vehicle_id)
+        return self.futures[vehicle_id]
 
-def generate_departure_vehicle_string(connection, include_number):
-    pass
+    def prefetch(self, connections):
+        for connection in connections:
+            for departure, _, _ in get_legs(connection):
+                self._submit(departure.vehicle)
 
+    def get_vehicle(self, vehicle_id):
+        """
+        The parsed vehicle, or None when
+        it could not be fetched.
+        """
+        try:
+            return self._submit(vehicle_id).result()
+        except APIError:
+            return None
 
-def get_stops_for_via(via):
-    pass
+    def shutdown(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.executor.shutdown(wait=False)
+
+
+def fetch_vehicle(vehicle_id):
+    return parse_vehicle_journey(api_fetch("vehicle", id=vehicle_id))
 
 
 def get_stops_for_vehicle(vehicle):
-    pass
+    return vehicle.stops if vehicle is not None else []
 
 
-def show_stop(vehicle_stop):
-    pass
+def get_stops_for_via(prefetcher, via):
+    return get_stops_for_vehicle(prefetcher.get_vehicle(via.vehicle))
 
 
-def show_stops(context, via, from_station=None, to_station=None):
-    vehicle = via["vehicle"]
-    from_station = ""
+def get_stops_between(stops, from_station, to_station):
+    """
+    The stops of a vehicle strictly between
+    the stations where we get on and off.
+    """
+    names = [stop.station for stop in stops]
+    try:
+        start = names.index(from_station)
+        end = names.index(to_station, start)
+    except ValueError:
+        return []
+    return stops[start + 1:end]
+
 
+def show_stop(frame, context, vehicle_stop):
+    delay = "   " if vehicle_stop.cancelled else human_readable_delay(vehicle_stop.delay)
+    frame.line("    " + format_time(vehicle_stop.time) + " " + delay + " " +
+               vehicle_stop.station, dim=True)
 
-def expand_via(context, via, show_vehicle):
-    station_name = get_station_from_user_input_name_from_connection(via)
 
-    arrival_time = get_arrival_time_from_via(via)
-    arrival_platform = get_arrival_platform_from_via(via)
+def show_stops(frame, context, prefetcher, via, from_station=None, to_station=None):
+    stops = get_stops_for_via(prefetcher, via)
+    for stop in get_stops_between(stops, from_station, to_station):
+        show_stop(frame, context, stop)
 
-    departure_time = get_departure_time_from_via(via)
-    departure_platform = get_departure_platform_from_via(via)
 
-    vehicle_string = generate_vehicle_string(via, include_number=show_vehicle)
-    centered_vehicle_string = vehicle_string.center(context.terminal_width)
+def show_leg(frame, context, departure, from_station, to_station, show_vehicle, prefetcher):
+    vehicle_string = generate_vehicle_string(departure, include_number=show_vehicle)
+    frame.line(vehicle_string.center(context.terminal_width), reverse=True)
+    if prefetcher is not None:
+        show_stops(frame, context, prefetcher, departure, from_station, to_station)
 
-    if via["id"] != "0":
-        click.secho(centered_vehicle_string, reverse=True)
 
-    arrival_string = arrival_time + " " + arrival_platform
-    departure_string = departure_time + " "  + departure_platform
+def expand_via(frame, context, via, show_vehicle):
+    arrival_string = format_time(via.arrival.time) + " " + human_readable_platform(via.arrival.platform)
+    departure_string = format_time(via.departure.time) + " " + human_readable_platform(via.departure.platform)
 
-    click.echo(station_name +  (arrival_string + " | " + departure_string).rjust(context.terminal_width - len(station_name)))
+    frame.line(via.station + (arrival_string + " | " + departure_string).rjust(context.terminal_width - len(via.station)))
 
 
 def get_info(info):
-    station = info["stationinfo"]["standardname"]
-    time = timestamp_to_human_readable_time(info["time"])
-    platform = get_platform(info)
-    direction = info["direction"]["name"]
-    return station, time, platform, direction
+    return info.station, format_time(info.time), human_readable_platform(info.platform), info.direction
 
 
 def get_departure_info(connection):
-    return get_info(connection["departure"])
+    return get_info(connection.departure)
 
 
 def get_arrival_info(connection):
-    return get_info(connection["arrival"])
+    return get_info(connection.arrival)
 
 
-def expand_connection(context, connection, show_vehicle):
+def expand_connection(frame, context, connection, show_vehicle, prefetcher=None):
+    """
+    Show every leg of a connection. When a prefetcher
+    is given, the intermediate stops of each leg are
+    shown as well.
+    """
     d_station, d_time, d_platform, d_direction = get_departure_info(connection)
 
     a_station, a_time, a_platform, a_direction = get_arrival_info(connection)
 
-    click.echo(d_station + (d_time + " " + d_platform).rjust(context.terminal_width - len(d_station)))
+    frame.line(d_station + (d_time + " " + d_platform).rjust(context.terminal_width - len(d_station)))
 
-    departure_vehicle_string = generate_vehicle_string(departure_info, include_number=show_vehicle)
-    click.secho(departure_vehicle_string.center(context.terminal_width), reverse=True)
-    if "vias" in connection:
-        for via in connection["vias"]["via"]:
-            expand_via(context, via, show_vehicle)
-        arrival_vehicle_string = generate_vehicle_string(arrival_info, include_number=show_vehicle)
-        click.secho(arrival_vehicle_string.center(context.terminal_width), reverse=True)
+    for index, (departure, from_station, to_station) in enumerate(get_legs(connection)):
+        show_leg(frame, context, departure, from_station, to_station, show_vehicle, prefetcher)
+        if index < len(connection.vias):
+            expand_via(frame, context, connection.vias[index], show_vehicle)
 
-    (click.echo(a_station + (a_time + " " + a_platform + (" " * 12))
-              .rjust(context.terminal_width - len(arrival_station))))
+    (frame.line(a_station + (a_time + " " + a_platform + (" " * 12))
+              .rjust(context.terminal_width - len(a_station))))
 
 
-def make_route_header(context, from_station, to_station):
-    click.secho(" " * context.terminal_width, reverse=True)
+def make_route_header(frame, context, from_station, to_station):
+    frame.line(" " * context.terminal_width, reverse=True)
     route_string = from_station + " - " + to_station
-    click.secho(route_string.center(context.terminal_width), reverse=True)
-    click.secho(" " * context.terminal_width, reverse=True)
+    frame.line(route_string.center(context.terminal_width), reverse=True)
+    frame.line(" " * context.terminal_width, reverse=True)
 
 
 def route_overview(connection):
-    return (get_departure_time_from_via(connection),
-            get_arrival_time_from_via(connection),
+    return (format_time(connection.departure.time),
+            format_time(connection.arrival.time),
             get_duration(connection),
             str(get_nr_of_vias(connection)))
 
 
-def show_route_choices(connections):
+def route_choice_lines(connections):
+    lines = []
     for index, connection in enumerate(connections):
-        d_station, d_time, d_platform, d_direction = get_departure_info(connection)
-        a_station, a_time, a_platform, a_direction = get_arrival_info(connection)
-        duration = get_duration(connection)
-        nr_of_vias = get_nr_of_vias(connection)
+        d_time, a_time, duration, nr_of_vias = route_overview(connection)
 
-        msg = str(index) + ": " + departure_time + " --> " + arrival_time + "             " + str(duration) + "     " +  str(nr_of_vias)
-        click.echo(msg)
+        msg = str(index) + ": " + d_time + " --> " + a_time + "             " + duration + "     " +  nr_of_vias
+        lines.append(msg)
+    return lines
+
+
+def show_route_choices(frame, connections):
+    frame.lines(route_choice_lines(connections))
 
 
 def verify_date(date):
@@ -162,17 +233,167 @@ def verify_time(time):
 
 
 def asap_sort(connection):
-    return connection["arrival"]["time"]
+    return connection.arrival.time
 
 
 def reasonable_connection(connection):
-    return int(connection["arrival"]["time"]) + int(connection["duration"]) // 2
+    return connection.arrival.time + connection.duration // 2
 
 
 def sort_connections(connections):
     return sorted(connections, key=reasonable_connection)
 
 
+def show_connections(frame, context, optimal_connections, show_vehicle, prefetcher):
+    with tracer.span("render"):
+        most_optimal_connection = optimal_connections.pop(0)
+        optimal_departure_time, optimal_arrival_time, duration, changes = route_overview(most_optimal_connection)
+        frame.line("Optimal connection: " + optimal_departure_time + " --> " + optimal_arrival_time + ("Duration: " + duration + " " + "Changes: " + changes).rjust(context.terminal_width - 35), reverse=True)
+        expand_connection(frame, context, most_optimal_connection, show_vehicle, prefetcher)
+
+        frame.line("Other options:")
+        show_route_choices(frame, optimal_connections)
+        frame.flush()
+
+    expand_choices(frame, context, optimal_connections, show_vehicle, prefetcher)
+
+
+def expand_choices(frame, context, optimal_connections, show_vehicle, prefetcher):
+    """
+    Let the user expand the other connections. Each
+    answer is shown as one frame, written at once.
+    """
+    v = click.confirm('Would you like to expand any of these?', abort=True)
+    while v:
+        e = click.prompt("Which one (type 9 for all)?", type=int)
+        if e == 9:
+            for connection in optimal_connections:
+                expand_connection(frame, context, connection, show_vehicle, prefetcher)
+            frame.flush()
+            raise SystemExit(1)
+        current = optimal_connections.pop(e)
+        expand_connection(frame, context, current, show_vehicle, prefetcher)
+        show_route_choices(frame, optimal_connections)
+        frame.flush()
+        if optimal_connections:
+            v = click.confirm('Would you like to expand any more?', abort=True)
+        else:
+            click.echo("These were all the connections!")
+            v = False
+
+
+def parse_window(window):
+    """
+    A duration like 3h, 90m or 1h30m in seconds.
+    """
+    r = re.match(r'^(?:(\d+)h)?(?:(\d+)m)?$', window.strip().lower())
+    if not window.strip() or not r:
+        raise ValueError("{} is not a duration like 3h, 90m or 1h30m".format(window))
+    return int(r.group(1) or 0) * 3600 + int(r.group(2) or 0) * 60
+
+
+def validate_window(context, param, value):
+    if value is None:
+        return None
+    try:
+        return parse_window(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def page_times(start, window, selection, step=PAGE_STEP):
+    """
+    The times to query to cover the window: later
+    departures, or earlier arrivals with 'arrive'.
+    """
+    sign = -1 if selection == "arrive" else 1
+    return [start + sign * offset for offset in range(0, window + 1, step)]
+
+
+def in_window(connection, start, window, selection):
+    if selection == "arrive":
+        return start - window <= connection.arrival.time <= start
+    return start <= connection.departure.time <= start + window
+
+
+def connection_key(connection):
+    return (connection.departure.time, connection.arrival.time,
+            tuple(departure.vehicle for departure, _, _ in connection.legs))
+
+
+class TopConnections(object):
+    """
+    The k best connections seen so far, by
+    reasonable_connection, in a bounded heap with the
+    worst one on top, so adding a page costs
+    O(n log k) instead of sorting everything again.
+    Connections that show up on several pages are
+    only counted once.
+    """
+
+    def __init__(self, k=TOP_K):
+        self.k = k
+        self.heap = []
+        self.seen = set()
+        self.counter = itertools.count()
+
+    def add(self, connection):
+        """
+        Returns whether the connection made it
+        into the top k.
+        """
+        key = connection_key(connection)
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        item = (-reasonable_connection(connection), next(self.counter), connection)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, item)
+            return True
+        if item[0] > self.heap[0][0]:
+            heapq.heapreplace(self.heap, item)
+            return True
+        return False
+
+    def ranked(self):
+        return [connection for _, _, connection in
+                sorted(self.heap, key=lambda item: (-item[0], item[1]))]
+
+
+def fetch_window(request, from_station, to_station, start, window, selection):
+    """
+    Query all pages of the window at once and
+    yield the connections of each page as it arrives.
+    """
+    def fetch_page(moment):
+        date, time = query_parameters(moment)
+        try:
+            return parse_connections(request(from_station, to_station, date, time, selection))
+        except NoConnectionsFound:
+            return []
+
+    for page in iter_concurrently(fetch_page, page_times(start, window, selection)):
+        yield page
+
+
+def rank_window(request, from_station, to_station, start, window, selection, k, screen=None):
+    """
+    The best k connections in the window. With a
+    screen, the ranking so far is redrawn every time
+    a page changes it.
+    """
+    top = TopConnections(k)
+    for page in fetch_window(request, from_station, to_station, start, window, selection):
+        changed = False
+        for connection in page:
+            if in_window(connection, start, window, selection) and top.add(connection):
+                changed = True
+        if screen is not None and changed:
+            with tracer.span("render"):
+                screen.update(route_choice_lines(top.ranked()))
+    return top.ranked()
+
+
 @click.command()
 @click.argument('from_station')
 @click.argument('to_station')
@@ -183,41 +404,134 @@ def sort_connections(connections):
 @click.option('--selection', '-s', default='depart', type=click.Choice(['depart', 'arrive']),
               help="Choose 'depart' or 'arrive' at specified date/time. Defaults to 'depart'")
 @click.option('--show-vehicle', '-v', default=False, is_flag=True)
+@click.option('--stops', '-S', default=False, is_flag=True,
+              help="Show the intermediate stops of every vehicle")
+@click.option('--format', '-f', 'format', type=click.Choice(FORMATS), default='text',
+              help="Output format; json, ndjson and csv list all connections without prompting")
+@click.option('--local', '-l', is_flag=True,
+              help="Plan on the local timetable (see irail timetable) instead of asking the API")
+@click.option('--window', '-w', default=None, callback=validate_window,
+              help="Search a whole time window (e.g. 3h, 90m) instead of one page of connections")
+@click.option('--top', '-k', default=TOP_K, show_default=True,
+              help="Number of connections to keep with --window")
 @pass_context
-def cli(context, from_station, to_station, time, date, selection, show_vehicle):
+def cli(context, from_station, to_station, time, date, selection, show_vehicle, stops, format, local,
+        window, top):
+    """
+    Find connections between two stations.
+    Example:
+    irail route Gent-Sint-Pieters Brussel-Zuid
+
+    With --format json, ndjson or csv, every connection
+    is written as one row, best connection first.
+
+    With --local, the route is planned offline on the
+    timetable built by irail timetable.
+
+    With --window, every departure in the window is
+    searched and the best ones are listed, e.g. for
+    the whole afternoon:
+    irail route Gent-Sint-Pieters Brussel-Zuid -t 1300 -w 5h
+    """
     if not verify_date(date):
         click.echo("Date is not properly formatted (DDMMYY)")
         raise SystemExit(1)
     if not verify_time(time):
         click.echo("Time is not properly formatted (HHMM)")
         raise SystemExit(1)
-    from_station = get_station_from_user_input(from_station)
-    to_station = get_station_from_user_input(to_station)
-
-    make_route_header(context, from_station, to_station)
-
-    connections = route_request(from_station, to_station, date, time, selection)
-
-    optimal_connections = sort_connections(connections)
-    most_optimal_connection = optimal_connections.pop(0)
-    optimal_departure_time, optimal_arrival_time, duration, changes = route_overview(most_optimal_connection)
-    click.secho("Optimal connection: " + optimal_departure_time + " --> " + optimal_arrival_time + ("Duration: " + duration + " " + "Changes: " + changes).rjust(context.terminal_width - 35), reverse = True, nl = False)
-    expand_connection(context, most_optimal_connection, show_vehicle=show_vehicle)
+    speculation = None
+    if not local and window is None:
+        speculation = Speculation(
+            lambda origin, destination: route_response(origin, destination, date, time, selection),
+            lambda origin, destination: route_response(origin, destination, date, time, selection,
+                                                       request=api_fetch))
+    try:
+        with tracer.span("resolve stations"):
+            from_station, to_station = get_stations_from_user_input(
+                [from_station, to_station], speculation and speculation.start)
+        show_route(context, from_station, to_station, time, date, selection, show_vehicle,
+                   stops, format, local, window, top, speculation)
+    finally:
+        if speculation is not None:
+            speculation.shutdown()
+
+
+def show_route(context, from_station, to_station, time, date, selection, show_vehicle,
+               stops, format, local, window, top, speculation):
+
+    frame = Frame()
+    if format == 'text':
+        make_route_header(frame, context, from_station, to_station)
+        frame.flush()
+
+    if window is not None:
+        show_window(frame, context, from_station, to_station, time, date, selection, show_vehicle,
+                    stops, format, local, window, top)
+        return
+
+    with tracer.span("connections"):
+        try:
+            if local:
+                response = local_route_request(from_station, to_station, date, time, selection)
+                age = None
+            else:
+                response = speculation.call(from_station, to_station)["connection"]
+                age = prefetched_age([api_prefetched_at("connections", from_station=from_station,
+                                                        to=to_station, date=date, time=time,
+                                                        timeSel=selection)])
+        except NoConnectionsFound:
+            click.echo("No connections found.")
+            raise SystemExit(1)
+    with tracer.span("parse"):
+        connections = parse_connections(response)
+    with tracer.span("sort"):
+        optimal_connections = sort_connections(connections)
+
+    if format != 'text':
+        with tracer.span("render"):
+            writer = RowWriter(format, CONNECTION_FIELDS)
+            writer.write_all(connection_row(connection) for connection in optimal_connections)
+            writer.close()
+        return
+
+    if age is not None:
+        frame.line(human_readable_age(age))
+    prefetcher = None
+    if stops:
+        prefetcher = StopsPrefetcher()
+        prefetcher.prefetch(optimal_connections)
+    try:
+        show_connections(frame, context, optimal_connections, show_vehicle, prefetcher)
+    finally:
+        if prefetcher is not None:
+            prefetcher.shutdown()
+
+
+def show_window(frame, context, from_station, to_station, time, date, selection, show_vehicle,
+                stops, format, local, window, k):
+    request = local_route_request if local else route_request
+    screen = Screen() if format == 'text' else None
+    with tracer.span("connections"):
+        optimal_connections = rank_window(request, from_station, to_station,
+                                          query_time(date, time), window, selection, k, screen)
+    if not optimal_connections:
+        click.echo("No connections found.")
+        raise SystemExit(1)
 
-    click.echo("Other options:")
-    show_route_choices(optimal_connections)
+    if format != 'text':
+        with tracer.span("render"):
+            writer = RowWriter(format, CONNECTION_FIELDS)
+            writer.write_all(connection_row(connection) for connection in optimal_connections)
+            writer.close()
+        return
+
+    prefetcher = None
+    if stops:
+        prefetcher = StopsPrefetcher()
+        prefetcher.prefetch(optimal_connections)
+    try:
+        expand_choices(frame, context, optimal_connections, show_vehicle, prefetcher)
+    finally:
+        if prefetcher is not None:
+            prefetcher.shutdown()
 
-    v = click.confirm('Would you like to expand any of these?', abort=True)
-    while v:
-        e = click.prompt("Which one (type 9 for all)?", type=int)
-        if e == 9:
-            for connection in optimal_connections:
-                expand_connection(context, connection, show_vehicle=show_vehicle)
-            raise SystemExit(1)
-        current = optimal_connections.pop(e)
-        expand_connection(context, current, show_vehicle=show_vehicle)
-        show_route_choices(optimal_connections)
-        if optimal_connections:
-            v = click.confirm('Would you like to expand any more?', abort=True)
-        else:
-            click.echo("These were all the connections!")
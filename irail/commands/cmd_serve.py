@@ -0,0 +1,44 @@
+import signal
+import sys
+import click
+from irail.cli import pass_context
+from irail.commands.utils import *
+from irail.commands.daemon import is_running, serve
+from irail.commands.paths import data_dir
+from irail.launcher import socket_path
+
+
+@click.command()
+@click.option('--socket', '-s', 'path', type=click.Path(dir_okay=False), default=None,
+              help="Unix socket to listen on. Defaults to irail.sock in the data directory")
+@pass_context
+def cli(context, path):
+    """
+    Keep irail warm in the background for faster commands.
+    While it runs, liveboard, route and vehicle are
+    handed to this process, which keeps the station
+    catalogue, the response cache and the connections
+    to the API around between commands:
+
+    \b
+    irail serve &
+    irail liveboard Gent-Sint-Pieters
+
+    Commands that ask a question, continuous ones and
+    help are still run by the irail command itself.
+    Stop the daemon with Ctrl-C (or SIGTERM).
+    """
+    data_dir()
+    path = path or socket_path()
+    if path is None:
+        click.echo("irail serve needs Unix sockets, which this platform does not have.")
+        raise SystemExit(1)
+    if is_running(path):
+        click.echo("irail serve is already running on {}.".format(path))
+        raise SystemExit(1)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    click.echo("Listening on {}".format(path), err=True)
+    try:
+        serve(path)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,78 @@
+import time
+import click
+from irail.cli import pass_context
+from irail.commands.history import History, history_path
+from irail.commands.output import FORMATS, RowWriter
+from irail.commands.render import Frame, format_minutes, layout
+from irail.commands.stats import GROUPS, STATS_FIELDS, delay_stats
+
+
+# Name, departures, on time, cancelled and the delay percentiles.
+STATS_COLUMNS = (None, 8, 8, 9, 6, 6, 6)
+
+
+def format_share(value):
+    return "-" if value is None else "{:.1f}%".format(value * 100)
+
+
+def stats_lines(context, rows, by):
+    line = layout(context.terminal_width, STATS_COLUMNS).row
+    lines = [line([by, "trains", "on time", "cancelled", "p50", "p90", "p99"])]
+    for row in rows:
+        lines.append(line([row["group"], str(row["observations"]),
+                           format_share(row["punctuality"]), format_share(row["cancelled"]),
+                           format_minutes(row["delay_p50"]), format_minutes(row["delay_p90"]),
+                           format_minutes(row["delay_p99"])]))
+    return lines
+
+
+@click.command()
+@click.option('--by', '-b', type=click.Choice(GROUPS), default='station', show_default=True,
+              help="Group the departures per station, line (train type and destination), hour or vehicle")
+@click.option('--since', '-s', type=int, default=None,
+              help="Only use the departures of the last this many days")
+@click.option('--station', default=None,
+              help="Only use the departures from this station")
+@click.option('--top', '-n', default=20, show_default=True,
+              help="Number of groups to show, the ones with the most departures first")
+@click.option('--format', '-f', 'format', type=click.Choice(FORMATS), default='text',
+              help="Output format; json, ndjson and csv show delays in seconds and every group")
+@pass_context
+def cli(context, by, since, station, top, format):
+    """
+    Show punctuality and delays from the recorded history.
+    Liveboards and vehicles you look up are only
+    recorded when IRAIL_RECORD=1 is set, e.g. for a
+    board that keeps running:
+
+    \b
+    IRAIL_RECORD=1 irail liveboard Gent-Sint-Pieters -c
+    irail stats --by hour --station Gent-Sint-Pieters
+
+    A departure counts as on time when it is less
+    than 6 minutes late; delays (in minutes) are the
+    50th, 90th and 99th percentile of the departures
+    that were not cancelled. Needs numpy.
+    """
+    try:
+        import numpy
+    except ImportError:
+        click.echo("irail stats needs numpy (pip install numpy).")
+        raise SystemExit(1)
+    history = History(history_path())
+    if not len(history):
+        click.echo("No delay history yet, record some with IRAIL_RECORD=1.")
+        raise SystemExit(1)
+    cutoff = None if since is None else time.time() - since * 24 * 3600
+    rows = delay_stats(history.columns(), history.load_names(), by, cutoff, station)
+    if format != 'text':
+        writer = RowWriter(format, STATS_FIELDS)
+        writer.write_all(rows)
+        writer.close()
+        return
+    if not rows:
+        click.echo("No departures match.")
+        raise SystemExit(1)
+    frame = Frame()
+    frame.lines(stats_lines(context, rows[:top], by))
+    frame.flush()
@@ -0,0 +1,63 @@
+import click
+from irail.cli import pass_context
+from irail.commands.utils import *
+from irail.commands.cache import get_cache
+from irail.commands.timetable import build_from_cache, build_from_gtfs, get_timetable, timetable_path
+from irail.commands.times import parse_date
+
+
+def describe(timetable):
+    if not len(timetable):
+        return "The local timetable is empty."
+    return ("{} connections between {} stations on {} trips, from {} until {} ({})".format(
+        len(timetable), len(timetable.stations), len(timetable.trips),
+        format_time(timetable.first_departure(), include_date=True),
+        format_time(timetable.last_arrival(), include_date=True),
+        timetable.source))
+
+
+@click.command()
+@click.option('--update', '-u', is_flag=True,
+              help="Rebuild the timetable from the vehicles in the response cache")
+@click.option('--gtfs', type=click.Path(exists=True), default=None,
+              help="Build the timetable from a GTFS feed (zip file or directory)")
+@click.option('--date', '-d', default=None,
+              help="First day to import from the GTFS feed. Format: DDMMYY. Defaults to today")
+@click.option('--days', default=1, show_default=True,
+              help="Number of days to import from the GTFS feed")
+@pass_context
+def cli(context, update, gtfs, date, days):
+    """
+    Build the local timetable used by route --local.
+    Without options, show what is in it.
+
+    The timetable can be collected from the vehicles
+    you looked up before (they are kept in the
+    response cache), or imported from a GTFS feed:
+
+    \b
+    irail timetable --update
+    irail timetable --gtfs gtfs.zip --days 3
+    """
+    if gtfs:
+        try:
+            first_day = parse_date(date)
+        except ValueError:
+            click.echo("Date is not properly formatted (DDMMYY)")
+            raise SystemExit(1)
+        timetable = build_from_gtfs(gtfs, first_day, max(days, 1))
+    elif update:
+        cache = get_cache()
+        if cache is None:
+            click.echo("The response cache is turned off (IRAIL_CACHE=0).")
+            raise SystemExit(1)
+        timetable = build_from_cache(cache)
+    else:
+        timetable = get_timetable()
+        if timetable is None:
+            click.echo("There is no local timetable yet, build one with --update or --gtfs.")
+            raise SystemExit(1)
+        click.echo(describe(timetable))
+        return
+    timetable.save(timetable_path())
+    click.echo(describe(timetable))
@@ -1,32 +1,176 @@
 import click
 from irail.cli import pass_context
 from irail.commands.utils import *
-import requests
-from datetime import datetime, timedelta
-from time import time
+from irail.commands.records import JourneyTracker, parse_stop, parse_vehicle_journey
+from irail.commands.output import FORMATS, RowWriter, STOP_FIELDS, stop_row
+from irail.commands.polling import AdaptivePoller
+from irail.commands.render import Frame, style
+from irail.commands.screen import Screen
+from irail.commands.trace import tracer
+from time import sleep, time
 
-def is_on_the_move(vehicle):
-    current_time = time()
-    return (int(vehicle[0]["time"]) < int(current_time) and
-            int(vehicle[-1]["time"]) > int(current_time))
+def is_on_the_move(stops, now=None):
+    current_time = time() if now is None else now
+    return (stops[0].actual_time < int(current_time) and
+            stops[-1].actual_time > int(current_time))
+
+def has_arrived(stops, now):
+    return not stops or stops[-1].actual_time <= now
+
+def next_stop(stops, now):
+    """
+    Index of the first stop the vehicle has not
+    reached yet (len(stops) once it has arrived).
+    """
+    for index, stop in enumerate(stops):
+        if stop.actual_time >= now:
+            return index
+    return len(stops)
+
+def vehicle_header(context, vehicle, timestamp):
+    return style(format_time(timestamp) + " " +
+                 vehicle.center(context.terminal_width - 6),
+                 reverse=True)
+
+def show_vehicle_header(context, vehicle, timestamp):
+    click.echo(vehicle_header(context, vehicle, timestamp))
+
+def stop_line(stop, stop_time, now):
+    dim = stop.actual_time < now
+    return style(stop_time + " " +
+                 human_readable_delay(stop.delay) + " " +
+                 stop.station,
+                 dim=dim)
+
+def show_stop(stop, stop_time, now):
+    click.echo(stop_line(stop, stop_time, now))
+
+def poll_interval(poller, stops, changed, now):
+    """
+    Seconds until the next refresh: often while the
+    vehicle is running (never past its next stop),
+    and while it waits to depart, not before shortly
+    ahead of its departure.
+    """
+    index = next_stop(stops, now)
+    next_event = stops[index].actual_time if index < len(stops) else None
+    interval = poller.next_interval(changed, now, next_event)
+    if not is_on_the_move(stops, now) and next_event is not None:
+        interval = max(interval, next_event - now - poller.maximum)
+    return interval
+
+def visible_stops(stops, now, rows):
+    """
+    The stops that fit on the screen: from the
+    last one passed onwards, as far as possible.
+    """
+    start = max(min(next_stop(stops, now) - 1, len(stops) - rows), 0)
+    return start, stops[start:start + rows]
+
+def track_vehicle(context, vehicle_id):
+    """
+    Follow a vehicle until it reaches its last stop.
+    Stops that did not change since the previous
+    refresh keep their parsed record and formatted
+    row, and only rows that differ are redrawn.
+    """
+    tracker = JourneyTracker()
+    screen = Screen()
+    poller = AdaptivePoller()
+    rows = {}
+    click.clear()
+    while True:
+        response = vehicle_request(vehicle_id)
+        with tracer.span("parse"):
+            vehicle, changed = tracker.update(response)
+        now = vehicle.timestamp
+        for index in changed:
+            rows.pop(index, None)
+        with tracer.span("render"):
+            start, stops = visible_stops(vehicle.stops, now, context.terminal_height - 2)
+            lines = [vehicle_header(context, vehicle.vehicle, now)]
+            for index, stop in enumerate(stops, start):
+                passed = stop.actual_time < now
+                if index not in rows or rows[index][0] != passed:
+                    rows[index] = (passed, stop_line(stop, format_time(stop.time), now))
+                lines.append(rows[index][1])
+            screen.update(lines)
+        if has_arrived(vehicle.stops, now):
+            break
+        sleep(poll_interval(poller, vehicle.stops, bool(changed), now))
+
+def show_streamed_vehicle(context, vehicle_id):
+    """
+    Show the stops of a vehicle one by one,
+    as they are decoded from the response.
+    """
+    stream = stream_request("vehicle", ("stops", "stop"), id=vehicle_id)
+    header = read_stream_header(stream)
+    show_vehicle_header(context, header["vehicle"], int(header["timestamp"]))
+    now = time()
+    for item in stream_items(stream):
+        stop = parse_stop(item)
+        show_stop(stop, format_time(stop.time), now)
+
+def write_stops(vehicle_id, stream, format):
+    """
+    Write the stops as machine-readable rows.
+    With --stream, rows are written while the
+    response is still being decoded.
+    """
+    writer = RowWriter(format, STOP_FIELDS, flush_each_row=stream)
+    if stream:
+        stops = stream_request("vehicle", ("stops", "stop"), id=vehicle_id)
+        vehicle = read_stream_header(stops)["vehicle"]
+        writer.write_all(stop_row(vehicle, parse_stop(item)) for item in stream_items(stops))
+    else:
+        response = vehicle_request(vehicle_id)
+        with tracer.span("parse"):
+            vehicle = parse_vehicle_journey(response)
+        with tracer.span("render"):
+            writer.write_all(stop_row(vehicle.vehicle, stop) for stop in vehicle.stops)
+    writer.close()
 
 @click.command()
 @click.argument('vehicle_id')
+@click.option('--stream', is_flag=True,
+              help="Show stops while the response is still coming in")
+@click.option('--format', '-f', 'format', type=click.Choice(FORMATS), default='text',
+              help="Output format; json, ndjson and csv are unstyled")
+@click.option('--continuous', '-c', is_flag=True,
+              help="Keep following the vehicle until it reaches its last stop")
 @pass_context
-def cli(context, vehicle_id):
-    r = vehicle_request(vehicle_id)
-    click.secho(parse_time(r["timestamp"]) + " " +
-                str.center(r["vehicle"], context.terminal_width - 6),
-                reverse = True)
-    now = datetime.now()
-    for stop in r["stops"]["stop"]:
-
-        stop_time = parse_time(stop["time"])
-        stop_time_raw = int(stop["time"])
-        stop_delay = int(stop["delay"])
-        dim = (datetime.fromtimestamp(stop_time_raw) +
-               timedelta(seconds=stop_delay)) < now
-        click.secho(stop_time + " " +
-                    human_readable_delay_from_delay_string(stop["delay"])[1] + " " +
-                    stop["station"],
-                    dim=dim)
+def cli(context, vehicle_id, stream, format, continuous):
+    """
+    Show the stops of a vehicle.
+    Example:
+    irail vehicle IC1530
+
+    With -c, the stops are kept up to date until the
+    vehicle reaches its last stop. It is refreshed
+    more often while the vehicle is running.
+    Example:
+    irail vehicle IC1530 -c
+    """
+    if format != 'text' and continuous:
+        raise click.UsageError("--continuous only works with the text format")
+    if continuous:
+        track_vehicle(context, vehicle_id)
+        return
+    if format != 'text':
+        write_stops(vehicle_id, stream, format)
+        return
+    if stream:
+        show_streamed_vehicle(context, vehicle_id)
+        return
+    response = vehicle_request(vehicle_id)
+    with tracer.span("parse"):
+        vehicle = parse_vehicle_journey(response)
+    with tracer.span("render"):
+        frame = Frame()
+        frame.line(vehicle_header(context, vehicle.vehicle, vehicle.timestamp))
+        now = time()
+        stop_times = format_times([stop.time for stop in vehicle.stops])
+        frame.lines(stop_line(stop, stop_time, now)
+                    for stop, stop_time in zip(vehicle.stops, stop_times))
+        frame.flush()
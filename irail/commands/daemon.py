@@ -0,0 +1,187 @@
+"""
+The `irail serve` daemon: runs forwarded commands
+(see irail/launcher.py) in a process that keeps
+the API client, the station catalogue and the
+response cache around between commands.
+"""
+import io
+import json
+import os
+import socket
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from irail.launcher import PROTOCOL, FORWARDED
+
+
+class NeedsTerminal(Exception):
+    """
+    Raised when a forwarded command wants to read
+    from the terminal, which only the client has.
+    """
+
+
+class _NoTerminal(io.RawIOBase):
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not len(buffer):
+            return 0
+        raise NeedsTerminal()
+
+
+# Read once, when the daemon creates its API client and rate limiter.
+CLIENT_SETTINGS = ("IRAIL_API_URL", "IRAIL_STATIONS_URL", "IRAIL_RETRIES", "IRAIL_HEDGE",
+                   "IRAIL_RATE_LIMIT", "IRAIL_CACHE")
+
+
+def client_environment(env):
+    """
+    The client's IRAIL_* settings and terminal size,
+    minus the ones that pick the daemon itself.
+    """
+    return dict((name, value) for name, value in env.items()
+                if name not in ("IRAIL_HOME", "IRAIL_SOCKET"))
+
+
+def same_client_settings(env, environ=None):
+    """
+    Whether a client asks for the API settings the
+    daemon's client was made with. When it doesn't,
+    the command runs in the client instead of here
+    with the wrong settings.
+    """
+    environ = os.environ if environ is None else environ
+    return all(env.get(name) == environ.get(name) for name in CLIENT_SETTINGS)
+
+
+def make_runner():
+    from click.testing import CliRunner
+    try:
+        return CliRunner(mix_stderr=False)
+    except TypeError:
+        return CliRunner()
+
+
+class CommandRunner(object):
+    """
+    Runs commands with their output captured. The
+    output of click goes through sys.stdout, so
+    commands run one at a time.
+    """
+
+    def __init__(self):
+        from irail.cli import cli
+        self.cli = cli
+        self.lock = threading.Lock()
+
+    def warm_up(self):
+        """
+        Do the work every command would do first:
+        import the commands, load the catalogue, open
+        the cache and the API session.
+        """
+        from irail.commands.cache import get_cache
+        from irail.commands.client import get_client
+        from irail.commands.stations import get_catalogue
+        from irail.commands.times import formatter
+        for name in FORWARDED:
+            self.cli.get_command(None, name)
+        get_client()
+        get_catalogue()
+        get_cache()
+        formatter.zone
+
+    def run(self, request):
+        if request.get("version") != PROTOCOL or not request.get("args") or \
+           request["args"][0] not in FORWARDED or \
+           not same_client_settings(request.get("env", {})):
+            return {"fallback": True}
+        from irail.commands.trace import tracer
+        runner = make_runner()
+        with self.lock:
+            # IRAIL_TRACE turns the tracer on for one command, not for the daemon.
+            tracer.reset()
+            try:
+                result = runner.invoke(self.cli, request["args"],
+                                       input=_NoTerminal(),
+                                       env=client_environment(request.get("env", {})),
+                                       color=bool(request.get("color")),
+                                       catch_exceptions=False, prog_name="irail")
+            except NeedsTerminal:
+                return {"fallback": True}
+            finally:
+                tracer.reset()
+        return {
+            "version": PROTOCOL,
+            "exit": result.exit_code,
+            "stdout": result.stdout,
+            "stderr": result.stderr,
+        }
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            request = json.loads(line.decode("utf-8"))
+        except ValueError:
+            reply = {"fallback": True}
+        else:
+            try:
+                reply = self.server.runner.run(request)
+            except Exception:
+                reply = {"fallback": True}
+        self.wfile.write(json.dumps(reply).encode("utf-8"))
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, runner):
+        self.runner = runner
+        socketserver.UnixStreamServer.__init__(self, path, RequestHandler)
+        os.chmod(path, 0o600)
+
+
+def is_running(path):
+    """
+    Whether a daemon is listening on path. A socket
+    file nobody listens on is left by a daemon that
+    was killed, and is removed.
+    """
+    if not os.path.exists(path):
+        return False
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except (IOError, OSError):
+        os.unlink(path)
+        return False
+    finally:
+        connection.close()
+    return True
+
+
+def serve(path, runner=None, ready=None):
+    """
+    Serve forwarded commands on path until interrupted.
+    ready, when given, is called with the server once
+    it is listening (the tests use it to stop it).
+    """
+    runner = runner or CommandRunner()
+    runner.warm_up()
+    server = DaemonServer(path, runner)
+    try:
+        if ready is not None:
+            ready(server)
+        server.serve_forever(0.1)
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
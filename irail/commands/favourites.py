@@ -0,0 +1,161 @@
+"""
+Favourite queries and when to prefetch them.
+
+Favourites are kept in favourites.json in the irail
+data directory, as a list of batch queries (see
+irail batch) with the times of the day they are
+usually needed (Brussels time):
+
+    [{"type": "liveboard", "station": "Gent-Sint-Pieters", "at": ["07:40", "17:15"]},
+     {"type": "route", "from": "Gent-Sint-Pieters", "to": "Brussel-Zuid", "at": ["07:45"]}]
+
+A favourite is due from LEAD minutes before one of
+its times until HOLD minutes after it; irail prefetch
+keeps due favourites in the response cache until then.
+"""
+import json
+import os
+import time
+from datetime import datetime
+from irail.commands.paths import data_path
+from irail.commands.times import formatter
+
+
+FAVOURITES_FILE = "favourites.json"
+FIELDS = {"liveboard": ("station",),
+          "route": ("from", "to")}
+LEAD = 10
+HOLD = 15
+DAY = 24 * 60
+
+
+class FavouritesError(Exception):
+    pass
+
+
+class Favourite(object):
+    __slots__ = ("query", "times")
+
+    def __init__(self, query, times):
+        self.query = query
+        # Minutes since midnight.
+        self.times = times
+
+    def describe(self):
+        if self.query["type"] == "route":
+            return "route {} - {}".format(self.query["from"], self.query["to"])
+        return "liveboard {}".format(self.query["station"])
+
+    def minutes_away(self, minute_of_day, hold=HOLD):
+        """
+        Minutes until this favourite is needed next.
+        A time up to hold minutes ago still counts,
+        with a negative number of minutes.
+        """
+        return min((clock - minute_of_day + hold) % DAY - hold for clock in self.times)
+
+
+def parse_clock(text):
+    """
+    Minutes since midnight of a HH:MM time.
+    """
+    try:
+        hours, minutes = text.split(":")
+        hours, minutes = int(hours), int(minutes)
+    except (AttributeError, ValueError):
+        raise FavouritesError("Time {} is not properly formatted (HH:MM)".format(text))
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise FavouritesError("Time {} is not properly formatted (HH:MM)".format(text))
+    return hours * 60 + minutes
+
+
+def parse_favourite(query):
+    if not isinstance(query, dict):
+        raise FavouritesError("Favourite {} is not a JSON object".format(json.dumps(query)))
+    kind = query.get("type")
+    if kind not in FIELDS:
+        raise FavouritesError("Unknown favourite type {}".format(kind))
+    for field in FIELDS[kind]:
+        if field not in query:
+            raise FavouritesError("Missing field {} in favourite".format(field))
+    times = query.get("at")
+    if not isinstance(times, list) or not times:
+        raise FavouritesError("Favourite {} needs a list of times (at)".format(json.dumps(query)))
+    return Favourite(query, [parse_clock(clock) for clock in times])
+
+
+def load_favourites(path):
+    """
+    The favourites in a file, or an empty
+    list when there is no such file.
+    """
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path) as f:
+            queries = json.load(f)
+    except ValueError:
+        raise FavouritesError("{} is not valid JSON".format(path))
+    if not isinstance(queries, list):
+        raise FavouritesError("{} should hold a list of favourites".format(path))
+    return [parse_favourite(query) for query in queries]
+
+
+def favourites_path():
+    return data_path(FAVOURITES_FILE)
+
+
+def minute_of_day(now):
+    moment = datetime.fromtimestamp(now, formatter.zone)
+    return moment.hour * 60 + moment.minute + moment.second / 60.0
+
+
+def due_favourites(favourites, now, lead=LEAD, hold=HOLD):
+    """
+    The favourites that are due at an epoch, each
+    with the number of seconds it should be kept
+    (until hold minutes after its time).
+    """
+    minute = minute_of_day(now)
+    due = []
+    for favourite in favourites:
+        away = favourite.minutes_away(minute, hold)
+        if away <= lead:
+            due.append((favourite, int((away + hold) * 60)))
+    return due
+
+
+def seconds_until_due(favourites, now, lead=LEAD, hold=HOLD):
+    """
+    Seconds until the first favourite that isn't
+    due yet becomes due, or None when there is none.
+    """
+    minute = minute_of_day(now)
+    waits = [(away - lead) * 60 for away in
+             (favourite.minutes_away(minute, hold) for favourite in favourites) if away > lead]
+    return min(waits) if waits else None
+
+
+def prefetched_age(stamps, now=None):
+    """
+    Seconds since the oldest of some responses was
+    prefetched by irail prefetch, given when each
+    was (None for the ones that weren't), or None
+    when none of them was.
+    """
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    if not stamps:
+        return None
+    return max(int((now or time.time()) - min(stamps)), 0)
+
+
+def human_readable_age(age):
+    """
+    How old prefetched data is (prefetched 4 min ago),
+    or an empty string for data that wasn't.
+    """
+    if age is None:
+        return ""
+    if age < 60:
+        return "prefetched just now"
+    return "prefetched {} min ago".format(age // 60)
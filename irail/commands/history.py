@@ -0,0 +1,221 @@
+"""
+Delay history: every departure and stop seen in a
+liveboard or vehicle response, kept for `irail stats`.
+
+Recording is opt-in (IRAIL_RECORD=1). Observations
+are appended to a directory of fixed-width column
+files, one per field, like the local timetable, so
+that months of them can be memory-mapped and
+aggregated with numpy without parsing anything.
+Station and vehicle names are stored once, in
+meta.json, and referred to by their index.
+
+The same departure is usually seen more than once
+(every refresh of a board); all observations are
+kept and the stats use the latest one.
+"""
+import array
+import json
+import os
+import threading
+from irail.commands.paths import data_path
+from irail.commands.records import parse_liveboard, parse_vehicle_journey
+
+
+HISTORY_DIR = "history"
+RECORDED = ("liveboard", "vehicle")
+COLUMNS = (("observed", "l"), ("time", "l"), ("station", "i"), ("vehicle", "i"),
+           ("direction", "i"), ("delay", "i"), ("flags", "B"))
+
+CANCELLED = 1
+PLATFORM_CHANGED = 2
+
+
+def observations(feature, data):
+    """
+    The observations in an API response, as tuples
+    (observed, time, station, vehicle, direction,
+    delay, flags) with names instead of indices.
+    """
+    if feature == "liveboard":
+        board = parse_liveboard(data)
+        for departure in board.departures:
+            yield (board.timestamp, departure.time, board.station, departure.vehicle,
+                   departure.direction, departure.delay,
+                   flags(departure.cancelled, departure.platform.changed))
+    elif feature == "vehicle":
+        vehicle = parse_vehicle_journey(data)
+        if not vehicle.stops:
+            return
+        direction = vehicle.stops[-1].station
+        for stop in vehicle.stops:
+            yield (vehicle.timestamp, stop.time, stop.station, vehicle.vehicle,
+                   direction, stop.delay, flags(stop.cancelled, stop.platform.changed))
+
+
+def flags(cancelled, platform_changed):
+    return (CANCELLED if cancelled else 0) | (PLATFORM_CHANGED if platform_changed else 0)
+
+
+class History(object):
+    """
+    The column files of the delay history. Appends
+    from several processes are serialized with an
+    flock; a column left longer than the others by
+    an interrupted append is cut back before the
+    next one.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.names = {"stations": [], "vehicles": []}
+        self._index = {"stations": {}, "vehicles": {}}
+        self._meta_stamp = None
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def __len__(self):
+        lengths = []
+        for name, typecode in COLUMNS:
+            try:
+                size = os.path.getsize(self.path(name + ".bin"))
+            except OSError:
+                return 0
+            lengths.append(size // array.array(typecode).itemsize)
+        return min(lengths)
+
+    def load_names(self):
+        """
+        Read meta.json again when another process
+        has changed it since we last did.
+        """
+        meta = self.path("meta.json")
+        try:
+            stat = os.stat(meta)
+        except OSError:
+            return self.names
+        stamp = (stat.st_mtime, stat.st_size)
+        if stamp != self._meta_stamp:
+            with open(meta) as f:
+                self.names = json.load(f)
+            self._index = dict((table, dict((name, i) for i, name in enumerate(names)))
+                               for table, names in self.names.items())
+            self._meta_stamp = stamp
+        return self.names
+
+    def _save_names(self):
+        meta = self.path("meta.json")
+        with open(meta + ".tmp", "w") as f:
+            json.dump(self.names, f, separators=(",", ":"))
+        os.rename(meta + ".tmp", meta)
+        stat = os.stat(meta)
+        self._meta_stamp = (stat.st_mtime, stat.st_size)
+
+    def _name_index(self, table, name):
+        index = self._index[table].get(name)
+        if index is None:
+            index = self._index[table][name] = len(self.names[table])
+            self.names[table].append(name)
+        return index
+
+    def _locked(self):
+        import fcntl
+        f = open(self.path("lock"), "a")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def append(self, rows):
+        """
+        Append observations as returned by
+        observations(). Returns how many there were.
+        """
+        rows = list(rows)
+        if not rows:
+            return 0
+        with self.lock:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            try:
+                lock = self._locked()
+            except ImportError:
+                lock = None
+            try:
+                self.load_names()
+                known = sum(len(names) for names in self.names.values())
+                columns = [array.array(typecode) for _, typecode in COLUMNS]
+                for observed, time, station, vehicle, direction, delay, flag in rows:
+                    values = (observed, time, self._name_index("stations", station),
+                              self._name_index("vehicles", vehicle),
+                              self._name_index("stations", direction), delay, flag)
+                    for column, value in zip(columns, values):
+                        column.append(value)
+                if sum(len(names) for names in self.names.values()) != known:
+                    self._save_names()
+                length = len(self)
+                for (name, typecode), column in zip(COLUMNS, columns):
+                    with open(self.path(name + ".bin"), "ab") as f:
+                        f.truncate(length * column.itemsize)
+                        column.tofile(f)
+            finally:
+                if lock is not None:
+                    lock.close()
+        return len(rows)
+
+    def record(self, feature, data):
+        return self.append(observations(feature, data))
+
+    def columns(self):
+        """
+        The columns as read-only numpy arrays, mapped
+        from the files rather than read into memory.
+        """
+        import numpy
+        length = len(self)
+        columns = {}
+        for name, typecode in COLUMNS:
+            dtype = numpy.dtype(typecode)
+            if not length:
+                columns[name] = numpy.zeros(0, dtype)
+                continue
+            columns[name] = numpy.memmap(self.path(name + ".bin"), dtype=dtype,
+                                         mode="r", shape=(length,))
+        return columns
+
+
+def history_path():
+    return data_path(HISTORY_DIR)
+
+
+_recorder = None
+
+
+def get_recorder():
+    """
+    The shared delay history, or None unless
+    recording is turned on with IRAIL_RECORD=1.
+    """
+    global _recorder
+    if os.environ.get("IRAIL_RECORD", "0") in ("0", ""):
+        return None
+    if _recorder is None:
+        _recorder = History(history_path())
+    return _recorder
+
+
+def record_response(feature, data):
+    """
+    Add the observations in an API response to the
+    history when recording is on. A history that
+    can't be written is no reason to fail a command.
+    """
+    if feature not in RECORDED:
+        return
+    recorder = get_recorder()
+    if recorder is None:
+        return
+    try:
+        recorder.record(feature, data)
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        pass
@@ -0,0 +1,49 @@
+import threading
+from collections import deque
+
+
+WINDOW = 100
+PERCENTILE = 95
+MIN_SAMPLES = 20
+# Never hedge sooner than this, whatever the recent responses say.
+MIN_THRESHOLD = 0.05
+
+
+class LatencyTracker(object):
+    """
+    Keeps the response times of the last WINDOW
+    requests per feature, to decide when a request
+    has been slow enough to be worth sending again.
+    Until MIN_SAMPLES responses have been seen there
+    is no threshold; a long-lived process (irail
+    serve, batches, continuous boards) learns it.
+    """
+
+    def __init__(self, window=WINDOW, percentile=PERCENTILE, min_samples=MIN_SAMPLES,
+                 min_threshold=MIN_THRESHOLD):
+        self.window = window
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_threshold = min_threshold
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def add(self, feature, seconds):
+        with self.lock:
+            samples = self.samples.get(feature)
+            if samples is None:
+                samples = self.samples[feature] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def threshold(self, feature):
+        """
+        The configured percentile of the recent response
+        times of a feature, or None when we have not
+        seen enough of them yet.
+        """
+        with self.lock:
+            samples = sorted(self.samples.get(feature, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = min(int(len(samples) * self.percentile / 100.0), len(samples) - 1)
+        return max(samples[index], self.min_threshold)
@@ -0,0 +1,137 @@
+"""
+Network-wide delay snapshot: the liveboards of all
+stations, folded into per-station and per-line
+counters as they come in. Boards are dropped once
+counted, so memory only grows with the number of
+stations, lines and vehicles, never with the
+number of departures fetched.
+"""
+from irail.commands.stats import PUNCTUAL, vehicle_type
+
+
+NETWORK_FIELDS = ["kind", "group", "trains", "late", "cancelled", "average_delay", "max_delay"]
+
+
+class DelayCounter(object):
+    __slots__ = ("trains", "late", "cancelled", "total_delay", "max_delay")
+
+    def __init__(self):
+        self.trains = 0
+        self.late = 0
+        self.cancelled = 0
+        self.total_delay = 0
+        self.max_delay = 0
+
+    def add(self, delay, cancelled, punctual=PUNCTUAL):
+        self.trains += 1
+        if cancelled:
+            self.cancelled += 1
+            return
+        if delay >= punctual:
+            self.late += 1
+        self.total_delay += delay
+        self.max_delay = max(self.max_delay, delay)
+
+    def average_delay(self):
+        ran = self.trains - self.cancelled
+        return float(self.total_delay) / ran if ran else None
+
+    def row(self, kind, group):
+        return {"kind": kind, "group": group, "trains": self.trains, "late": self.late,
+                "cancelled": self.cancelled, "average_delay": self.average_delay(),
+                "max_delay": self.max_delay}
+
+
+def line_name(departure):
+    """
+    A line is a train type with its destination
+    (IC to Oostende), like in irail stats.
+    """
+    return "{} to {}".format(vehicle_type(departure.vehicle), departure.direction)
+
+
+class NetworkSummary(object):
+    """
+    Delays across the liveboards of many stations.
+    Every departure counts for its station. A vehicle
+    shows up on the board of every station it still
+    has to call at, so it only counts once for its
+    line, with its delay at the first of those
+    stations: the most recent estimate.
+    """
+
+    def __init__(self, punctual=PUNCTUAL):
+        self.punctual = punctual
+        self.stations = {}
+        self.lines = []
+        self._line_index = {}
+        # vehicle -> (time, delay, cancelled, line index)
+        self.vehicles = {}
+        self.boards = 0
+
+    def add(self, board):
+        self.boards += 1
+        counter = self.stations.get(board.station)
+        if counter is None:
+            counter = self.stations[board.station] = DelayCounter()
+        for departure in board.departures:
+            counter.add(departure.delay, departure.cancelled, self.punctual)
+            seen = self.vehicles.get(departure.vehicle)
+            if seen is None or departure.time < seen[0]:
+                self.vehicles[departure.vehicle] = (departure.time, departure.delay,
+                                                    departure.cancelled, self._line(departure))
+
+    def _line(self, departure):
+        name = line_name(departure)
+        index = self._line_index.get(name)
+        if index is None:
+            index = self._line_index[name] = len(self.lines)
+            self.lines.append(name)
+        return index
+
+    def station_rows(self):
+        return sorted((counter.row("station", station) for station, counter in self.stations.items()),
+                      key=delay_order)
+
+    def line_rows(self):
+        counters = [DelayCounter() for _ in self.lines]
+        for _, delay, cancelled, line in self.vehicles.values():
+            counters[line].add(delay, cancelled, self.punctual)
+        return sorted((counter.row("line", name) for name, counter in zip(self.lines, counters)),
+                      key=delay_order)
+
+    def total(self):
+        counter = DelayCounter()
+        for _, delay, cancelled, _ in self.vehicles.values():
+            counter.add(delay, cancelled, self.punctual)
+        return counter
+
+
+def delay_order(row):
+    """
+    Most late trains first, then the
+    highest average delay.
+    """
+    return (-row["late"], -(row["average_delay"] or 0), row["group"])
+
+
+def sweep(stations, fetch, workers):
+    """
+    Call fetch for every station on a pool of
+    workers and yield the results as they finish.
+    At most twice as many stations as there are
+    workers are in flight, like in irail batch.
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    pending = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for station in stations:
+            pending.add(executor.submit(fetch, station))
+            while len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
@@ -0,0 +1,136 @@
+import csv
+import json
+import click
+
+try:
+    # Python 2: csv writes byte strings, which io.StringIO refuses.
+    from StringIO import StringIO
+    CSV_BYTES = True
+except ImportError:
+    from io import StringIO
+    CSV_BYTES = False
+
+
+FORMATS = ('text', 'json', 'ndjson', 'csv')
+BUFFER_SIZE = 64 * 1024
+
+
+class RowWriter(object):
+    """
+    Writes rows (dicts with a fixed set of fields)
+    as JSON, NDJSON or CSV, without any styling.
+    Output is collected in a buffer and written in
+    chunks of about BUFFER_SIZE characters instead
+    of once per row, unless flush_each_row is set:
+    rows that come from a stream are written as
+    soon as they arrive.
+    """
+
+    def __init__(self, format, fields, file=None, flush_each_row=False):
+        self.format = format
+        self.fields = fields
+        self.file = file
+        self.flush_each_row = flush_each_row
+        self.buffer = []
+        self.size = 0
+        self.rows = 0
+        if format == 'csv':
+            self._csv_buffer = StringIO()
+            self._csv = csv.writer(self._csv_buffer, lineterminator='\n')
+            self._write_csv(fields)
+        elif format == 'json':
+            self._append('[')
+
+    def _append(self, text):
+        self.buffer.append(text)
+        self.size += len(text)
+        if self.size >= BUFFER_SIZE:
+            self.flush()
+
+    def _write_csv(self, values):
+        if CSV_BYTES:
+            values = [value.encode('utf-8') if isinstance(value, type(u'')) else value
+                      for value in values]
+        self._csv.writerow(values)
+        text = self._csv_buffer.getvalue()
+        if CSV_BYTES:
+            text = text.decode('utf-8')
+        self._append(text)
+        self._csv_buffer.seek(0)
+        self._csv_buffer.truncate()
+
+    def write(self, row):
+        if self.format == 'csv':
+            self._write_csv([' '.join(value) if isinstance(value, list) else value
+                             for value in (row[field] for field in self.fields)])
+        elif self.format == 'json':
+            self._append((',\n' if self.rows else '\n') + json.dumps(row, separators=(',', ':')))
+        else:
+            self._append(json.dumps(row, separators=(',', ':')) + '\n')
+        self.rows += 1
+        if self.flush_each_row:
+            self.flush()
+
+    def write_all(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        if self.buffer:
+            click.echo(''.join(self.buffer), file=self.file, nl=False)
+            self.buffer = []
+            self.size = 0
+
+    def close(self):
+        if self.format == 'json':
+            self._append('\n]\n' if self.rows else ']\n')
+        self.flush()
+
+
+DEPARTURE_FIELDS = ['station', 'time', 'delay', 'cancelled', 'vehicle', 'type',
+                    'direction', 'platform', 'platform_changed']
+
+
+def departure_row(departure):
+    return {'station': departure.station,
+            'time': departure.time,
+            'delay': departure.delay,
+            'cancelled': departure.cancelled,
+            'vehicle': departure.vehicle,
+            'type': departure.vehicle_type,
+            'direction': departure.direction,
+            'platform': departure.platform.name,
+            'platform_changed': departure.platform.changed}
+
+
+CONNECTION_FIELDS = ['departure_station', 'departure_time', 'departure_delay', 'departure_platform',
+                     'arrival_station', 'arrival_time', 'arrival_delay', 'arrival_platform',
+                     'duration', 'changes', 'vehicles']
+
+
+def connection_row(connection):
+    departure, arrival = connection.departure, connection.arrival
+    return {'departure_station': departure.station,
+            'departure_time': departure.time,
+            'departure_delay': departure.delay,
+            'departure_platform': departure.platform.name,
+            'arrival_station': arrival.station,
+            'arrival_time': arrival.time,
+            'arrival_delay': arrival.delay,
+            'arrival_platform': arrival.platform.name,
+            'duration': connection.duration,
+            'changes': len(connection.vias),
+            'vehicles': [leg.vehicle for leg, _, _ in connection.legs]}
+
+
+STOP_FIELDS = ['vehicle', 'station', 'time', 'delay', 'cancelled', 'platform', 'left']
+
+
+def stop_row(vehicle, stop):
+    return {'vehicle': vehicle,
+            'station': stop.station,
+            'time': stop.time,
+            'delay': stop.delay,
+            'cancelled': stop.cancelled,
+            'platform': stop.platform.name,
+            'left': stop.left}
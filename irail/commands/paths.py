@@ -0,0 +1,21 @@
+import os
+import click
+
+
+def data_dir():
+    """
+    Directory where irail keeps its local data
+    (station catalogue, caches, ...). Can be
+    overridden with the IRAIL_HOME environment variable.
+    """
+    path = os.environ.get("IRAIL_HOME") or click.get_app_dir("irail")
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+    return path
+
+
+def data_path(name):
+    return os.path.join(data_dir(), name)
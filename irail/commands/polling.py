@@ -0,0 +1,33 @@
+MIN_INTERVAL = 30
+MAX_INTERVAL = 180
+BACKOFF = 1.5
+
+
+class AdaptivePoller(object):
+    """
+    Decides how long to wait before the next refresh.
+
+    After a change (or on the first poll) we poll at
+    the minimum interval; every poll that brings
+    nothing new backs the interval off. We never sleep
+    past the next expected event, so the board is
+    refreshed right after a train is supposed to leave.
+    Times are taken from the API response, not from
+    the local clock.
+    """
+
+    def __init__(self, minimum=MIN_INTERVAL, maximum=MAX_INTERVAL, backoff=BACKOFF):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.interval = minimum
+
+    def next_interval(self, changed, now, next_event=None):
+        if changed:
+            self.interval = self.minimum
+        else:
+            self.interval = min(self.interval * self.backoff, self.maximum)
+        interval = self.interval
+        if next_event is not None:
+            interval = min(interval, next_event - now)
+        return max(interval, self.minimum)
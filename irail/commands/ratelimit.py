@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from irail.commands.paths import data_path
+
+
+LOCK_FILE = "ratelimit.lock"
+
+# The iRail API asks clients to stay under 3 requests
+# per second, with short bursts of up to 5.
+RATE = 3.0
+BURST = 5
+
+MAX_BACKOFF = 60
+
+
+def parse_retry_after(value, now=None):
+    """
+    Seconds to wait according to a Retry-After
+    header, which holds either a number of seconds
+    or an HTTP date. None when it can't be parsed.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    from email.utils import parsedate_tz, mktime_tz
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(mktime_tz(parsed) - (now or time.time()), 0.0)
+
+
+class TokenBucket(object):
+    """
+    Token bucket limiting the requests we send to
+    the API. When given a path, the bucket lives in
+    that file and is shared, under an flock, by every
+    irail process on the machine, so a fleet of
+    dashboards and scripts stays under the limit as
+    a whole. Without a path, or without fcntl, it is
+    shared by the threads of this process only.
+
+    Besides the tokens, the bucket holds a moment
+    before which nobody may send a request, set when
+    the API tells us to back off.
+    """
+
+    def __init__(self, rate=RATE, burst=BURST, path=None, clock=time.time, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.path = path
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.state = (self.burst, clock(), 0.0)
+
+    def _read(self, f):
+        f.seek(0)
+        try:
+            tokens, updated, blocked = (float(value) for value in f.read().split())
+        except ValueError:
+            return self.burst, self.clock(), 0.0
+        return tokens, updated, blocked
+
+    def _write(self, f, state):
+        f.seek(0)
+        f.truncate()
+        f.write("{:.6f} {:.6f} {:.6f}".format(*state))
+        f.flush()
+
+    def _update(self, function):
+        """
+        Apply function(state, now) -> (state, result)
+        atomically, across processes when possible,
+        and return its result.
+        """
+        with self.lock:
+            if self.path is not None:
+                try:
+                    import fcntl
+                    f = open(self.path, "a+")
+                except (ImportError, IOError, OSError):
+                    pass
+                else:
+                    with f:
+                        fcntl.flock(f, fcntl.LOCK_EX)
+                        try:
+                            state, result = function(self._read(f), self.clock())
+                            self._write(f, state)
+                        finally:
+                            fcntl.flock(f, fcntl.LOCK_UN)
+                    return result
+            self.state, result = function(self.state, self.clock())
+            return result
+
+    def _take(self, state, now):
+        tokens, updated, blocked = state
+        tokens = min(self.burst, tokens + max(now - updated, 0) * self.rate)
+        if now < blocked:
+            return (tokens, now, blocked), blocked - now
+        if tokens >= 1:
+            return (tokens - 1, now, blocked), 0
+        return (tokens, now, blocked), (1 - tokens) / self.rate
+
+    def acquire(self):
+        """
+        Block until we may send a request.
+        Returns the number of seconds waited.
+        """
+        waited = 0.0
+        while True:
+            wait = self._update(self._take)
+            if not wait:
+                return waited
+            self.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds):
+        """
+        Hold back every request (in every process
+        sharing the bucket) for the next few seconds.
+        """
+        def block(state, now):
+            tokens, updated, blocked = state
+            return (tokens, updated, max(blocked, now + seconds)), None
+        self._update(block)
+
+
+def get_limiter():
+    """
+    The bucket shared by all irail processes, or None
+    when rate limiting is turned off with
+    IRAIL_RATE_LIMIT=0. IRAIL_RATE_LIMIT can also set
+    the number of requests per second.
+    """
+    setting = os.environ.get("IRAIL_RATE_LIMIT")
+    rate = RATE
+    if setting:
+        try:
+            rate = float(setting)
+        except ValueError:
+            rate = RATE
+    if rate <= 0:
+        return None
+    return TokenBucket(rate, max(BURST, rate), path=data_path(LOCK_FILE))
@@ -0,0 +1,272 @@
+"""
+Compact records for the iRail API payloads.
+
+Every payload is parsed once, in a single pass,
+into __slots__ records with integer epochs and
+delays, so that filtering, sorting and rendering
+don't have to dig through the nested JSON again.
+Station names and vehicle types repeat on almost
+every row, so they are interned.
+"""
+import re
+import sys
+
+try:
+    intern = sys.intern
+except AttributeError:
+    def intern(string):
+        return string
+
+_vehicle_pattern = re.compile(r'(?:BE.NMBS.)?([A-Z]{1,3})(\d{1,4})')
+_vehicles = {}
+
+
+def parse_vehicle(vehicle):
+    """
+    Split a vehicle id (BE.NMBS.IC504)
+    into its type and number (IC, 504).
+    Results are cached per vehicle id.
+    """
+    try:
+        return _vehicles[vehicle]
+    except KeyError:
+        pass
+    matches = _vehicle_pattern.match(vehicle)
+    if matches is None:
+        raise ValueError("{} is not a valid vehicle".format(vehicle))
+    parsed = (intern(matches.group(1)), matches.group(2))
+    _vehicles[vehicle] = parsed
+    return parsed
+
+
+class Platform(object):
+    __slots__ = ("name", "changed")
+
+    def __init__(self, name, changed=False):
+        self.name = name
+        self.changed = changed
+
+
+class Departure(object):
+    """
+    A vehicle leaving (or arriving at) a station
+    at a certain time. Used for liveboard rows and
+    for both ends of a connection or a via.
+    """
+    __slots__ = ("station", "time", "delay", "cancelled", "vehicle",
+                 "vehicle_type", "vehicle_number", "direction", "platform")
+
+    def __init__(self, station, time, delay, cancelled, vehicle, direction, platform):
+        self.station = station
+        self.time = time
+        self.delay = delay
+        self.cancelled = cancelled
+        self.vehicle = vehicle
+        if vehicle:
+            self.vehicle_type, self.vehicle_number = parse_vehicle(vehicle)
+        else:
+            self.vehicle_type, self.vehicle_number = "", ""
+        self.direction = direction
+        self.platform = platform
+
+    @property
+    def actual_time(self):
+        return self.time + self.delay
+
+
+class Via(object):
+    __slots__ = ("station", "arrival", "departure")
+
+    def __init__(self, station, arrival, departure):
+        self.station = station
+        self.arrival = arrival
+        self.departure = departure
+
+
+class Connection(object):
+    __slots__ = ("departure", "arrival", "duration", "vias")
+
+    def __init__(self, departure, arrival, duration, vias=()):
+        self.departure = departure
+        self.arrival = arrival
+        self.duration = duration
+        self.vias = vias
+
+    @property
+    def legs(self):
+        """
+        The parts of the connection travelled on a
+        single vehicle, as (vehicle, from, to) tuples
+        where vehicle is the Departure carrying the
+        vehicle id and direction.
+        """
+        vehicles = [self.departure] + [via.departure for via in self.vias]
+        stations = ([self.departure.station] + [via.station for via in self.vias] +
+                    [self.arrival.station])
+        return [(vehicle, stations[i], stations[i + 1]) for i, vehicle in enumerate(vehicles)]
+
+
+class Stop(object):
+    __slots__ = ("station", "time", "delay", "cancelled", "platform", "left")
+
+    def __init__(self, station, time, delay, cancelled, platform, left):
+        self.station = station
+        self.time = time
+        self.delay = delay
+        self.cancelled = cancelled
+        self.platform = platform
+        self.left = left
+
+    @property
+    def actual_time(self):
+        return self.time + self.delay
+
+
+class Liveboard(object):
+    __slots__ = ("station", "timestamp", "departures")
+
+    def __init__(self, station, timestamp, departures):
+        self.station = station
+        self.timestamp = timestamp
+        self.departures = departures
+
+
+class Vehicle(object):
+    __slots__ = ("vehicle", "timestamp", "stops")
+
+    def __init__(self, vehicle, timestamp, stops):
+        self.vehicle = vehicle
+        self.timestamp = timestamp
+        self.stops = stops
+
+
+def station_name(item):
+    try:
+        return intern(item["stationinfo"]["standardname"])
+    except KeyError:
+        return intern(item["station"])
+
+
+def parse_platform(item):
+    platforminfo = item.get("platforminfo")
+    if platforminfo is None:
+        return Platform(item.get("platform", ""))
+    return Platform(platforminfo["name"], platforminfo["normal"] != "1")
+
+
+def parse_delay(item):
+    """
+    Delay in seconds and whether the stop is cancelled.
+    Older responses signal a cancellation with
+    a delay of "cancel" instead of "canceled": "1".
+    """
+    delay = item.get("delay", "0")
+    if delay == "cancel":
+        return 0, True
+    return int(delay), item.get("canceled", "0") == "1"
+
+
+def parse_liveboard_departure(item, station):
+    delay, cancelled = parse_delay(item)
+    return Departure(station, int(item["time"]), delay, cancelled, item["vehicle"],
+                     station_name(item), parse_platform(item))
+
+
+def parse_connection_end(item, station, vehicle, direction):
+    delay, cancelled = parse_delay(item)
+    if "direction" in item:
+        direction = item["direction"]["name"]
+    return Departure(station, int(item["time"]), delay, cancelled,
+                     item.get("vehicle", vehicle), intern(direction), parse_platform(item))
+
+
+def parse_via(item):
+    station = station_name(item)
+    vehicle = item["vehicle"]
+    direction = item["direction"]["name"]
+    return Via(station,
+               parse_connection_end(item["arrival"], station, vehicle, direction),
+               parse_connection_end(item["departure"], station, vehicle, direction))
+
+
+def parse_connection(item):
+    departure, arrival = item["departure"], item["arrival"]
+    vias = ()
+    if "vias" in item:
+        vias = tuple(parse_via(via) for via in item["vias"]["via"])
+    return Connection(
+        parse_connection_end(departure, station_name(departure),
+                             departure["vehicle"], departure["direction"]["name"]),
+        parse_connection_end(arrival, station_name(arrival),
+                             arrival["vehicle"], arrival["direction"]["name"]),
+        int(item["duration"]),
+        vias)
+
+
+def parse_stop(item):
+    delay, cancelled = parse_delay(item)
+    return Stop(station_name(item), int(item["time"]), delay, cancelled,
+                parse_platform(item), item.get("left", "0") == "1")
+
+
+def parse_liveboard(json_data):
+    station = station_name(json_data)
+    try:
+        departures = json_data["departures"]["departure"]
+    except KeyError:
+        departures = []
+    return Liveboard(station, int(json_data["timestamp"]),
+                     [parse_liveboard_departure(item, station) for item in departures])
+
+
+def parse_connections(connections):
+    return [parse_connection(item) for item in connections]
+
+
+def parse_vehicle_journey(json_data):
+    try:
+        stops = json_data["stops"]["stop"]
+    except KeyError:
+        stops = []
+    return Vehicle(json_data["vehicle"], int(json_data["timestamp"]),
+                   [parse_stop(item) for item in stops])
+
+
+def stop_key(item):
+    """
+    The fields of a stop that can change while
+    a vehicle is running.
+    """
+    return (item.get("station"), item["time"], item.get("delay"), item.get("canceled"),
+            item.get("left"), item.get("platform"), item.get("platforminfo", {}).get("normal"))
+
+
+class JourneyTracker(object):
+    """
+    Parses successive responses for the same vehicle.
+    A stop that looks the same as in the previous
+    response keeps its Stop record; update returns
+    the journey and the indices of the stops that
+    were parsed anew.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.stops = []
+
+    def update(self, json_data):
+        try:
+            items = json_data["stops"]["stop"]
+        except KeyError:
+            items = []
+        keys, stops, changed = [], [], []
+        for index, item in enumerate(items):
+            key = stop_key(item)
+            if index < len(self.keys) and self.keys[index] == key:
+                stops.append(self.stops[index])
+            else:
+                stops.append(parse_stop(item))
+                changed.append(index)
+            keys.append(key)
+        self.keys, self.stops = keys, stops
+        return Vehicle(json_data["vehicle"], int(json_data["timestamp"]), stops), changed
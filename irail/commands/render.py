@@ -0,0 +1,114 @@
+"""
+Composing what the commands show on the terminal.
+
+A frame (a board, a route with its expansions, the
+stops of a vehicle) is put together in one buffer
+and written with a single call, instead of a
+click.echo per line: on a slow SSH link every write
+costs a round of packets. The escape sequences for
+each combination of styles and the column widths
+for each terminal width are worked out once.
+"""
+import click
+
+
+RESET = '\x1b[0m'
+
+_styles = {}
+_layouts = {}
+
+
+def style_sequence(**styles):
+    """
+    The escape sequence switching on these styles,
+    computed by click once per combination.
+    """
+    key = tuple(sorted(styles.items()))
+    try:
+        return _styles[key]
+    except KeyError:
+        sequence = _styles[key] = click.style("", reset=False, **styles)
+        return sequence
+
+
+def style(text, **styles):
+    """
+    Same as click.style, without working out the
+    escape sequence again for every cell.
+    """
+    return style_sequence(**styles) + text + RESET
+
+
+class Layout(object):
+    """
+    Widths of the columns of a row. Every column has
+    a fixed width except one (None), which gets what
+    is left of the terminal width.
+    """
+
+    def __init__(self, width, columns, separator=" "):
+        fixed = sum(column for column in columns if column is not None)
+        rest = width - fixed - len(separator) * (len(columns) - 1)
+        self.width = width
+        self.widths = tuple(max(rest, 0) if column is None else column for column in columns)
+        self.separator = separator
+
+    def row(self, cells):
+        """
+        A table row: the first cell is cut to its
+        column and left-aligned, the others are
+        right-aligned (counts and minutes).
+        """
+        widths = self.widths
+        return (cells[0][:widths[0]].ljust(widths[0]) + self.separator +
+                self.separator.join(cell.rjust(width) for cell, width in zip(cells[1:], widths[1:])))
+
+
+def format_minutes(seconds):
+    """
+    A delay in seconds as minutes with one decimal,
+    or - when there is none.
+    """
+    return "-" if seconds is None else "{:.1f}".format(seconds / 60.0)
+
+
+def layout(width, columns, separator=" "):
+    """
+    The layout of these columns for a terminal width,
+    computed once per width.
+    """
+    key = (width, tuple(columns), separator)
+    try:
+        return _layouts[key]
+    except KeyError:
+        result = _layouts[key] = Layout(width, columns, separator)
+        return result
+
+
+class Frame(object):
+    """
+    Buffer for the output of a command. Lines are
+    collected until flush writes them out at once;
+    the buffer is kept for the next frame.
+    """
+
+    def __init__(self, file=None):
+        self.file = file
+        self.parts = []
+
+    def write(self, text, **styles):
+        self.parts.append(style(text, **styles) if styles else text)
+
+    def line(self, text="", **styles):
+        self.write(text, **styles)
+        self.parts.append("\n")
+
+    def lines(self, lines):
+        for line in lines:
+            self.parts.append(line)
+            self.parts.append("\n")
+
+    def flush(self):
+        if self.parts:
+            click.echo("".join(self.parts), file=self.file, nl=False)
+            del self.parts[:]
@@ -0,0 +1,68 @@
+import click
+
+
+ERASE_LINE = '\x1b[2K'
+CURSOR_UP = '\x1b[{}F'
+
+
+class Screen(object):
+    """
+    Keeps the frame that is currently on the terminal,
+    so a refresh only rewrites the rows that changed:
+    a new delay, a platform change, a cancellation or
+    trains moving up once one has departed.
+
+    The cursor is expected to sit on the line right
+    below the previous frame. Every update is sent to
+    the terminal in a single write.
+    """
+
+    def __init__(self, file=None):
+        self.file = file
+        self.previous = []
+        self.buffer = []
+
+    def changed_rows(self, lines):
+        """
+        Indices of the rows that differ between the
+        previous frame and the new one, including rows
+        that have to be cleared because the new frame
+        is shorter.
+        """
+        previous = self.previous
+        return [row for row in range(max(len(lines), len(previous)))
+                if row >= len(lines) or row >= len(previous) or lines[row] != previous[row]]
+
+    def render(self, lines):
+        """
+        Return the escape sequences and text
+        turning the previous frame into this one.
+        """
+        if not self.previous:
+            return "".join(line + "\n" for line in lines)
+
+        changed = set(self.changed_rows(lines))
+        if not changed:
+            return ""
+        top = min(changed)
+        height = max(len(lines), len(self.previous))
+        out = self.buffer
+        del out[:]
+        if top < len(self.previous):
+            # \x1b[0F moves up a line as well, so only when rows above changed.
+            out.append(CURSOR_UP.format(len(self.previous) - top))
+        for row in range(top, height):
+            if row in changed:
+                out.append(ERASE_LINE)
+                if row < len(lines):
+                    out.append(lines[row])
+            out.append("\n")
+        if height > len(lines):
+            out.append(CURSOR_UP.format(height - len(lines)))
+        return "".join(out)
+
+    def update(self, lines):
+        output = self.render(lines)
+        if output:
+            click.echo(output, file=self.file, nl=False)
+        self.previous = list(lines)
@@ -0,0 +1,54 @@
+import threading
+
+
+class _Call(object):
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """
+    Coalesces identical calls that are in flight at
+    the same time: the first caller for a key does the
+    work, everyone who asks for the same key before it
+    is done waits for it and gets the same result (or
+    the same exception).
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, function, *args):
+        """
+        Return function(*args), or the result of the
+        identical call already running. The second value
+        tells whether the result was shared.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+            else:
+                call.waiters += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = function(*args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result, False
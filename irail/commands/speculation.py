@@ -0,0 +1,56 @@
+from irail.commands.trace import tracer
+
+
+class Speculation(object):
+    """
+    Starts a call early, on the arguments we expect
+    it to get, while they are still being confirmed
+    (e.g. by the user picking a station). When the
+    call is then made with those arguments, it is
+    already under way; with other arguments, the
+    guess is dropped and the call made anew.
+
+    The guess runs guess(*arguments), which should
+    not print or exit: whatever goes wrong in it,
+    function(*arguments) is called instead and
+    reports the problem as usual.
+    """
+
+    def __init__(self, function, guess=None):
+        self.function = function
+        self.guess = guess or function
+        self.arguments = None
+        self.future = None
+        self.executor = None
+
+    def start(self, *arguments):
+        if arguments == self.arguments:
+            return
+        if self.executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.executor = ThreadPoolExecutor(max_workers=2)
+        if self.future is not None:
+            self.future.cancel()
+        tracer.count("speculation.started")
+        self.arguments = arguments
+        self.future = self.executor.submit(self.guess, *arguments)
+
+    def call(self, *arguments):
+        if self.future is not None:
+            if arguments == self.arguments:
+                try:
+                    result = self.future.result()
+                except Exception:
+                    tracer.count("speculation.failed")
+                else:
+                    tracer.count("speculation.hit")
+                    return result
+            else:
+                tracer.count("speculation.miss")
+        return self.function(*arguments)
+
+    def shutdown(self):
+        if self.executor is not None:
+            if self.future is not None:
+                self.future.cancel()
+            self.executor.shutdown(wait=False)
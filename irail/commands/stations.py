@@ -0,0 +1,190 @@
+import bisect
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from irail.commands.client import get_client, APIError
+from irail.commands.paths import data_path
+
+
+CATALOGUE_FILE = "stations.json"
+MAX_AGE = 7 * 24 * 3600
+FUZZY_THRESHOLD = 0.3
+MAX_FUZZY_RESULTS = 10
+
+_separators = re.compile(r"[\s\-/'.()]+")
+
+
+def normalize(name):
+    """
+    Lowercase a station name, strip accents and
+    collapse separators, so that "Liège-Guillemins",
+    "liege guillemins" and "LIEGE-GUILLEMINS" all
+    end up as the same key.
+    """
+    if not isinstance(name, type(u"")):
+        name = name.decode("utf-8")
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = u"".join(c for c in decomposed if not unicodedata.combining(c))
+    return _separators.sub(u" ", stripped.lower()).strip()
+
+
+def trigrams(key):
+    padded = u"  " + key + u" "
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def alternative_names(station):
+    """
+    The iRail station list gives the translations
+    either as a single {"@language", "@value"} object
+    or as a list of them.
+    """
+    alternatives = station.get("alternative", [])
+    if isinstance(alternatives, dict):
+        alternatives = [alternatives]
+    return [a["@value"] for a in alternatives]
+
+
+class StationCatalogue(object):
+    """
+    Local copy of the full NMBS station list with
+    an index for resolving user input without
+    touching the network.
+
+    Every station is indexed under its normalized
+    name, its translations and every word suffix
+    ("gent sint pieters", "sint pieters", "pieters"),
+    in one sorted list, so a prefix lookup is a
+    single bisect. A trigram index is only built
+    when nothing matches and we fall back to fuzzy
+    matching.
+    """
+
+    def __init__(self, stations, fetched=None):
+        # stations: list of [id, name, [alternative names]]
+        self.stations = stations
+        self.fetched = fetched or time.time()
+        self._keys = []
+        self._exact = {}
+        self._trigrams = None
+        for index, (_, name, alternatives) in enumerate(stations):
+            for full_name in [name] + alternatives:
+                key = normalize(full_name)
+                self._exact.setdefault(key, index)
+                words = key.split(u" ")
+                for i in range(len(words)):
+                    self._keys.append((u" ".join(words[i:]), i, index))
+        self._keys.sort()
+
+    @classmethod
+    def from_graph(cls, graph):
+        return cls([[s["@id"], s["name"], alternative_names(s)] for s in graph])
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["stations"], data["fetched"])
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"fetched": self.fetched, "stations": self.stations},
+                      f, separators=(",", ":"))
+        os.rename(tmp, path)
+
+    def is_stale(self, max_age=MAX_AGE):
+        return time.time() - self.fetched > max_age
+
+    def as_suggestion(self, index):
+        station_id, name, _ = self.stations[index]
+        return {"@id": station_id, "name": name}
+
+    def _prefix_matches(self, key):
+        start = bisect.bisect_left(self._keys, (key,))
+        ranked = {}
+        for i in range(start, len(self._keys)):
+            candidate, word_position, index = self._keys[i]
+            if not candidate.startswith(key):
+                break
+            rank = (word_position, self.stations[index][1])
+            if index not in ranked or rank < ranked[index]:
+                ranked[index] = rank
+        return sorted(ranked, key=ranked.get)
+
+    def _fuzzy_matches(self, key):
+        if self._trigrams is None:
+            self._trigrams = {}
+            for name_key, index in self._exact.items():
+                for trigram in trigrams(name_key):
+                    self._trigrams.setdefault(trigram, set()).add((name_key, index))
+        wanted = trigrams(key)
+        overlap = {}
+        for trigram in wanted:
+            for entry in self._trigrams.get(trigram, ()):
+                overlap[entry] = overlap.get(entry, 0) + 1
+        scores = {}
+        for (name_key, index), shared in overlap.items():
+            score = float(shared) / len(wanted | trigrams(name_key))
+            if score >= FUZZY_THRESHOLD and score > scores.get(index, 0):
+                scores[index] = score
+        ranked = sorted(scores, key=lambda index: (-scores[index], self.stations[index][1]))
+        return ranked[:MAX_FUZZY_RESULTS]
+
+    def search(self, query):
+        """
+        Return the stations matching the query,
+        best match first, in the same shape as the
+        "@graph" entries of the remote station search.
+        An exact match (in any language) wins outright.
+        """
+        key = normalize(query)
+        if not key:
+            return []
+        if key in self._exact:
+            return [self.as_suggestion(self._exact[key])]
+        matches = self._prefix_matches(key) or self._fuzzy_matches(key)
+        return [self.as_suggestion(index) for index in matches]
+
+
+def download_catalogue():
+    json_data = get_client().get_json("station", {"format": "json"})
+    return StationCatalogue.from_graph(json_data["@graph"])
+
+
+_catalogue = None
+_catalogue_lock = threading.Lock()
+
+
+def get_catalogue(path=None):
+    """
+    Return the local station catalogue, downloading
+    it when it is missing and refreshing it when it
+    is older than MAX_AGE. A stale catalogue is still
+    used when the refresh fails. Returns None when
+    there is no catalogue and it cannot be downloaded.
+    """
+    with _catalogue_lock:
+        return _get_catalogue(path)
+
+
+def _get_catalogue(path):
+    global _catalogue
+    if _catalogue is not None and not _catalogue.is_stale():
+        return _catalogue
+    path = path or data_path(CATALOGUE_FILE)
+    if _catalogue is None and os.path.exists(path):
+        try:
+            _catalogue = StationCatalogue.load(path)
+        except (ValueError, KeyError, IOError):
+            _catalogue = None
+    if _catalogue is None or _catalogue.is_stale():
+        try:
+            _catalogue = download_catalogue()
+        except APIError:
+            return _catalogue
+        _catalogue.save(path)
+    return _catalogue
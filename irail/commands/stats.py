@@ -0,0 +1,184 @@
+"""
+Punctuality and delay statistics over the delay
+history (see history.py), computed with numpy on
+the memory-mapped columns: no loop in Python runs
+once per observation.
+"""
+from datetime import datetime
+from irail.commands.history import CANCELLED
+from irail.commands.records import parse_vehicle
+from irail.commands.stations import normalize
+from irail.commands.times import formatter
+
+
+GROUPS = ("station", "line", "hour", "vehicle")
+PERCENTILES = (50, 90, 99)
+# Infrabel counts a train as on time when it is less than 6 minutes late.
+PUNCTUAL = 6 * 60
+
+STATS_FIELDS = ["group", "observations", "punctuality", "cancelled"] + \
+    ["delay_p{}".format(p) for p in PERCENTILES]
+
+
+def combined_key(columns):
+    """
+    Fold integer columns into one int64 key that
+    sorts like the columns would one after the other,
+    which sorts much faster than numpy.lexsort. None
+    when the ranges of the columns don't fit.
+    """
+    import numpy
+    key = numpy.zeros(len(columns[0]), dtype=numpy.int64)
+    span = 1
+    for column in reversed(columns):
+        low, high = int(column.min()), int(column.max())
+        key += (column.astype(numpy.int64) - low) * span
+        span *= high - low + 1
+        if span >= 2 ** 62:
+            return None
+    return key
+
+
+def latest_observations(columns):
+    """
+    Indices of the last observation of every
+    departure (scheduled time, station, vehicle).
+    Observations are appended as they are made, so
+    the last one in the files is the latest.
+    """
+    import numpy
+    if not len(columns["time"]):
+        return numpy.zeros(0, dtype=numpy.int64)
+    key = combined_key([columns["time"], columns["station"], columns["vehicle"]])
+    if key is None:
+        # lexsort is stable: observations of a departure stay in the order they were made.
+        order = numpy.lexsort((columns["vehicle"], columns["station"], columns["time"]))
+        times, stations, vehicles = (columns[name][order] for name in ("time", "station", "vehicle"))
+        last = numpy.ones(len(order), dtype=bool)
+        last[:-1] = ((times[1:] != times[:-1]) | (stations[1:] != stations[:-1]) |
+                     (vehicles[1:] != vehicles[:-1]))
+        return order[last]
+    _, first_of_reversed = numpy.unique(key[::-1], return_index=True)
+    return len(key) - 1 - first_of_reversed
+
+
+def local_hours(times):
+    """
+    Hour of the day in Brussels of every epoch. The
+    UTC offset is looked up once per distinct hour.
+    """
+    import numpy
+    hours, inverse = numpy.unique(times // 3600, return_inverse=True)
+    zone = formatter.zone
+    offsets = numpy.array([datetime.fromtimestamp(int(hour) * 3600, zone).utcoffset().total_seconds()
+                           for hour in hours], dtype=numpy.int64)
+    return ((times + offsets[inverse.ravel()]) // 3600) % 24
+
+
+def vehicle_type(vehicle):
+    try:
+        return parse_vehicle(vehicle)[0]
+    except ValueError:
+        return "?"
+
+
+def group_keys(by, columns, names):
+    """
+    The group of every observation, as integer keys,
+    and a function naming a key. A line is a train
+    type with its destination (IC to Oostende).
+    """
+    import numpy
+    if by == "station":
+        return columns["station"], lambda key: names["stations"][key]
+    if by == "vehicle":
+        return columns["vehicle"], lambda key: names["vehicles"][key]
+    if by == "hour":
+        return local_hours(columns["time"]), lambda key: "{:02d}:00".format(key)
+    types = sorted(set(vehicle_type(name) for name in names["vehicles"]))
+    type_of_vehicle = numpy.array([types.index(vehicle_type(name))
+                                   for name in names["vehicles"]], dtype=numpy.int64)
+    stride = max(len(names["stations"]), 1)
+    keys = type_of_vehicle[columns["vehicle"]] * stride + columns["direction"]
+    return keys, lambda key: "{} to {}".format(types[key // stride], names["stations"][key % stride])
+
+
+def grouped_percentiles(groups, values, counts, percentiles):
+    """
+    Percentiles (with linear interpolation, like
+    numpy.percentile) of the values in every group,
+    for all groups at once: sort by group then value,
+    and read each percentile at its position within
+    the group. NaN for empty groups.
+    """
+    import numpy
+    key = combined_key([groups, values]) if len(values) else None
+    if key is not None:
+        low = int(values.min())
+        ordered = (numpy.sort(key) % (int(values.max()) - low + 1) + low).astype(numpy.float64)
+    else:
+        ordered = values[numpy.lexsort((values, groups))].astype(numpy.float64)
+    starts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+    result = []
+    for percentile in percentiles:
+        position = starts + (counts - 1) * (percentile / 100.0)
+        low = numpy.floor(position).astype(numpy.int64)
+        high = numpy.ceil(position).astype(numpy.int64)
+        empty = counts == 0
+        low[empty] = high[empty] = 0
+        if len(ordered):
+            value = ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+        else:
+            value = numpy.zeros(len(counts))
+        value[empty] = numpy.nan
+        result.append(value)
+    return result
+
+
+def delay_stats(columns, names, by="station", since=None, station=None,
+                percentiles=PERCENTILES, punctual=PUNCTUAL):
+    """
+    One row per group: the number of departures,
+    the share that ran on time and the share that
+    was cancelled, and percentiles of the delay of
+    the ones that ran. Rows are sorted by number
+    of departures.
+    """
+    import numpy
+    selected = latest_observations(columns)
+    if since is not None:
+        selected = selected[columns["time"][selected] >= since]
+    if station is not None:
+        wanted = [i for i, name in enumerate(names["stations"]) if normalize(name) == normalize(station)]
+        selected = selected[numpy.isin(columns["station"][selected], wanted)]
+    if not len(selected):
+        return []
+    columns = dict((name, numpy.asarray(column)[selected]) for name, column in columns.items())
+    keys, label = group_keys(by, columns, names)
+    groups, inverse = numpy.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+    cancelled = (columns["flags"] & CANCELLED) != 0
+    ran = ~cancelled
+    total = numpy.bincount(inverse, minlength=len(groups))
+    cancellations = numpy.bincount(inverse, weights=cancelled, minlength=len(groups))
+    ran_groups, ran_delays = inverse[ran], columns["delay"][ran]
+    ran_total = numpy.bincount(ran_groups, minlength=len(groups))
+    on_time = numpy.bincount(ran_groups, weights=ran_delays < punctual, minlength=len(groups))
+    delays = grouped_percentiles(ran_groups, ran_delays, ran_total, percentiles)
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        punctuality = on_time / ran_total
+    rows = []
+    for index in numpy.argsort(-total, kind="stable"):
+        row = {"group": label(int(groups[index])),
+               "observations": int(total[index]),
+               "punctuality": none_if_nan(punctuality[index]),
+               "cancelled": float(cancellations[index] / total[index])}
+        for percentile, values in zip(percentiles, delays):
+            row["delay_p{}".format(percentile)] = none_if_nan(values[index])
+        rows.append(row)
+    return rows
+
+
+def none_if_nan(value):
+    value = float(value)
+    return None if value != value else value
@@ -0,0 +1,139 @@
+import json
+
+
+WHITESPACE = " \t\n\r"
+
+_ARRAY_START = object()
+
+
+class JSONStream(object):
+    """
+    Decodes a JSON object that arrives in text chunks
+    and yields the items of one nested array (e.g.
+    departures.departure) as soon as each of them is
+    complete, so rendering can start before the whole
+    response has been received.
+
+    The scalar and object values at the top level
+    before the array (timestamp, stationinfo, ...) are
+    collected in `header`. Everything that has been
+    decoded is dropped from the buffer, so memory use
+    doesn't grow with the size of the response.
+    """
+
+    def __init__(self, chunks, path):
+        self.chunks = iter(chunks)
+        self.path = tuple(path)
+        self.header = {}
+        self.buffer = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+        self._items = self._document()
+        self._started = False
+
+    def _fill(self):
+        for chunk in self.chunks:
+            if chunk:
+                self.buffer = self.buffer[self.pos:] + chunk
+                self.pos = 0
+                return True
+        return False
+
+    def _skip_whitespace(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def _next_char(self):
+        self._skip_whitespace()
+        char = self.buffer[self.pos]
+        self.pos += 1
+        return char
+
+    def _expect(self, expected):
+        char = self._next_char()
+        if char != expected:
+            raise ValueError("Expected {!r} but got {!r}".format(expected, char))
+
+    def _value(self):
+        """
+        Decode the next complete value. A value that
+        runs up to the end of the buffer may be cut
+        off (think of a number), so we only trust it
+        once more data has arrived or the stream ended.
+        """
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if not self._fill():
+                    raise
+                continue
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def _document(self):
+        self._expect("{")
+        for item in self._object(self.path, top=True):
+            yield item
+
+    def _object(self, path, top=False):
+        if self._next_char() == "}":
+            return
+        self.pos -= 1
+        while True:
+            key = self._value()
+            self._expect(":")
+            if path and key == path[0]:
+                if len(path) == 1:
+                    self._expect("[")
+                    yield _ARRAY_START
+                    for item in self._array():
+                        yield item
+                else:
+                    self._expect("{")
+                    for item in self._object(path[1:]):
+                        yield item
+            else:
+                value = self._value()
+                if top:
+                    self.header[key] = value
+            char = self._next_char()
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError("Expected ',' or '}}' but got {!r}".format(char))
+
+    def _array(self):
+        if self._next_char() == "]":
+            return
+        self.pos -= 1
+        while True:
+            yield self._value()
+            char = self._next_char()
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError("Expected ',' or ']' but got {!r}".format(char))
+
+    def read_header(self):
+        """
+        Read up to the start of the array and return
+        the header collected so far.
+        """
+        if not self._started:
+            self._started = True
+            for item in self._items:
+                break
+        return self.header
+
+    def __iter__(self):
+        self.read_header()
+        return self._items
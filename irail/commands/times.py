@@ -0,0 +1,124 @@
+import calendar
+import time
+from datetime import datetime
+
+
+TIMEZONE = 'Europe/Brussels'
+TIME_FORMAT = "%H:%M"
+DATE_TIME_FORMAT = "%H:%M (%d/%m/%Y)"
+# How dates and times are passed to the API (and the route options).
+QUERY_DATE_FORMAT = "%d%m%y"
+QUERY_TIME_FORMAT = "%H%M"
+
+# Above this many timestamps, format_many uses numpy when it is installed.
+VECTORIZE_THRESHOLD = 1000
+MAX_CACHED = 10000
+
+
+class TimeFormatter(object):
+    """
+    Turns epoch timestamps into Brussels wall-clock
+    strings. The timezone is looked up once, and
+    since we only show minutes, the result for every
+    minute is computed once and cached.
+    """
+
+    def __init__(self, timezone=TIMEZONE):
+        self.timezone_name = timezone
+        self._zone = None
+        self._cache = {}
+
+    @property
+    def zone(self):
+        if self._zone is None:
+            import pytz
+            self._zone = pytz.timezone(self.timezone_name)
+        return self._zone
+
+    def epoch(self, year, month, day, seconds=0):
+        """
+        Epoch of a wall-clock time in Brussels, given as
+        seconds since noon minus 12 hours on that day
+        (like GTFS does), so that times past midnight
+        (25:10) and days with a DST change work out.
+        """
+        noon = self.zone.localize(datetime(year, month, day, 12))
+        return calendar.timegm(noon.utctimetuple()) - 12 * 3600 + seconds
+
+    def format(self, timestamp, include_date=False):
+        minute = int(timestamp) // 60
+        key = (minute, include_date)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        text = (datetime.fromtimestamp(minute * 60, self.zone)
+                        .strftime(DATE_TIME_FORMAT if include_date else TIME_FORMAT))
+        if len(self._cache) >= MAX_CACHED:
+            self._cache.clear()
+        self._cache[key] = text
+        return text
+
+    def format_many(self, timestamps, include_date=False):
+        """
+        Format a whole list of timestamps (ints or
+        epoch strings) in one pass. Large inputs are
+        handed to numpy when it is available.
+        """
+        if len(timestamps) >= VECTORIZE_THRESHOLD:
+            try:
+                return self._format_vectorized(timestamps, include_date)
+            except ImportError:
+                pass
+        format = self.format
+        return [format(timestamp, include_date) for timestamp in timestamps]
+
+    def _format_vectorized(self, timestamps, include_date):
+        """
+        Bucket all timestamps per minute with numpy,
+        format every distinct minute once and spread
+        the results back over the input.
+        """
+        import numpy
+        minutes = numpy.asarray(timestamps, dtype=numpy.int64) // 60
+        unique, inverse = numpy.unique(minutes, return_inverse=True)
+        texts = numpy.array([self.format(minute * 60, include_date) for minute in unique.tolist()],
+                            dtype=object)
+        return texts[inverse.ravel()].tolist()
+
+
+formatter = TimeFormatter()
+
+
+def parse_date(date):
+    """
+    A DDMMYY string as a date (today when empty).
+    """
+    if not date:
+        return datetime.now(formatter.zone).date()
+    return datetime.strptime(date, QUERY_DATE_FORMAT).date()
+
+
+def query_time(date=None, time_of_day=None):
+    """
+    Epoch for the --date (DDMMYY) and --time (HHMM)
+    options of route, defaulting to now.
+    """
+    if not date and not time_of_day:
+        return int(time.time())
+    day = parse_date(date)
+    if time_of_day:
+        seconds = int(time_of_day[:2]) * 3600 + int(time_of_day[2:]) * 60
+    else:
+        now = datetime.now(formatter.zone)
+        seconds = now.hour * 3600 + now.minute * 60
+    return formatter.epoch(day.year, day.month, day.day, seconds)
+
+
+def query_parameters(epoch):
+    """
+    The date (DDMMYY) and time (HHMM) to
+    ask the API for at a given epoch.
+    """
+    moment = datetime.fromtimestamp(epoch, formatter.zone)
+    return moment.strftime(QUERY_DATE_FORMAT), moment.strftime(QUERY_TIME_FORMAT)
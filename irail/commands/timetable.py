@@ -0,0 +1,478 @@
+"""
+Offline route planning over a local timetable.
+
+The timetable is a flat array of elementary
+connections (one vehicle going from one stop to the
+next), sorted by departure time and stored column by
+column. It is built from the vehicle responses in the
+response cache or imported from a GTFS feed. Routes
+are planned with the Connection Scan Algorithm: one
+pass over the array from the requested time answers
+an earliest-arrival query, one pass backwards by
+arrival time a latest-departure query.
+
+Planned routes are returned in the format of the
+`connections` API endpoint, so they go through the
+same parsing and rendering as the real thing.
+"""
+import array
+import bisect
+import csv
+import io
+import json
+import os
+import time
+from datetime import timedelta
+from irail.commands.paths import data_path
+from irail.commands.records import parse_vehicle
+from irail.commands.stations import normalize
+from irail.commands.times import formatter
+
+
+TIMETABLE_DIR = "timetable"
+COLUMNS = ("departure", "arrival", "origin", "destination", "trip",
+           "departure_platform", "arrival_platform")
+TYPECODE = "l"
+
+# Seconds needed to change trains in a station.
+MIN_CHANGE = 120
+MAX_RESULTS = 6
+
+INFINITY = float("inf")
+
+# Column with the station at either end of a connection.
+STATION_COLUMNS = {"departure": "origin", "arrival": "destination"}
+
+
+class TimetableBuilder(object):
+    """
+    Collects trips (a vehicle with its stops and
+    times) and turns them into a Timetable. The same
+    trip can be added more than once, e.g. from two
+    cached responses for the same vehicle.
+    """
+
+    def __init__(self, source=""):
+        self.source = source
+        self.stations = []
+        self.trips = []
+        self.platforms = [""]
+        self.rows = []
+        self._stations = {}
+        self._platforms = {"": 0}
+        self._seen = set()
+
+    def _station(self, name):
+        index = self._stations.get(name)
+        if index is None:
+            index = self._stations[name] = len(self.stations)
+            self.stations.append(name)
+        return index
+
+    def _platform(self, name):
+        index = self._platforms.get(name)
+        if index is None:
+            index = self._platforms[name] = len(self.platforms)
+            self.platforms.append(name)
+        return index
+
+    def add_trip(self, vehicle, stops, direction=None):
+        """
+        Add a trip given as a list of (station,
+        arrival, departure, platform) tuples.
+        """
+        if len(stops) < 2:
+            return
+        key = (vehicle, stops[0][2])
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        trip = len(self.trips)
+        self.trips.append([vehicle, direction or stops[-1][0]])
+        for (station, _, departure, platform), (next_station, arrival, _, next_platform) \
+                in zip(stops, stops[1:]):
+            if arrival < departure:
+                continue
+            self.rows.append((departure, arrival, self._station(station),
+                              self._station(next_station), trip,
+                              self._platform(platform), self._platform(next_platform)))
+
+    def add_vehicle_response(self, json_data):
+        """
+        Add the trip in a `vehicle` API response.
+        Cancelled stops are left out and the planned
+        times are used, without delays.
+        """
+        try:
+            items = json_data["stops"]["stop"]
+            vehicle = json_data["vehicle"]
+            parse_vehicle(vehicle)
+        except (KeyError, TypeError, ValueError):
+            return
+        stops = []
+        for item in items:
+            if item.get("canceled", "0") == "1":
+                continue
+            scheduled = int(item["time"])
+            platform = item.get("platforminfo", {}).get("name", item.get("platform", ""))
+            name = item.get("stationinfo", {}).get("standardname", item.get("station"))
+            stops.append((name,
+                          int(item.get("scheduledArrivalTime", scheduled)),
+                          int(item.get("scheduledDepartureTime", scheduled)),
+                          platform))
+        self.add_trip(vehicle, stops)
+
+    def build(self):
+        self.rows.sort()
+        columns = dict((name, array.array(TYPECODE, (row[i] for row in self.rows)))
+                       for i, name in enumerate(COLUMNS))
+        return Timetable(self.stations, self.trips, self.platforms, columns,
+                         source=self.source)
+
+
+class Timetable(object):
+
+    def __init__(self, stations, trips, platforms, columns, built=None, source=""):
+        self.stations = stations
+        self.trips = trips
+        self.platforms = platforms
+        self.columns = columns
+        self.built = built or time.time()
+        self.source = source
+        self._index = dict((normalize(name), i) for i, name in enumerate(stations))
+        self._arrival_order = None
+        self._sorted_arrivals = None
+
+    def __len__(self):
+        return len(self.columns["departure"])
+
+    def save(self, directory):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name in COLUMNS:
+            with open(os.path.join(directory, name + ".bin"), "wb") as f:
+                self.columns[name].tofile(f)
+        meta = os.path.join(directory, "meta.json")
+        with open(meta + ".tmp", "w") as f:
+            json.dump({"built": self.built, "source": self.source, "stations": self.stations,
+                       "trips": self.trips, "platforms": self.platforms,
+                       "connections": len(self)}, f, separators=(",", ":"))
+        os.rename(meta + ".tmp", meta)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        columns = {}
+        for name in COLUMNS:
+            column = array.array(TYPECODE)
+            with open(os.path.join(directory, name + ".bin"), "rb") as f:
+                column.fromfile(f, meta["connections"])
+            columns[name] = column
+        return cls(meta["stations"], meta["trips"], meta["platforms"], columns,
+                   meta["built"], meta["source"])
+
+    def find_station(self, name):
+        return self._index.get(normalize(name))
+
+    def first_departure(self):
+        return self.columns["departure"][0] if len(self) else None
+
+    def last_arrival(self):
+        return max(self.columns["arrival"]) if len(self) else None
+
+    def earliest_arrival(self, origin, destination, departure_time):
+        """
+        The legs, as (board, alight) connection indices,
+        of a journey leaving origin at departure_time
+        or later and getting to destination as early as
+        possible. None when there is no such journey.
+        """
+        departures, arrivals = self.columns["departure"], self.columns["arrival"]
+        origins, destinations = self.columns["origin"], self.columns["destination"]
+        trips = self.columns["trip"]
+        earliest = {origin: departure_time}
+        boarded = {}
+        reached_by = {}
+        for i in range(bisect.bisect_left(departures, departure_time), len(departures)):
+            if departures[i] >= earliest.get(destination, INFINITY):
+                break
+            trip = trips[i]
+            if trip not in boarded:
+                station = origins[i]
+                ready = earliest.get(station)
+                if ready is None:
+                    continue
+                if station != origin:
+                    ready += MIN_CHANGE
+                if departures[i] < ready:
+                    continue
+                boarded[trip] = i
+            station = destinations[i]
+            if arrivals[i] < earliest.get(station, INFINITY):
+                earliest[station] = arrivals[i]
+                reached_by[station] = (boarded[trip], i)
+        if destination not in reached_by:
+            return None
+        legs = []
+        station = destination
+        while station != origin:
+            board, alight = reached_by[station]
+            legs.append((board, alight))
+            station = origins[board]
+        return legs[::-1]
+
+    def latest_departure(self, origin, destination, arrival_time):
+        """
+        The legs of a journey getting to destination
+        at arrival_time or earlier and leaving origin
+        as late as possible. None when there is none.
+        """
+        departures, arrivals = self.columns["departure"], self.columns["arrival"]
+        origins, destinations = self.columns["origin"], self.columns["destination"]
+        trips = self.columns["trip"]
+        if self._arrival_order is None:
+            self._arrival_order = sorted(range(len(self)), key=arrivals.__getitem__)
+            self._sorted_arrivals = [arrivals[i] for i in self._arrival_order]
+        order, sorted_arrivals = self._arrival_order, self._sorted_arrivals
+        latest = {destination: arrival_time}
+        alighted = {}
+        leaves_by = {}
+        for position in range(bisect.bisect_right(sorted_arrivals, arrival_time) - 1, -1, -1):
+            i = order[position]
+            if arrivals[i] <= latest.get(origin, -INFINITY):
+                break
+            trip = trips[i]
+            if trip not in alighted:
+                station = destinations[i]
+                deadline = latest.get(station)
+                if deadline is None:
+                    continue
+                if station != destination:
+                    deadline -= MIN_CHANGE
+                if arrivals[i] > deadline:
+                    continue
+                alighted[trip] = i
+            station = origins[i]
+            if departures[i] > latest.get(station, -INFINITY):
+                latest[station] = departures[i]
+                leaves_by[station] = (i, alighted[trip])
+        if origin not in leaves_by:
+            return None
+        legs = []
+        station = origin
+        while station != destination:
+            board, alight = leaves_by[station]
+            legs.append((board, alight))
+            station = destinations[alight]
+        return legs
+
+    def journeys(self, origin, destination, moment, selection="depart", count=MAX_RESULTS):
+        """
+        Up to count journeys leaving after (or, with
+        selection "arrive", arriving before) moment.
+        Every journey found is tightened with a query
+        in the other direction, so it doesn't leave
+        earlier (or arrive later) than it has to.
+        """
+        journeys = []
+        while len(journeys) < count:
+            if selection == "arrive":
+                legs = self.latest_departure(origin, destination, moment)
+                if legs is None:
+                    break
+                legs = self.earliest_arrival(origin, destination,
+                                             self.columns["departure"][legs[0][0]]) or legs
+                moment = self.columns["arrival"][legs[-1][1]] - 1
+            else:
+                legs = self.earliest_arrival(origin, destination, moment)
+                if legs is None:
+                    break
+                legs = self.latest_departure(origin, destination,
+                                             self.columns["arrival"][legs[-1][1]]) or legs
+                moment = self.columns["departure"][legs[0][0]] + 1
+            journeys.append(legs)
+        if selection == "arrive":
+            journeys.reverse()
+        return journeys
+
+    def _end(self, connection, side, trip):
+        station = self.stations[self.columns[STATION_COLUMNS[side]][connection]]
+        platform = self.platforms[self.columns[side + "_platform"][connection]]
+        vehicle, direction = self.trips[trip]
+        return {"station": station,
+                "stationinfo": {"name": station, "standardname": station},
+                "time": str(self.columns[side][connection]),
+                "delay": "0",
+                "canceled": "0",
+                "vehicle": vehicle,
+                "platform": platform,
+                "platforminfo": {"name": platform, "normal": "1"},
+                "direction": {"name": direction}}
+
+    def as_connection(self, legs):
+        """
+        A journey in the format of the
+        `connections` API endpoint.
+        """
+        trips = [self.columns["trip"][board] for board, _ in legs]
+        departure = self._end(legs[0][0], "departure", trips[0])
+        arrival = self._end(legs[-1][1], "arrival", trips[-1])
+        vias = []
+        for index in range(len(legs) - 1):
+            via_arrival = self._end(legs[index][1], "arrival", trips[index])
+            via_departure = self._end(legs[index + 1][0], "departure", trips[index + 1])
+            vehicle, direction = self.trips[trips[index + 1]]
+            vias.append({"id": str(index),
+                         "station": via_arrival["station"],
+                         "stationinfo": via_arrival["stationinfo"],
+                         "arrival": via_arrival,
+                         "departure": via_departure,
+                         "timeBetween": str(int(via_departure["time"]) - int(via_arrival["time"])),
+                         "vehicle": vehicle,
+                         "direction": {"name": direction}})
+        connection = {"departure": departure,
+                      "arrival": arrival,
+                      "duration": str(int(arrival["time"]) - int(departure["time"]))}
+        if vias:
+            connection["vias"] = {"number": str(len(vias)), "via": vias}
+        return connection
+
+    def plan(self, from_station, to_station, moment, selection="depart", count=MAX_RESULTS):
+        """
+        Connections between two stations (by name),
+        like route_request returns them.
+        """
+        origin, destination = self.find_station(from_station), self.find_station(to_station)
+        if origin is None or destination is None or origin == destination:
+            return []
+        return [self.as_connection(legs)
+                for legs in self.journeys(origin, destination, moment, selection, count)]
+
+
+def build_from_cache(cache):
+    builder = TimetableBuilder("cached vehicles")
+    for json_data in cache.responses("vehicle"):
+        builder.add_vehicle_response(json_data)
+    return builder.build()
+
+
+def _gtfs_rows(source, name):
+    """
+    The rows of one file of a GTFS feed, which is
+    either a zip file or an extracted directory.
+    Optional files that are missing give no rows.
+    """
+    if os.path.isdir(source):
+        path = os.path.join(source, name)
+        if not os.path.exists(path):
+            return
+        f = io.open(path, encoding="utf-8-sig", newline="")
+    else:
+        import zipfile
+        archive = zipfile.ZipFile(source)
+        if name not in archive.namelist():
+            return
+        f = io.TextIOWrapper(archive.open(name), encoding="utf-8-sig", newline="")
+    with f:
+        for row in csv.DictReader(f):
+            yield row
+
+
+def _gtfs_seconds(value):
+    hours, minutes, seconds = value.strip().split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+def gtfs_service_days(source, days):
+    """
+    For every service id, the days (among days)
+    on which it runs, from calendar.txt and the
+    exceptions in calendar_dates.txt.
+    """
+    wanted = dict((day.strftime("%Y%m%d"), day) for day in days)
+    services = {}
+    for row in _gtfs_rows(source, "calendar.txt"):
+        for key, day in wanted.items():
+            if (row["start_date"] <= key <= row["end_date"] and
+                    row[WEEKDAYS[day.weekday()]] == "1"):
+                services.setdefault(row["service_id"], set()).add(day)
+    for row in _gtfs_rows(source, "calendar_dates.txt"):
+        day = wanted.get(row["date"])
+        if day is None:
+            continue
+        if row["exception_type"] == "1":
+            services.setdefault(row["service_id"], set()).add(day)
+        else:
+            services.get(row["service_id"], set()).discard(day)
+    return services
+
+
+def build_from_gtfs(source, first_day, number_of_days=1):
+    """
+    Import the trips of a GTFS feed that run on
+    number_of_days days from first_day. Trips are
+    named like iRail vehicles (BE.NMBS.IC1530), from
+    their route short name and trip short name; trips
+    that don't fit that pattern are left out.
+    """
+    days = [first_day + timedelta(days=i) for i in range(number_of_days)]
+    services = gtfs_service_days(source, days)
+    routes = dict((row["route_id"], row.get("route_short_name", ""))
+                  for row in _gtfs_rows(source, "routes.txt"))
+    trips = {}
+    for row in _gtfs_rows(source, "trips.txt"):
+        if not services.get(row["service_id"]):
+            continue
+        vehicle = "BE.NMBS." + routes.get(row["route_id"], "").upper() + row.get("trip_short_name", "")
+        try:
+            parse_vehicle(vehicle)
+        except ValueError:
+            continue
+        trips[row["trip_id"]] = (vehicle, row.get("trip_headsign") or None,
+                                 services[row["service_id"]])
+    stops = {}
+    parents = {}
+    for row in _gtfs_rows(source, "stops.txt"):
+        stops[row["stop_id"]] = (row["stop_name"], row.get("platform_code", ""))
+        if row.get("parent_station"):
+            parents[row["stop_id"]] = row["parent_station"]
+    stop_times = {}
+    for row in _gtfs_rows(source, "stop_times.txt"):
+        if row["trip_id"] in trips:
+            stop_times.setdefault(row["trip_id"], []).append(
+                (int(row["stop_sequence"]), row["stop_id"],
+                 _gtfs_seconds(row["arrival_time"]), _gtfs_seconds(row["departure_time"])))
+
+    builder = TimetableBuilder("GTFS " + os.path.basename(os.path.normpath(source)))
+    for trip_id, rows in stop_times.items():
+        vehicle, headsign, running = trips[trip_id]
+        rows.sort()
+        for day in sorted(running):
+            base = formatter.epoch(day.year, day.month, day.day)
+            trip_stops = []
+            for _, stop_id, arrival, departure in rows:
+                name, platform = stops.get(stop_id, (stop_id, ""))
+                if stop_id in parents and parents[stop_id] in stops:
+                    name = stops[parents[stop_id]][0]
+                trip_stops.append((name, base + arrival, base + departure, platform))
+            builder.add_trip(vehicle, trip_stops, headsign)
+    return builder.build()
+
+
+def timetable_path():
+    return data_path(TIMETABLE_DIR)
+
+
+def get_timetable():
+    """
+    The local timetable, or None when
+    it hasn't been built yet.
+    """
+    try:
+        return Timetable.load(timetable_path())
+    except (IOError, OSError, ValueError, KeyError):
+        return None
@@ -0,0 +1,158 @@
+"""
+Lightweight timing spans and counters.
+
+Commands, the API client and the renderers wrap
+their phases in `tracer.span(...)` and bump counters
+with `tracer.count(...)`. Both are no-ops until the
+tracer is enabled (with `irail --timings` or the
+IRAIL_TRACE environment variable), after which a
+summary table is printed when the command ends and,
+optionally, a Chrome trace (chrome://tracing,
+Perfetto) is written.
+"""
+import os
+import threading
+import time
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_null_span = _NullSpan()
+
+
+class Span(object):
+    __slots__ = ("tracer", "name", "category", "args", "start", "duration", "thread")
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = None
+        self.duration = None
+        self.thread = None
+
+    def set(self, **args):
+        """
+        Attach extra information (status code,
+        size, ...) that is only known inside the span.
+        """
+        self.args.update(args)
+
+    def __enter__(self):
+        self.thread = threading.current_thread().ident
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duration = time.time() - self.start
+        self.tracer.add(self)
+        return False
+
+
+class Tracer(object):
+
+    def __init__(self):
+        self.enabled = False
+        self.started = time.time()
+        self.spans = []
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+        self.started = time.time()
+
+    def reset(self):
+        """
+        Turn tracing off and forget the spans and
+        counters recorded so far.
+        """
+        with self.lock:
+            self.enabled = False
+            self.started = time.time()
+            self.spans = []
+            self.counters = {}
+
+    def span(self, name, category="phase", **args):
+        if not self.enabled:
+            return _null_span
+        return Span(self, name, category, args)
+
+    def add(self, span):
+        with self.lock:
+            self.spans.append(span)
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def summary(self):
+        """
+        (name, calls, total, max) per span name,
+        in the order they were first started.
+        """
+        rows = {}
+        for span in sorted(self.spans, key=lambda span: span.start):
+            calls, total, longest = rows.get(span.name, (0, 0.0, 0.0))
+            rows[span.name] = (calls + 1, total + span.duration, max(longest, span.duration))
+        first = {}
+        for span in self.spans:
+            first[span.name] = min(first.get(span.name, span.start), span.start)
+        return [(name,) + rows[name] for name in sorted(rows, key=first.get)]
+
+    def format_summary(self):
+        lines = ["{:<32} {:>6} {:>10} {:>10}".format("span", "calls", "total ms", "max ms")]
+        for name, calls, total, longest in self.summary():
+            lines.append("{:<32} {:>6} {:>10.1f} {:>10.1f}".format(
+                name, calls, total * 1000, longest * 1000))
+        lines.append("{:<32} {:>6} {:>10.1f}".format(
+            "wall time", "", (time.time() - self.started) * 1000))
+        if self.counters:
+            lines.append("")
+            for name in sorted(self.counters):
+                lines.append("{:<32} {:>6}".format(name, self.counters[name]))
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        events = [{"name": span.name, "cat": span.category, "ph": "X", "pid": pid,
+                   "tid": span.thread, "ts": int((span.start - self.started) * 1e6),
+                   "dur": int(span.duration * 1e6), "args": span.args}
+                  for span in self.spans]
+        events.append({"name": "counters", "ph": "C", "pid": pid, "tid": 0,
+                       "ts": int((time.time() - self.started) * 1e6), "args": self.counters})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path):
+        import json
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+tracer = Tracer()
+
+
+def trace_settings(timings, trace_file, environ=os.environ):
+    """
+    Whether to trace and where to write the Chrome
+    trace, from the command line options and
+    IRAIL_TRACE, which is either a flag ("1") or
+    the path of the trace file.
+    """
+    setting = environ.get("IRAIL_TRACE", "")
+    if setting.lower() in ("", "0", "false", "no"):
+        return timings or trace_file is not None, trace_file
+    if setting.lower() in ("1", "true", "yes"):
+        return True, trace_file
+    return True, trace_file or setting
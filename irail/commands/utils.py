@@ -1,98 +1,253 @@
-import requests
-import pytz
+from contextlib import contextmanager
 from datetime import datetime
 import click
 import re
+from irail.commands.client import get_client, APIError
+from irail.commands.stations import get_catalogue
+from irail.commands.times import formatter, query_time
+from irail.commands.records import parse_vehicle
+from irail.commands.render import style
+from irail.commands.singleflight import SingleFlight
+from irail.commands.streaming import JSONStream
+from irail.commands.trace import tracer
 
 
-def api_request(feature, **input_params):
-    headers = {'Content-type': 'application/json',
-               'Accept': 'text/plain'}
+MAX_WORKERS = 8
+
+
+class NoConnectionsFound(Exception):
+    pass
+
+
+class NoStationFound(Exception):
+    pass
+
 
+def api_params(input_params):
     params = {"fast": "true",
               "format": "json",
               "from": input_params.get("from_station", None)}  # hack to get around from
     params.update(input_params)
+    return params
 
-    if feature == "station":
-        url = "https://irail.be/stations/NMBS"
-    else:
-        url = "http://api.irail.be/{}/".format(feature)
-    try:
-        r = requests.get(url, params=params, headers=headers)
-    except requests.exceptions.ConnectionError:
 
-        try:
-            requests.get('http://8.8.8.8/', timeout=1)
-        except requests.exceptions.ConnectionError:
-            click.echo("Your internet connection doesn't seem to be working.")
-            raise SystemExit(1)
-        else:
-            click.echo("The iRail API doesn't seem to be working.")
-            raise SystemExit(1)
+def api_fetch(feature, max_age=None, **input_params):
+    """
+    Same as api_request, but raises APIError instead
+    of exiting, for callers that can live without
+    the answer (background prefetching, batches).
+    """
+    with tracer.span("api " + feature, "api"):
+        return get_client().get_json(feature, api_params(input_params), max_age=max_age)
+
+
+def api_prefetch(feature, ttl, **input_params):
+    """
+    Same as api_fetch, but always asks the server
+    and keeps the answer in the cache for ttl
+    seconds, for irail prefetch.
+    """
+    with tracer.span("api " + feature, "api"):
+        return get_client().prefetch(feature, api_params(input_params), ttl)
+
+
+def api_prefetched_at(feature, **input_params):
+    """
+    When irail prefetch fetched the cached answer
+    to a request, or None when it didn't.
+    """
+    return get_client().prefetched_at(feature, api_params(input_params))
+
+
+def stream_request(feature, path, **input_params):
+    """
+    Start a streamed request. Returns a JSONStream
+    yielding the items of the array at path as they
+    arrive, with the fields before it in its header.
+    """
+    params = {"fast": "true",
+              "format": "json"}
+    params.update(input_params)
+    return JSONStream(get_client().iter_text(feature, params), path)
+
+
+@contextmanager
+def stream_errors():
+    """
+    Exit like api_request when a streamed response
+    fails or breaks off.
+    """
     try:
-        json_data = r.json()
+        yield
+    except APIError as e:
+        click.echo(str(e))
+        raise SystemExit(1)
     except ValueError:
-        print(r.url)
         click.echo("The api doesn't seem to be working properly.")
         raise SystemExit(1)
-    if "error" in json_data:
-        click.echo("The api works, but sent a {} error code: {}".format(json_data["error"], json_data["message"]))
+
+
+def read_stream_header(stream):
+    """
+    Read up to the first item of a stream and return
+    its header, exiting like api_request on errors.
+    """
+    with stream_errors():
+        header = stream.read_header()
+    if "error" in header:
+        click.echo("The api works, but sent a {} error code: {}".format(header["error"], header["message"]))
         raise SystemExit(1)
-    return json_data
+    return header
 
 
-def station_request(station_name):
-    return api_request("station", q=station_name)
+def stream_items(stream):
+    """
+    The items of a stream, exiting like api_request
+    when the response breaks off halfway.
+    """
+    with stream_errors():
+        for item in stream:
+            yield item
 
 
-def liveboard_request(station_name):
-    return api_request("liveboard", station=station_name)
+def api_request(feature, **input_params):
+    try:
+        return api_fetch(feature, **input_params)
+    except APIError as e:
+        click.echo(str(e))
+        raise SystemExit(1)
 
 
-def vehicle_request(vehicle_id):
-    return api_request("vehicle", id=vehicle_id)  # ["stops"]["stop"]
+def run_concurrently(function, arguments, max_workers=MAX_WORKERS):
+    """
+    Call function for every argument in a bounded
+    thread pool and return the results in the
+    order of the arguments.
+    """
+    arguments = list(arguments)
+    if len(arguments) <= 1:
+        return [function(argument) for argument in arguments]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(arguments))) as executor:
+        return list(executor.map(function, arguments))
 
 
-def route_request(from_station, to_station, date=None, time=None, time_selection="depart"):
-    r = api_request("connections", from_station=from_station, to=to_station,
-                       date=date, time=time, timeSel=time_selection)
-    try:
-        return r["connection"]
-    except KeyError:
-        raise NoConnectionsFound
+def iter_concurrently(function, arguments, max_workers=MAX_WORKERS):
+    """
+    Like run_concurrently, but yield the results
+    as soon as each of them is ready, in the order
+    they finish.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    arguments = list(arguments)
+    with ThreadPoolExecutor(max_workers=max(min(max_workers, len(arguments)), 1)) as executor:
+        futures = [executor.submit(function, argument) for argument in arguments]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def station_request(station_name, request=api_request):
+    return request("station", q=station_name)
+
+
+def find_stations(suggestion, request=api_request):
+    """
+    Look up the stations matching a suggestion in the
+    local station catalogue, falling back to the
+    remote station search when there is no catalogue.
+    """
+    catalogue = get_catalogue()
+    if catalogue is not None:
+        return catalogue.search(suggestion)
+    return station_request(suggestion, request)["@graph"]
+
+
+class StationResolver(object):
+    """
+    Non-interactive station resolution (irail batch,
+    irail prefetch): the best match is taken instead
+    of asking the user, and every name is only looked
+    up once: workers asking for a name that is being
+    looked up wait for that lookup.
+    """
+
+    def __init__(self):
+        import threading
+        self.stations = {}
+        self.lock = threading.Lock()
+        self.flights = SingleFlight()
+
+    def resolve(self, suggestion):
+        with self.lock:
+            if suggestion in self.stations:
+                return self.stations[suggestion]
+        return self.flights.do(suggestion, self._lookup, suggestion)[0]
+
+    def _lookup(self, suggestion):
+        with self.lock:
+            # Another worker may have finished the lookup in the meantime.
+            if suggestion in self.stations:
+                return self.stations[suggestion]
+        matches = find_stations(suggestion, request=api_fetch)
+        if not matches:
+            raise NoStationFound("No station like {0} found.".format(suggestion))
+        with self.lock:
+            self.stations[suggestion] = matches[0]["name"]
+        return matches[0]["name"]
 
 
-def get_platform(connection):
-    return human_readable_platform_from_platforminfo(connection["platforminfo"]["name"],
-                          connection["platforminfo"]["normal"])
+def liveboard_request(station_name, request=api_request):
+    return request("liveboard", station=station_name)
 
-def get_station_from_user_input_name_from_connection(connection):
-    return connection["stationinfo"]["standardname"]
 
+def vehicle_request(vehicle_id, request=api_request):
+    return request("vehicle", id=vehicle_id)  # ["stops"]["stop"]
 
-def get_time_from_connection(connection):
-    return timestamp_to_human_readable_time(connection["time"])
+
+def route_response(from_station, to_station, date=None, time=None, time_selection="depart",
+                   request=api_request):
+    """
+    Same as route_request, but the whole
+    response rather than only its connections.
+    """
+    r = request("connections", from_station=from_station, to=to_station,
+                date=date, time=time, timeSel=time_selection)
+    if "connection" not in r:
+        raise NoConnectionsFound
+    return r
 
 
-def get_arrival_time_from_via(via):
-    return timestamp_to_human_readable_time(via["arrival"]["time"])
+def route_request(from_station, to_station, date=None, time=None, time_selection="depart",
+                  request=api_request):
+    return route_response(from_station, to_station, date, time, time_selection, request)["connection"]
 
 
-def get_arrival_platform_from_via(via):
-    return get_platform(via["arrival"])
+def local_route_request(from_station, to_station, date=None, time=None, time_selection="depart"):
+    """
+    Same as route_request, but planned on the local
+    timetable instead of asking the API.
+    """
+    from irail.commands.timetable import get_timetable
+    timetable = get_timetable()
+    if timetable is None:
+        click.echo("There is no local timetable yet, build one with irail timetable --update.")
+        raise SystemExit(1)
+    connections = timetable.plan(from_station, to_station, query_time(date, time), time_selection)
+    if not connections:
+        raise NoConnectionsFound
+    return connections
 
 
-def get_departure_time_from_via(via):
-    return timestamp_to_human_readable_time(via["departure"]["time"])
+def format_time(epoch, include_date=False):
+    return formatter.format(epoch, include_date)
 
 
-def get_departure_platform_from_via(via):
-    return get_platform(via["departure"])
+def format_times(epochs, include_date=False):
+    return formatter.format_many(epochs, include_date)
 
 
-def get_human_readable_vehicle_from_connection(connection, include_number=False):
-    return parse_vehicle_type(connection["vehicle"], include_number)
+def human_readable_vehicle(departure, include_number=False):
+    return departure.vehicle_type + (departure.vehicle_number if include_number else "")
 
 
 def timestamp_to_human_readable_time(timestamp, include_date=False):
@@ -101,75 +256,53 @@ def timestamp_to_human_readable_time(timestamp, include_date=False):
     a human-readable (HH:MM)
     time string.
     """
-    if not (len(timestamp) == 10 and all(c.isdigit() for c in timestamp)):
+    if not (len(timestamp) == 10 and timestamp.isdigit()):
         raise ValueError("Timestamp {} is invalid and cannot be converted".format(timestamp))
-    timezone = pytz.timezone('Europe/Brussels')
-    return (datetime.fromtimestamp(int(timestamp), timezone)
-                    .strftime("%H:%M (%d/%m/%Y)" if include_date else "%H:%M"))
+    return formatter.format(timestamp, include_date)
 
 
-def human_readable_platform_from_platforminfo(platform, platform_changed):
+def timestamps_to_human_readable_times(timestamps, include_date=False):
+    """
+    Same as timestamp_to_human_readable_time
+    for a whole list of timestamps at once.
+    """
+    for timestamp in timestamps:
+        if not (len(timestamp) == 10 and timestamp.isdigit()):
+            raise ValueError("Timestamp {} is invalid and cannot be converted".format(timestamp))
+    return formatter.format_many(timestamps, include_date)
+
+
+def human_readable_platform(platform):
     """
     Apply style to platform string.
     If platform is normal, simply return platform.
     If platform has been changed, apply 'reverse' style.
     """
-    platform_changed = platform_changed != "1"
-    platform_message = " " * (3 - len(platform))
-    if not platform_changed:
-        platform_message += platform
+    platform_message = " " * (3 - len(platform.name))
+    if not platform.changed:
+        platform_message += platform.name
     else:
-        platform_message += click.style(platform, reverse=True)
+        platform_message += style(platform.name, reverse=True)
     return platform_message
 
 
-def get_styled_platform(platform, platform_changed):
-    pass
-
-
 def parse_vehicle_type(vehicle, include_number=False):
     """
     Takes a vehicle string (BE.NMBS.IC504)
     and returns a human-readable
     version of its type (e.g. IC, L)
     """
-    matches = re.match(r'(?:BE.NMBS.)?([A-Z]{1,3})(\d{1,4})', vehicle)
-    try:
-        train_type = matches.group(1)
-    except AttributeError:
-        raise ValueError("{} is not a valid vehicle".format(vehicle))
-    train_number = matches.group(2)
+    train_type, train_number = parse_vehicle(vehicle)
     return train_type + (train_number if include_number else "")
 
 
-def parse_direction(direction):
-    return direction.ljust(40)
-
-
-def safe_trains_extract(irail_json_object):
-    try:
-        return irail_json_object["departures"]["departure"]
-    except KeyError:
-        click.echo("No trains!")
-        return []
-
-
-def get_station_from_user_input(suggestion):
+def choose_station(suggestion, suggestions):
     """
-    Takes a potential train station
-    (e.g. Gent) and returns possibilities.
-    User can then choose the exact train
-    station (e.g. Gent-Sint-Pieters)
-    from these possibilities.
-    
-    Example:
-    bash-4.3$ irail liveboard gent
-    0: Gent-Sint-Pieters
-    1: Gent-Dampoort
-    2: Gentbrugge
-    Which station do you mean by gent?: 0
+    Let the user pick one of the stations
+    matching a suggestion. No prompt is shown
+    when there is only one candidate.
     """
-    
+
     def try_station_index():
         station_index = click.prompt("Which station do you mean by {0}?".format(suggestion), type=int)
         try:
@@ -178,12 +311,8 @@ def get_station_from_user_input(suggestion):
             click.echo("The station with #{} is not in the list. Please provide a valid index.".format(station_index))
             return try_station_index()
 
-    json_data = station_request(suggestion)
-
-    suggestions = json_data["@graph"]
-
     if len(suggestions) == 1:
-        station_index = 0
+        return suggestions[0]["name"]
 
     elif len(suggestions) == 0:
         click.echo("No station like {0} found.".format(suggestion))
@@ -194,16 +323,50 @@ def get_station_from_user_input(suggestion):
         return try_station_index()
 
 
-def get_human_readable_delay_from_connection(connection):
-    return human_readable_delay_from_delay_string(connection["delay"])
+def get_station_from_user_input(suggestion):
+    """
+    Takes a potential train station
+    (e.g. Gent) and returns possibilities.
+    User can then choose the exact train
+    station (e.g. Gent-Sint-Pieters)
+    from these possibilities.
+    
+    Example:
+    bash-4.3$ irail liveboard gent
+    0: Gent-Sint-Pieters
+    1: Gent-Dampoort
+    2: Gentbrugge
+    Which station do you mean by gent?: 0
+    """
+    return choose_station(suggestion, find_stations(suggestion))
+
+
+def get_stations_from_user_input(suggestions, speculate=None):
+    """
+    Same as get_station_from_user_input for several
+    suggestions at once. The lookups run concurrently;
+    the user is then asked to disambiguate them in order.
+
+    Before each question, speculate (when given) is
+    called with the stations chosen so far and the
+    best match for the others, so that whatever needs
+    them can start while the user makes up their mind.
+    """
+    candidates = run_concurrently(find_stations, suggestions)
+    chosen = []
+    for index, (suggestion, matches) in enumerate(zip(suggestions, candidates)):
+        if speculate is not None and len(matches) > 1 and all(candidates[index:]):
+            speculate(*(chosen + [rest[0]["name"] for rest in candidates[index:]]))
+        chosen.append(choose_station(suggestion, matches))
+    return chosen
 
 
-def human_readable_delay_from_delay_string(delay_str):
-    if delay_str == "0":
-        return False, "   "
-    elif delay_str == "cancel":
-        return True, 0
-    else:
-        delay = int(delay_str) // 60
-        text = ("+" + str(delay)).ljust(3)
-        return False, click.style(text, fg="red")
+def human_readable_delay(delay):
+    """
+    Delay in seconds as a fixed width
+    string of whole minutes (+5).
+    """
+    if delay < 60:
+        return "   "
+    text = ("+" + str(delay // 60)).ljust(3)
+    return style(text, fg="red")
@@ -0,0 +1,177 @@
+"""
+Entry point of the `irail` script.
+
+When `irail serve` is running, liveboard, route
+and vehicle are handed to it over a Unix socket:
+the daemon already has the station catalogue
+loaded, the response cache open and connections
+to the API alive, so the command only pays for
+starting the interpreter. Everything else, and
+every command the daemon can't run (because it
+needs a terminal to ask something), runs here
+as before.
+
+This module is imported on every start, so it
+only uses the standard library, and only the
+parts of it that are cheap to import.
+"""
+import os
+import sys
+
+
+SOCKET_FILE = "irail.sock"
+PROTOCOL = 1
+
+FORWARDED = ("liveboard", "route", "vehicle")
+# Commands that keep running or only print help are not worth forwarding;
+# the daemon answers once a command is done, so streams wouldn't stream.
+LOCAL_OPTIONS = ("--continuous", "--stream", "--help")
+LOCAL_FLAGS = "c"
+# Text-mode route always ends with a question, which needs the terminal.
+PROMPTING = ("route",)
+
+CONNECT_TIMEOUT = 0.5
+BUFFER_SIZE = 64 * 1024
+
+
+def socket_path(environ=None):
+    """
+    Where `irail serve` listens: IRAIL_SOCKET, or
+    irail.sock in the data directory (the same
+    directory as irail.commands.paths.data_dir, worked
+    out without importing click). None on platforms
+    without Unix sockets.
+    """
+    environ = os.environ if environ is None else environ
+    if environ.get("IRAIL_SOCKET"):
+        return environ["IRAIL_SOCKET"]
+    if sys.platform.startswith("win"):
+        return None
+    home = environ.get("IRAIL_HOME")
+    if not home:
+        if sys.platform == "darwin":
+            home = os.path.join(os.path.expanduser("~/Library/Application Support"), "irail")
+        else:
+            config = environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config"))
+            home = os.path.join(config, "irail")
+    return os.path.join(home, SOCKET_FILE)
+
+
+def output_format(args):
+    """
+    The value of --format/-f in the options of a
+    command, "text" when it isn't given.
+    """
+    format = "text"
+    for index, arg in enumerate(args):
+        if arg == "--":
+            break
+        if arg in ("--format", "-f") and index + 1 < len(args):
+            format = args[index + 1]
+        elif arg.startswith("--format="):
+            format = arg[len("--format="):]
+        elif arg.startswith("-f") and not arg.startswith("--") and len(arg) > 2:
+            format = arg[2:]
+    return format
+
+
+def forwardable(args):
+    """
+    Whether the daemon can run these arguments: one
+    of the forwarded commands, without global
+    options, not continuous or streamed, not asking
+    for help and not going to prompt.
+    """
+    if not args or args[0] not in FORWARDED:
+        return False
+    for arg in args[1:]:
+        if arg == "--":
+            break
+        if arg in LOCAL_OPTIONS:
+            return False
+        if arg.startswith("-") and not arg.startswith("--") and \
+           any(flag in arg[1:] for flag in LOCAL_FLAGS):
+            return False
+    if args[0] in PROMPTING and output_format(args[1:]) == "text":
+        return False
+    return True
+
+
+def terminal_size():
+    try:
+        return os.get_terminal_size(sys.stdout.fileno())
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def make_request(args, environ=None):
+    environ = os.environ if environ is None else environ
+    request = {
+        "version": PROTOCOL,
+        "args": list(args),
+        "color": sys.stdout.isatty(),
+        "env": dict((name, value) for name, value in environ.items()
+                    if name.startswith("IRAIL_") or name in ("COLUMNS", "LINES")),
+    }
+    size = terminal_size()
+    if size is not None:
+        request["env"].setdefault("COLUMNS", str(size[0]))
+        request["env"].setdefault("LINES", str(size[1]))
+    return request
+
+
+def forward(args, path=None, timeout=None):
+    """
+    Run a command in the daemon. Returns its reply
+    (exit code, output and errors), or None when
+    there is no daemon or it asks us to run the
+    command ourselves.
+    """
+    path = path or socket_path()
+    if not path or not os.path.exists(path):
+        return None
+    import json
+    import socket
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.settimeout(CONNECT_TIMEOUT)
+        try:
+            connection.connect(path)
+        except (IOError, OSError):
+            return None
+        connection.settimeout(timeout)
+        connection.sendall((json.dumps(make_request(args)) + "\n").encode("utf-8"))
+        chunks = []
+        while True:
+            chunk = connection.recv(BUFFER_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    except (IOError, OSError):
+        return None
+    finally:
+        connection.close()
+    try:
+        reply = json.loads(b"".join(chunks).decode("utf-8"))
+    except ValueError:
+        return None
+    if reply.get("fallback") or reply.get("version") != PROTOCOL:
+        return None
+    return reply
+
+
+def main(args=None):
+    args = sys.argv[1:] if args is None else list(args)
+    if forwardable(args):
+        reply = forward(args)
+        if reply is not None:
+            sys.stdout.write(reply["stdout"])
+            sys.stdout.flush()
+            sys.stderr.write(reply["stderr"])
+            sys.exit(reply["exit"])
+    from irail.cli import cli
+    cli(args)
+
+
+if __name__ == "__main__":
+    main()
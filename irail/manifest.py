@@ -0,0 +1,55 @@
+"""
+Build the command manifest: the list of
+commands and their help texts, so that
+`irail --help` does not have to import every
+command module (and everything they import).
+
+The manifest is regenerated when the package
+is built (see setup.py) and can be refreshed
+by hand with `python -m irail.manifest`.
+"""
+import ast
+import os
+
+
+COMMANDS_FOLDER = os.path.join(os.path.dirname(__file__), 'commands')
+MANIFEST_FILE = os.path.join(COMMANDS_FOLDER, '_manifest.py')
+
+TEMPLATE = '''# Generated by irail/manifest.py, do not edit.
+COMMANDS = {
+%s}
+'''
+
+
+def command_help(path):
+    """
+    First paragraph of the docstring of the `cli`
+    function in a command module, read without
+    importing the module.
+    """
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == 'cli':
+            return (ast.get_docstring(node) or '').split('\n\n')[0]
+    return ''
+
+
+def build_manifest(commands_folder=COMMANDS_FOLDER):
+    commands = {}
+    for filename in os.listdir(commands_folder):
+        if filename.endswith('.py') and \
+           filename.startswith('cmd_'):
+            commands[filename[4:-3]] = command_help(os.path.join(commands_folder, filename))
+    return commands
+
+
+def write_manifest(path=MANIFEST_FILE, commands_folder=COMMANDS_FOLDER):
+    commands = build_manifest(commands_folder)
+    entries = ''.join('    %r: %r,\n' % (name, commands[name]) for name in sorted(commands))
+    with open(path, 'w') as f:
+        f.write(TEMPLATE % entries)
+
+
+if __name__ == '__main__':
+    write_manifest()
@@ -1,4 +1,22 @@
+import sys
 from setuptools import setup
+from setuptools.command.build_py import build_py
+
+
+class build_py_with_manifest(build_py):
+    """
+    Regenerate the command manifest read by
+    `irail --help` before building.
+    """
+    def run(self):
+        from irail.manifest import write_manifest
+        write_manifest()
+        build_py.run(self)
+
+
+install_requires = ['requests', 'click', 'pytz']
+if sys.version_info[0] == 2:
+    install_requires.append('futures')
 
 
 def readme():
@@ -27,12 +45,14 @@ setup(name='irail',
       author_email='benbaert@tuta.io',
       license='MIT',
       packages=['irail', 'irail.commands'],
-      install_requires=['requests', 'click'],
+      install_requires=install_requires,
+      extras_require={'stats': ['numpy']},
       include_package_data=True,
       setup_requires=['pytest-runner'],
       tests_require=['pytest'],
       entry_points='''
               [console_scripts]
-              irail=irail.cli:cli
+              irail=irail.launcher:main
               ''',
+      cmdclass={'build_py': build_py_with_manifest},
       zip_safe=False)
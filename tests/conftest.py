@@ -0,0 +1,45 @@
+import json
+import os
+import pytest
+from irail.commands import cache, client, stations
+from tests.fakeserver import FakeIRail
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+@pytest.fixture(autouse=True)
+def irail_home(tmpdir, monkeypatch):
+    """
+    Keep the station catalogue and caches
+    of the test run out of the real home directory.
+    """
+    monkeypatch.setenv("IRAIL_HOME", str(tmpdir.mkdir("irail_home")))
+
+
+@pytest.fixture
+def load_fixture():
+    """
+    Load a recorded API payload from tests/fixtures.
+    """
+    def load(name):
+        with open(os.path.join(FIXTURES, name + ".json")) as f:
+            return json.load(f)
+    return load
+
+
+@pytest.fixture
+def fake_irail(monkeypatch):
+    """
+    A local stand-in server, with the CLI's client,
+    station catalogue and response cache starting afresh.
+    """
+    with FakeIRail(seed=0) as fake:
+        for name, value in fake.environ().items():
+            monkeypatch.setenv(name, value)
+        monkeypatch.setattr(client, "_client", None)
+        monkeypatch.setattr(stations, "_catalogue", None)
+        monkeypatch.setattr(cache, "_cache", None)
+        yield fake
+        if client._client is not None:
+            client._client.close()
@@ -0,0 +1,226 @@
+"""
+A local stand-in for the iRail API.
+
+Replays the recorded payloads in tests/fixtures for
+the liveboard, connections, vehicle and station
+endpoints, with configurable latency, jitter and
+error injection, so commands can be run end to end
+(and benchmarked) without touching the network.
+
+Point the CLI at it with IRAIL_API_URL and
+IRAIL_STATIONS_URL, or run it on its own:
+
+    python -m tests.fakeserver --port 8080 --latency 0.2
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+_slug_separators = re.compile(r"[^a-z0-9]+")
+
+
+def slug(name):
+    return _slug_separators.sub("_", name.lower()).strip("_")
+
+
+class Recordings(object):
+    """
+    The recorded payloads, by file name (without .json).
+    A request is answered with the recording named after
+    its parameters (liveboard_gent_sint_pieters,
+    vehicle_IC1530, connections_gent_brussel, ...),
+    falling back to the first recording of the feature.
+    """
+
+    def __init__(self, directory=FIXTURES):
+        self.payloads = {}
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".json"):
+                with open(os.path.join(directory, filename), "rb") as f:
+                    self.payloads[filename[:-5]] = f.read()
+
+    def candidates(self, feature, params):
+        if feature == "liveboard":
+            yield "liveboard_" + slug(params.get("station", ""))
+        elif feature == "vehicle":
+            yield "vehicle_" + params.get("id", "").split(".")[-1]
+        elif feature == "connections":
+            origin, destination = slug(params.get("from_station", "")), slug(params.get("to", ""))
+            yield "connections_{}_{}".format(origin, destination)
+            for name in sorted(self.payloads):
+                parts = name.split("_")
+                if (name.startswith("connections_") and len(parts) == 3 and
+                        origin.startswith(parts[1]) and destination.startswith(parts[2])):
+                    yield name
+        for name in sorted(self.payloads):
+            if name.startswith(feature + "_"):
+                yield name
+
+    def find(self, feature, params):
+        if feature == "stations":
+            return self.payloads.get("stations")
+        for name in self.candidates(feature, params):
+            if name in self.payloads:
+                return self.payloads[name]
+        return None
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeIRail(object):
+    """
+    Serves recordings on localhost in a background
+    thread. Every response is delayed by latency plus
+    a random jitter in [0, jitter) seconds, and fails
+    with error_status for a fraction error_rate of the
+    requests, telling the client to come back after
+    retry_after seconds when that is set. With chunk_delay the body is sent in
+    chunks of chunk_size bytes with a pause in between,
+    like a slow connection.
+
+    Received requests are kept in `requests` as
+    (feature, params) tuples.
+    """
+
+    def __init__(self, recordings=None, latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_status=503, retry_after=None, chunk_size=1024, chunk_delay=0.0,
+                 port=0, seed=None):
+        self.recordings = recordings or Recordings()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.port = port
+        self.random = random.Random(seed)
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+    @property
+    def api_url(self):
+        return self.url + "/{}/"
+
+    @property
+    def stations_url(self):
+        return self.url + "/stations/"
+
+    def environ(self):
+        """
+        The environment variables that make the
+        CLI talk to this server.
+        """
+        return {"IRAIL_API_URL": self.api_url, "IRAIL_STATIONS_URL": self.stations_url}
+
+    def respond(self, feature, params):
+        """
+        The status code and body for a request.
+        """
+        with self.lock:
+            self.requests.append((feature, params))
+            delay = self.latency + self.random.random() * self.jitter
+            failed = self.random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            return self.error_status, json.dumps(
+                {"error": self.error_status, "message": "Injected error"}).encode("utf-8")
+        payload = self.recordings.find(feature, params)
+        if payload is None:
+            return 404, json.dumps({"error": 404, "message": "No recording"}).encode("utf-8")
+        return 200, payload
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                feature = url.path.strip("/").split("/")[0]
+                params = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+                status, body = fake.respond(feature, params)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                if status != 200 and fake.retry_after is not None:
+                    self.send_header("Retry-After", str(fake.retry_after))
+                self.end_headers()
+                for start in range(0, len(body), fake.chunk_size):
+                    if start and fake.chunk_delay:
+                        self.wfile.flush()
+                        time.sleep(fake.chunk_delay)
+                    self.wfile.write(body[start:start + fake.chunk_size])
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = _ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve recorded iRail payloads")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fixtures", default=FIXTURES)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    args = parser.parse_args()
+    fake = FakeIRail(Recordings(args.fixtures), latency=args.latency, jitter=args.jitter,
+                     error_rate=args.error_rate, error_status=args.error_status,
+                     chunk_delay=args.chunk_delay, port=args.port).start()
+    for name, value in sorted(fake.environ().items()):
+        print("export {}={}".format(name, value))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
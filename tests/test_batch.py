@@ -0,0 +1,81 @@
+import json
+import threading
+from click.testing import CliRunner
+from irail.commands import cmd_batch, utils
+from irail.commands.client import APIUnavailableError
+
+
+QUERIES = [{"type": "liveboard", "station": "gsp"},
+           {"type": "vehicle", "id": "IC1530"},
+           {"type": "route", "from": "gsp", "to": "Brussel-Zuid"},
+           {"type": "train"},
+           {"type": "vehicle", "id": "IC9999"}]
+
+
+def fake_fetch(load_fixture):
+    def fetch(feature, **params):
+        if feature == "liveboard":
+            return load_fixture("liveboard_gent_sint_pieters")
+        if feature == "connections":
+            return load_fixture("connections_gent_brussel")
+        if params["id"] == "IC9999":
+            raise APIUnavailableError("The iRail API doesn't seem to be working.")
+        return load_fixture("vehicle_IC1530")
+    return fetch
+
+
+def run_batch(monkeypatch, load_fixture, *args):
+    lookups = []
+
+    def find_stations(suggestion, request):
+        lookups.append(suggestion)
+        return [{"name": {"gsp": "Gent-Sint-Pieters"}.get(suggestion, suggestion)}]
+
+    monkeypatch.setattr(utils, "find_stations", find_stations)
+    monkeypatch.setattr(cmd_batch, "api_fetch", fake_fetch(load_fixture))
+    lines = "\n".join(json.dumps(query) for query in QUERIES) + "\nnot json\n"
+    result = CliRunner().invoke(cmd_batch.cli, list(args), input=lines)
+    return result, [json.loads(line) for line in result.output.splitlines()], lookups
+
+
+def test_batch_in_input_order(monkeypatch, load_fixture):
+    result, records, lookups = run_batch(monkeypatch, load_fixture, "--ordered", "-w", "2")
+    assert result.exit_code == 1
+    assert [record["index"] for record in records] == [0, 1, 2, 3, 4, 5]
+    assert records[0]["result"]["stationinfo"]["standardname"] == "Gent-Sint-Pieters"
+    assert records[1]["result"]["vehicle"] == "BE.NMBS.IC1530"
+    assert len(records[2]["result"]) == 3
+    assert records[3]["error"] == "Unknown query type train"
+    assert records[4]["error"] == "The iRail API doesn't seem to be working."
+    assert records[5]["error"] == "Query is not a JSON object"
+    assert sorted(lookups) == ["Brussel-Zuid", "gsp"]
+
+
+def test_batch_in_completion_order(monkeypatch, load_fixture):
+    result, records, _ = run_batch(monkeypatch, load_fixture)
+    assert sorted(record["index"] for record in records) == [0, 1, 2, 3, 4, 5]
+
+
+def test_names_are_looked_up_once(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    lookups = []
+
+    def find_stations(suggestion, request):
+        lookups.append(suggestion)
+        started.set()
+        release.wait(5)
+        return [{"name": "Gent-Sint-Pieters"}]
+
+    monkeypatch.setattr(utils, "find_stations", find_stations)
+    resolver = utils.StationResolver()
+    names = []
+    workers = [threading.Thread(target=lambda: names.append(resolver.resolve("gsp")))
+               for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    started.wait(5)
+    release.set()
+    for worker in workers:
+        worker.join(5)
+    assert names == ["Gent-Sint-Pieters"] * 4
+    assert lookups == ["gsp"]
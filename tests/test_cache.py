@@ -0,0 +1,92 @@
+import sqlite3
+import time
+from irail.commands.cache import ResponseCache, make_key, ttl_for
+
+
+def test_make_key():
+    assert make_key("liveboard", {"station": "Gent", "fast": "true", "from": None}) == \
+        make_key("liveboard", {"fast": "true", "station": "Gent"})
+    assert make_key("liveboard", {"station": "Gent"}) != make_key("vehicle", {"station": "Gent"})
+    assert make_key("liveboard", {"station": u"Li\u00e8ge-Guillemins", "fast": True}) == \
+        u"liveboard?fast=True&station=Li\u00e8ge-Guillemins"
+
+
+def test_ttl_for():
+    now = time.time()
+    past = {"connection": [{"arrival": {"time": str(int(now) - 3600)}}]}
+    future = {"connection": [{"arrival": {"time": str(int(now) + 3600)}}]}
+    assert ttl_for("connections", past, now) is None
+    assert ttl_for("connections", future, now) == 60
+    assert ttl_for("liveboard", {}, now) == 30
+
+
+def test_store_and_get(tmpdir):
+    cache = ResponseCache(str(tmpdir.join("responses.sqlite")))
+    assert cache.get("liveboard?station=Gent") is None
+    cache.store("liveboard?station=Gent", "liveboard", {"a": 1}, {"ETag": "x"})
+    entry = cache.get("liveboard?station=Gent")
+    assert entry.data == {"a": 1}
+    assert entry.is_fresh()
+    assert entry.validators() == {"If-None-Match": "x"}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_reads_seldom_write(tmpdir):
+    cache = ResponseCache(str(tmpdir.join("responses.sqlite")))
+    cache.store("a", "liveboard", {"a": 1})
+    changes = cache._db.total_changes
+    cache.get("a")
+    cache.get("a")
+    assert cache._db.total_changes == changes
+    cache._db.execute("UPDATE responses SET accessed_at = accessed_at - 3600")
+    changes = cache._db.total_changes
+    cache.get("a")
+    assert cache._db.total_changes == changes + 1
+
+
+def test_lru_eviction(tmpdir):
+    cache = ResponseCache(str(tmpdir.join("responses.sqlite")), max_size=70)
+    cache.store("a", "liveboard", {"data": "x" * 20})
+    cache.store("b", "liveboard", {"data": "y" * 20})
+    cache._db.execute("UPDATE responses SET accessed_at = accessed_at - 3600")
+    cache.get("a")
+    cache.store("c", "liveboard", {"data": "z" * 20})
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_max_age(tmpdir):
+    cache = ResponseCache(str(tmpdir.join("responses.sqlite")))
+    cache.store("liveboard?station=Gent", "liveboard", {"a": 1}, ttl=3600)
+    entry = cache.get("liveboard?station=Gent")
+    now = entry.stored_at + 60
+    assert entry.is_fresh(now)
+    assert entry.is_fresh(now, max_age=120)
+    assert not entry.is_fresh(now, max_age=30)
+
+
+def test_prefetched_at(tmpdir):
+    cache = ResponseCache(str(tmpdir.join("responses.sqlite")))
+    cache.store("liveboard?station=Gent", "liveboard", {"a": 1}, ttl=3600, prefetched=True)
+    assert cache.get("liveboard?station=Gent").data == {"a": 1}
+    assert cache.prefetched_at("liveboard?station=Gent") is not None
+    cache.refresh("liveboard?station=Gent", "liveboard", cache.get("liveboard?station=Gent"))
+    assert cache.prefetched_at("liveboard?station=Gent") is None
+    assert cache.prefetched_at("liveboard?station=Brugge") is None
+
+
+def test_cache_from_before_prefetch(tmpdir):
+    path = str(tmpdir.join("responses.sqlite"))
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE responses (key TEXT PRIMARY KEY, feature TEXT NOT NULL, "
+               "body TEXT NOT NULL, stored_at REAL NOT NULL, expires_at REAL, etag TEXT, "
+               "last_modified TEXT, accessed_at REAL NOT NULL, size INTEGER NOT NULL)")
+    db.execute("INSERT INTO responses VALUES ('a', 'liveboard', '{}', 0, NULL, NULL, NULL, 0, 2)")
+    db.commit()
+    db.close()
+    cache = ResponseCache(path)
+    assert cache.get("a").data == {}
+    assert cache.prefetched_at("a") is None
+    cache.store("b", "liveboard", {"b": 1}, prefetched=True)
+    assert cache.prefetched_at("b") is not None
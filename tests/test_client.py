@@ -0,0 +1,246 @@
+import socket
+import threading
+import time
+import pytest
+import requests
+from irail.commands.client import APIClient, APIResponseError, OfflineError, APIUnavailableError
+from irail.commands.client import is_name_resolution_error
+from irail.commands.cache import ResponseCache, make_key
+
+
+class FakeResponse(object):
+    raw = None
+
+    def __init__(self, payload, status_code=200, headers=None):
+        self.payload = payload
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def json(self):
+        if isinstance(self.payload, Exception):
+            raise self.payload
+        return self.payload
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession(object):
+    def __init__(self, result):
+        self.result = result
+        self.calls = []
+
+    def close(self):
+        pass
+
+    def get(self, url, **kwargs):
+        self.calls.append((url, kwargs))
+        result = self.result.pop(0) if isinstance(self.result, list) else self.result
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def make_client(result, cache=None, **kwargs):
+    client = APIClient(cache=cache, **kwargs)
+    client.session = FakeSession(result)
+    client.sleep = lambda seconds: None
+    return client
+
+
+def test_url_for():
+    client = APIClient(api_url="http://localhost/{}/", stations_url="http://localhost/st")
+    assert client.url_for("liveboard") == "http://localhost/liveboard/"
+    assert client.url_for("station") == "http://localhost/st"
+
+
+def test_get_client_urls_from_environment(monkeypatch):
+    from irail.commands import client
+    monkeypatch.setattr(client, "_client", None)
+    monkeypatch.setenv("IRAIL_API_URL", "http://127.0.0.1:8080/{}/")
+    monkeypatch.setenv("IRAIL_STATIONS_URL", "http://127.0.0.1:8080/stations/")
+    assert client.get_client().url_for("vehicle") == "http://127.0.0.1:8080/vehicle/"
+    assert client.get_client().url_for("station") == "http://127.0.0.1:8080/stations/"
+
+
+def test_name_resolution_error():
+    wrapped = requests.exceptions.ConnectionError(socket.gaierror(-2, "Name or service not known"))
+    assert is_name_resolution_error(wrapped) is True
+    assert is_name_resolution_error(requests.exceptions.ConnectionError("refused")) is False
+
+
+def test_get_json():
+    client = make_client(FakeResponse({"departures": {}}))
+    assert client.get_json("liveboard", {"station": "Gent"}) == {"departures": {}}
+    url, kwargs = client.session.calls[0]
+    assert kwargs["timeout"] == client.timeout
+
+
+def test_get_json_errors():
+    with pytest.raises(APIResponseError):
+        make_client(FakeResponse(ValueError())).get_json("liveboard", {})
+    with pytest.raises(APIResponseError):
+        make_client(FakeResponse({"error": 404, "message": "x"})).get_json("liveboard", {})
+    offline = requests.exceptions.ConnectionError(socket.gaierror(-2, "unknown"))
+    with pytest.raises(OfflineError):
+        make_client(offline).get_json("liveboard", {})
+    with pytest.raises(APIUnavailableError):
+        make_client(requests.exceptions.ReadTimeout()).get_json("liveboard", {})
+
+
+class FakeLimiter(object):
+    def __init__(self):
+        self.acquired = 0
+        self.pauses = []
+
+    def acquire(self):
+        self.acquired += 1
+        return 0
+
+    def pause(self, seconds):
+        self.pauses.append(seconds)
+
+
+def test_throttled_responses_back_off():
+    limiter = FakeLimiter()
+    client = make_client([FakeResponse({}, 429, {"Retry-After": "2"}),
+                          FakeResponse({}, 503),
+                          FakeResponse({"departures": []})])
+    client.limiter = limiter
+    assert client.get_json("liveboard", {}) == {"departures": []}
+    assert limiter.pauses == [2, 2.0]
+    assert limiter.acquired == 3
+
+
+def test_throttled_too_long():
+    client = make_client([FakeResponse({}, 429, {"Retry-After": "3600"})])
+    client.limiter = FakeLimiter()
+    with pytest.raises(APIUnavailableError):
+        client.get_json("liveboard", {})
+
+
+def test_get_json_cached(tmpdir):
+    cache = ResponseCache(str(tmpdir.join("responses.sqlite")))
+    client = make_client([FakeResponse({"timestamp": "1"}, headers={"ETag": '"abc"'}),
+                          FakeResponse(None, status_code=304)], cache=cache)
+    assert client.get_json("liveboard", {"station": "Gent"}) == {"timestamp": "1"}
+    assert client.get_json("liveboard", {"station": "Gent"}) == {"timestamp": "1"}
+    assert len(client.session.calls) == 1
+
+    cache._db.execute("UPDATE responses SET expires_at = 0")
+    assert client.get_json("liveboard", {"station": "Gent"}) == {"timestamp": "1"}
+    url, kwargs = client.session.calls[1]
+    assert kwargs["headers"]["If-None-Match"] == '"abc"'
+    assert cache.get(make_key("liveboard", {"station": "Gent"})).is_fresh()
+
+
+def test_prefetch(tmpdir):
+    cache = ResponseCache(str(tmpdir.join("responses.sqlite")))
+    client = make_client([FakeResponse({"timestamp": "1"}, headers={"ETag": '"abc"'}),
+                          FakeResponse(None, status_code=304)], cache=cache)
+    assert client.prefetch("liveboard", {"station": "Gent"}, ttl=3600) == {"timestamp": "1"}
+    entry = cache.get(make_key("liveboard", {"station": "Gent"}))
+    assert entry.expires_at - entry.stored_at == 3600
+    assert client.get_json("liveboard", {"station": "Gent"}) == {"timestamp": "1"}
+    assert client.prefetched_at("liveboard", {"station": "Gent"}) is not None
+    assert len(client.session.calls) == 1
+
+    # Too old for a refresh: revalidated, and no longer prefetched.
+    cache._db.execute("UPDATE responses SET stored_at = stored_at - 60")
+    assert client.get_json("liveboard", {"station": "Gent"}, max_age=30) == {"timestamp": "1"}
+    assert client.prefetched_at("liveboard", {"station": "Gent"}) is None
+    assert len(client.session.calls) == 2
+
+
+def test_failed_requests_are_retried():
+    client = make_client([requests.exceptions.ReadTimeout(), FakeResponse(ValueError()),
+                          FakeResponse({"departures": {}})])
+    sleeps = []
+    client.sleep = sleeps.append
+    assert client.get_json("liveboard", {}) == {"departures": {}}
+    assert client.counts["retries"] == 2
+    assert 0 <= sleeps[0] <= client.retry_backoff
+    assert 0 <= sleeps[1] <= client.retry_backoff * 2
+
+
+def test_retries_give_up():
+    client = make_client(requests.exceptions.ConnectTimeout(), retries=1)
+    with pytest.raises(APIUnavailableError):
+        client.get_json("liveboard", {})
+    assert len(client.session.calls) == 2
+
+
+def test_api_errors_are_not_retried():
+    client = make_client(FakeResponse({"error": 404, "message": "x"}))
+    with pytest.raises(APIResponseError):
+        client.get_json("liveboard", {})
+    assert len(client.session.calls) == 1
+
+
+class StalledSession(FakeSession):
+    """
+    The first request hangs until released,
+    the ones after it are answered at once.
+    """
+
+    def __init__(self):
+        FakeSession.__init__(self, None)
+        self.release = threading.Event()
+        self.stalled = FakeResponse({"stalled": True})
+
+    def get(self, url, **kwargs):
+        self.calls.append((url, kwargs))
+        if len(self.calls) == 1:
+            self.release.wait(5)
+            return self.stalled
+        return FakeResponse({"hedged": True})
+
+
+def test_hedged_requests():
+    client = make_client(None, hedge=True)
+    client.session = StalledSession()
+    # Nothing is hedged before the usual response time is known.
+    assert client.latencies.threshold("vehicle") is None
+    for _ in range(20):
+        client.latencies.add("vehicle", 0.001)
+    try:
+        assert client.get_json("vehicle", {"id": "IC1530"}) == {"hedged": True}
+        assert client.counts["hedged"] == 1 and client.counts["hedge_won"] == 1
+    finally:
+        client.session.release.set()
+        client.close()
+    client._executor.shutdown(wait=True)
+    assert client.session.stalled.closed
+
+
+class SlowLimiter(FakeLimiter):
+    def acquire(self):
+        FakeLimiter.acquire(self)
+        time.sleep(0.1)
+        return 0.1
+
+
+def test_rate_limit_wait_is_not_hedged():
+    client = make_client(FakeResponse({"departures": []}), hedge=True)
+    client.limiter = SlowLimiter()
+    for _ in range(20):
+        client.latencies.add("liveboard", 0.001)
+    assert client.get_json("liveboard", {}) == {"departures": []}
+    assert client.counts["hedged"] == 0 and client.limiter.acquired == 1
+    assert max(client.latencies.samples["liveboard"]) < 0.1
+
+
+class BrokenStream(FakeResponse):
+    encoding = "utf-8"
+
+    def iter_content(self, size):
+        yield b'{"vehicle": '
+        raise requests.exceptions.ChunkedEncodingError("Connection broken")
+
+
+def test_broken_stream():
+    client = make_client(BrokenStream(None))
+    chunks = client.iter_text("vehicle", {"id": "IC1530"})
+    assert next(chunks) == '{"vehicle": '
+    with pytest.raises(APIUnavailableError):
+        next(chunks)
@@ -0,0 +1,113 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import pytest
+from irail import launcher
+from irail.commands.daemon import CommandRunner, is_running, serve
+
+
+@pytest.fixture
+def daemon(fake_irail, tmpdir):
+    """
+    `irail serve` on a socket in the test directory,
+    talking to the stand-in API.
+    """
+    path = str(tmpdir.join("irail.sock"))
+    started = threading.Event()
+    servers = []
+
+    def ready(server):
+        servers.append(server)
+        started.set()
+
+    thread = threading.Thread(target=serve, args=(path, CommandRunner(), ready))
+    thread.start()
+    started.wait(5)
+    yield path
+    servers[0].shutdown()
+    thread.join(5)
+
+
+@pytest.mark.parametrize("args, expected", [
+    (["liveboard", "Gent-Sint-Pieters"], True),
+    (["vehicle", "IC1530", "-f", "json"], True),
+    (["route", "Gent", "Brussel", "-f", "json", "--", "-c"], True),
+    (["route", "Gent", "Brussel", "--format=csv"], True),
+    (["route", "Gent", "Brussel"], False),
+    (["route", "Gent", "Brussel", "-f", "text"], False),
+    (["liveboard", "Gent-Sint-Pieters", "--continuous"], False),
+    (["liveboard", "Gent-Sint-Pieters", "-mc"], False),
+    (["liveboard", "Gent-Sint-Pieters", "--stream"], False),
+    (["vehicle", "IC1530", "-f", "ndjson", "--stream"], False),
+    (["route", "--help"], False),
+    (["--timings", "liveboard", "Gent"], False),
+    (["batch"], False),
+    ([], False),
+])
+def test_forwardable(args, expected):
+    assert launcher.forwardable(args) == expected
+
+
+def test_socket_path():
+    assert launcher.socket_path({"IRAIL_SOCKET": "/run/irail"}) == "/run/irail"
+    assert launcher.socket_path({"IRAIL_HOME": "/data"}) == os.path.join("/data", "irail.sock")
+
+
+def test_forwarded_commands(daemon, fake_irail):
+    reply = launcher.forward(["liveboard", "Gent-Sint-Pieters", "-f", "json"], daemon)
+    assert reply["exit"] == 0
+    assert json.loads(reply["stdout"])[0]["station"] == "Gent-Sint-Pieters"
+    reply = launcher.forward(["vehicle", "IC1530", "-f", "ndjson"], daemon)
+    assert json.loads(reply["stdout"].splitlines()[0])["station"] == "Oostende"
+    # The catalogue was loaded when the daemon started, and is kept.
+    assert [feature for feature, _ in fake_irail.requests].count("stations") == 1
+
+
+def test_usage_errors_are_forwarded(daemon):
+    reply = launcher.forward(["vehicle"], daemon)
+    assert reply["exit"] == 2
+    assert "Usage: irail vehicle" in reply["stderr"]
+
+
+def test_prompts_fall_back(daemon):
+    assert launcher.forward(["route", "Gent-Sint-Pieters", "Brussel-Zuid"], daemon) is None
+
+
+def test_other_client_settings_fall_back(fake_irail):
+    request = launcher.make_request(["vehicle", "IC1530", "-f", "json"])
+    assert CommandRunner().run(request)["exit"] == 0
+    request["env"]["IRAIL_API_URL"] = "http://elsewhere.invalid/"
+    assert CommandRunner().run(request) == {"fallback": True}
+
+
+def test_traced_commands_leave_the_tracer_off(fake_irail):
+    from irail.commands.trace import tracer
+    request = launcher.make_request(["vehicle", "IC1530", "-f", "json"])
+    request["env"]["IRAIL_TRACE"] = "1"
+    runner = CommandRunner()
+    for _ in range(2):
+        assert runner.run(request)["exit"] == 0
+        assert not tracer.enabled
+        assert tracer.spans == []
+
+
+def test_stale_socket(tmpdir):
+    path = str(tmpdir.join("irail.sock"))
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.close()
+    assert launcher.forward(["liveboard", "Gent-Sint-Pieters"], path) is None
+    assert not is_running(path)
+    assert not os.path.exists(path)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="-X importtime needs Python 3.7")
+def test_launcher_imports_almost_nothing():
+    process = subprocess.Popen([sys.executable, "-X", "importtime", "-c", "import irail.launcher"],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = process.communicate()
+    assert "irail.launcher" in err.decode()
+    assert "click" not in err.decode()
@@ -0,0 +1,89 @@
+import json
+import pytest
+import time
+from click.testing import CliRunner
+from irail.commands import client, cmd_liveboard, cmd_route, cmd_vehicle, output
+from irail.commands.client import APIResponseError, APIUnavailableError
+
+
+def invoke(command, *args):
+    result = CliRunner().invoke(command, list(args))
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_liveboard(fake_irail):
+    departures = json.loads(invoke(cmd_liveboard.cli, "gent sint pieters", "-f", "json"))
+    assert departures and departures[0]["station"] == "Gent-Sint-Pieters"
+    assert [feature for feature, _ in fake_irail.requests] == ["stations", "liveboard"]
+
+
+def test_streamed_vehicle(fake_irail):
+    fake_irail.chunk_size = 256
+    stops = invoke(cmd_vehicle.cli, "IC1530", "-f", "ndjson", "--stream").splitlines()
+    assert json.loads(stops[0])["station"] == "Oostende"
+
+
+def test_streamed_rows_are_written_as_they_arrive(fake_irail, monkeypatch):
+    fake_irail.chunk_size = 256
+    fake_irail.chunk_delay = 0.05
+    writes = []
+    monkeypatch.setattr(output.click, "echo",
+                        lambda text, file=None, nl=True: writes.append(time.time()))
+    invoke(cmd_vehicle.cli, "IC1530", "-f", "ndjson", "--stream")
+    assert len(writes) > 1
+    assert writes[-1] - writes[0] > 0.4
+
+
+def test_route(fake_irail):
+    connections = json.loads(invoke(cmd_route.cli, "Gent-Sint-Pieters", "Brussel-Zuid", "-f", "json"))
+    assert len(connections) == 3
+    feature, params = fake_irail.requests[-1]
+    assert (feature, params["from_station"], params["to"]) == \
+        ("connections", "Gent-Sint-Pieters", "Brussel-Zuid")
+
+
+def test_injected_errors(fake_irail):
+    fake_irail.error_rate = 1.0
+    fake_irail.error_status = 500
+    client.get_client().sleep = lambda seconds: None
+    with pytest.raises(APIResponseError):
+        client.get_client().get_json("vehicle", {"id": "IC1530", "format": "json"})
+    assert len(fake_irail.requests) == client.RETRIES + 1
+
+
+def test_throttled_requests_are_retried(fake_irail):
+    fake_irail.error_rate = 1.0
+    fake_irail.error_status = 429
+    fake_irail.retry_after = 0
+    with pytest.raises(APIUnavailableError):
+        client.get_client().get_json("vehicle", {"id": "IC1530", "format": "json"})
+    assert len(fake_irail.requests) == client.THROTTLE_RETRIES + 1
+
+
+def test_timings(fake_irail, monkeypatch, tmpdir):
+    from irail import cli
+    from irail.commands.trace import tracer
+    monkeypatch.setattr(tracer, "enabled", False)
+    monkeypatch.setattr(tracer, "spans", [])
+    monkeypatch.setattr(tracer, "counters", {})
+    path = str(tmpdir.join("trace.json"))
+    result = CliRunner().invoke(cli.cli, ["--timings", "--trace", path,
+                                          "vehicle", "IC1530", "-f", "json"])
+    assert result.exit_code == 0, result.output
+    assert len(json.loads(result.stdout)) == 7
+    assert "http vehicle" in result.stderr
+    assert "requests.vehicle" in result.stderr
+    assert "cache.miss" in result.stderr
+    with open(path) as f:
+        names = set(event["name"] for event in json.load(f)["traceEvents"])
+    assert set(["api vehicle", "http vehicle", "decode vehicle", "parse", "render"]) <= names
+
+
+def test_stalled_stream(fake_irail):
+    fake_irail.chunk_size = 256
+    fake_irail.chunk_delay = 0.5
+    client.get_client().timeout = (client.CONNECT_TIMEOUT, 0.2)
+    result = CliRunner().invoke(cmd_vehicle.cli, ["IC1530", "-f", "ndjson", "--stream"])
+    assert result.exit_code == 1
+    assert result.output.splitlines()[-1] == "The iRail API stopped sending its response."
@@ -0,0 +1,102 @@
+import json
+import pytest
+from click.testing import CliRunner
+from irail.commands import cmd_batch, cmd_liveboard, cmd_prefetch, cmd_route
+from irail.commands.favourites import (FavouritesError, Favourite, due_favourites, favourites_path,
+                                       human_readable_age, load_favourites, parse_clock,
+                                       prefetched_age, seconds_until_due)
+from irail.commands.times import formatter
+
+
+def at(hours, minutes):
+    return formatter.epoch(2016, 5, 9, hours * 3600 + minutes * 60)
+
+
+def favourite(*times):
+    return Favourite({"type": "liveboard", "station": "Gent-Sint-Pieters"},
+                     [parse_clock(time) for time in times])
+
+
+def write_favourites(favourites):
+    with open(favourites_path(), "w") as f:
+        json.dump(favourites, f)
+
+
+def test_parse_clock():
+    assert parse_clock("07:40") == 460
+    for text in ("7.40", "24:00", "07:60", None):
+        with pytest.raises(FavouritesError):
+            parse_clock(text)
+
+
+def test_load_favourites(tmpdir):
+    path = str(tmpdir.join("favourites.json"))
+    assert load_favourites(path) == []
+    with open(path, "w") as f:
+        json.dump([{"type": "route", "from": "Gent-Sint-Pieters", "to": "Brussel-Zuid",
+                    "at": ["07:45", "17:10"]}], f)
+    favourite, = load_favourites(path)
+    assert favourite.times == [465, 1030]
+    assert favourite.describe() == "route Gent-Sint-Pieters - Brussel-Zuid"
+    for bad in ([{"type": "vehicle", "id": "IC1530", "at": ["07:45"]}],
+                [{"type": "liveboard", "at": ["07:45"]}],
+                [{"type": "liveboard", "station": "Gent-Sint-Pieters"}]):
+        with open(path, "w") as f:
+            json.dump(bad, f)
+        with pytest.raises(FavouritesError):
+            load_favourites(path)
+
+
+def test_due_favourites():
+    morning, evening = favourite("07:40"), favourite("17:10", "23:55")
+    # Due from 10 minutes before until 15 minutes after, and kept until then.
+    assert due_favourites([morning, evening], at(7, 35)) == [(morning, 20 * 60)]
+    assert due_favourites([morning, evening], at(7, 50)) == [(morning, 5 * 60)]
+    assert due_favourites([morning, evening], at(7, 56)) == []
+    assert due_favourites([morning, evening], at(0, 5)) == [(evening, 5 * 60)]
+    assert seconds_until_due([morning, evening], at(7, 35)) == (17 * 60 + 10 - 7 * 60 - 35 - 10) * 60
+    assert seconds_until_due([morning], at(7, 35)) is None
+
+
+def test_prefetched_age():
+    assert prefetched_age([None]) is None
+    assert prefetched_age([1000, 1200, None], now=1300) == 300
+    assert human_readable_age(None) == ""
+    assert human_readable_age(30) == "prefetched just now"
+    assert human_readable_age(300) == "prefetched 5 min ago"
+
+
+def test_prefetched_queries_are_answered_from_the_cache(fake_irail):
+    write_favourites([{"type": "liveboard", "station": "Gent-Sint-Pieters", "at": ["07:40"]},
+                      {"type": "route", "from": "Gent-Sint-Pieters", "to": "Brussel-Zuid",
+                       "at": ["07:45"]}])
+    result = CliRunner().invoke(cmd_prefetch.cli, ["--all"])
+    assert result.exit_code == 0, result.output
+    assert "liveboard Gent-Sint-Pieters" in result.output
+    prefetched = len(fake_irail.requests)
+
+    result = CliRunner().invoke(cmd_liveboard.cli, ["Gent-Sint-Pieters"])
+    assert result.exit_code == 0, result.output
+    assert "prefetched just now" in result.output
+    result = CliRunner().invoke(cmd_route.cli, ["Gent-Sint-Pieters", "Brussel-Zuid"], input="n\n")
+    assert "prefetched just now" in result.output
+    assert len(fake_irail.requests) == prefetched
+
+    # The responses themselves are left as the API sent them.
+    result = CliRunner().invoke(cmd_batch.cli, [], input='{"type": "liveboard", '
+                                                         '"station": "Gent-Sint-Pieters"}\n')
+    assert result.exit_code == 0, result.output
+    assert "prefetched" not in json.loads(result.output)["result"]
+
+
+def test_prefetch_without_favourites():
+    result = CliRunner().invoke(cmd_prefetch.cli, [])
+    assert result.exit_code == 1
+    assert "No favourites yet" in result.output
+
+
+def test_prefetch_unknown_station(fake_irail):
+    write_favourites([{"type": "liveboard", "station": "Nowhere-Sint-Nergens", "at": ["07:40"]}])
+    result = CliRunner().invoke(cmd_prefetch.cli, ["--all"])
+    assert result.exit_code == 1
+    assert "No station like Nowhere-Sint-Nergens found." in result.output
@@ -0,0 +1,72 @@
+import os
+import pytest
+from irail.commands import history
+from irail.commands.history import History, CANCELLED, PLATFORM_CHANGED, observations
+
+
+def test_liveboard_observations(load_fixture):
+    rows = list(observations("liveboard", load_fixture("liveboard_gent_sint_pieters")))
+    assert rows[1] == (1462782000, 1462782300, "Gent-Sint-Pieters", "BE.NMBS.IC1530",
+                       "Antwerpen-Centraal", 240, 0)
+    assert rows[2][-1] == PLATFORM_CHANGED
+    assert rows[3][-1] == CANCELLED
+
+
+def test_vehicle_observations(load_fixture):
+    rows = list(observations("vehicle", load_fixture("vehicle_IC1530")))
+    assert len(rows) == 7
+    assert all(row[4] == "Antwerpen-Centraal" for row in rows)
+
+
+def test_append(tmpdir, load_fixture):
+    store = History(str(tmpdir.join("history")))
+    assert len(store) == 0
+    assert store.record("liveboard", load_fixture("liveboard_gent_sint_pieters")) == 4
+    assert store.record("vehicle", load_fixture("vehicle_IC1530")) == 7
+    assert len(store) == 11
+    # Another process sees the same names.
+    names = History(store.directory).load_names()
+    assert names["stations"][0] == "Gent-Sint-Pieters"
+    assert "BE.NMBS.IC1530" in names["vehicles"]
+
+
+def test_interrupted_append_is_repaired(tmpdir, load_fixture):
+    store = History(str(tmpdir.join("history")))
+    store.record("vehicle", load_fixture("vehicle_IC1530"))
+    with open(store.path("delay.bin"), "ab") as f:
+        f.write(b"\0\0")
+    assert len(store) == 7
+    store.record("vehicle", load_fixture("vehicle_IC1530"))
+    assert len(store) == 14
+    assert os.path.getsize(store.path("delay.bin")) == 14 * 4
+
+
+def test_recording_is_opt_in(monkeypatch, load_fixture):
+    monkeypatch.setattr(history, "_recorder", None)
+    history.record_response("liveboard", load_fixture("liveboard_gent_sint_pieters"))
+    assert history.get_recorder() is None
+    monkeypatch.setenv("IRAIL_RECORD", "1")
+    history.record_response("liveboard", load_fixture("liveboard_gent_sint_pieters"))
+    history.record_response("connections", {})
+    assert len(history.get_recorder()) == 4
+
+
+def test_columns_are_memory_mapped(tmpdir, load_fixture):
+    numpy = pytest.importorskip("numpy")
+    store = History(str(tmpdir.join("history")))
+    store.record("liveboard", load_fixture("liveboard_gent_sint_pieters"))
+    columns = store.columns()
+    assert isinstance(columns["delay"], numpy.memmap)
+    assert columns["delay"].tolist() == [0, 240, 0, 0]
+
+
+def test_cached_responses_are_recorded_once(fake_irail, monkeypatch):
+    from irail.commands.utils import api_fetch
+    monkeypatch.setattr(history, "_recorder", None)
+    monkeypatch.setenv("IRAIL_RECORD", "1")
+    api_fetch("liveboard", station="Gent-Sint-Pieters")
+    recorded = len(history.get_recorder())
+    assert recorded
+    api_fetch("liveboard", station="Gent-Sint-Pieters")
+    assert len(history.get_recorder()) == recorded
+    assert [feature for feature, _ in fake_irail.requests].count("liveboard") == 1
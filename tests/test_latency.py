@@ -0,0 +1,21 @@
+from irail.commands.latency import LatencyTracker
+
+
+def test_threshold():
+    tracker = LatencyTracker(window=100, percentile=95, min_samples=10, min_threshold=0)
+    for seconds in range(9):
+        tracker.add("liveboard", seconds)
+    assert tracker.threshold("liveboard") is None
+    for seconds in range(9, 100):
+        tracker.add("liveboard", seconds / 10.0 if seconds < 95 else seconds)
+    assert tracker.threshold("liveboard") == 95
+    assert tracker.threshold("vehicle") is None
+
+
+def test_window_and_floor():
+    tracker = LatencyTracker(window=10, min_samples=10, min_threshold=0.5)
+    for _ in range(10):
+        tracker.add("vehicle", 5)
+    for _ in range(10):
+        tracker.add("vehicle", 0.01)
+    assert tracker.threshold("vehicle") == 0.5
@@ -0,0 +1,63 @@
+import json
+from click.testing import CliRunner
+from irail.commands import cmd_liveboard, utils
+from irail.commands.streaming import JSONStream
+
+
+BOARDS = {"Gent-Sint-Pieters": "liveboard_gent_sint_pieters",
+          "Gent-Dampoort": "liveboard_gent_dampoort"}
+
+
+def run_liveboard(monkeypatch, load_fixture, *args):
+    monkeypatch.setattr(utils, "find_stations", lambda s: [{"name": s}])
+    monkeypatch.setattr(cmd_liveboard, "liveboard_request",
+                        lambda station: load_fixture(BOARDS[station]))
+    return CliRunner().invoke(cmd_liveboard.cli, list(args))
+
+
+def test_single_station(monkeypatch, load_fixture):
+    result = run_liveboard(monkeypatch, load_fixture, "Gent-Sint-Pieters")
+    assert result.exit_code == 0
+    assert "Gent-Sint-Pieters (direction: all)" in result.output
+    assert "Oostende" in result.output
+    assert "Gent-Dampoort" not in result.output
+
+
+def test_sections_per_station(monkeypatch, load_fixture):
+    result = run_liveboard(monkeypatch, load_fixture, "Gent-Sint-Pieters", "Gent-Dampoort")
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    headers = [i for i, line in enumerate(lines) if "(direction: all)" in line]
+    assert len(headers) == 2
+    assert "Gent-Dampoort" in lines[headers[1]]
+
+
+def test_merged_board(monkeypatch, load_fixture):
+    result = run_liveboard(monkeypatch, load_fixture, "Gent-Sint-Pieters", "Gent-Dampoort",
+                           "--merge", "-t", "IC")
+    assert result.exit_code == 0
+    rows = result.output.splitlines()[1:]
+    assert [row.split(" > ")[0].split()[-1] for row in rows] == \
+        ["Gent-Sint-Pieters", "Gent-Dampoort", "Gent-Sint-Pieters"]
+
+
+def test_streamed_board(monkeypatch, load_fixture):
+    text = json.dumps(load_fixture("liveboard_gent_sint_pieters"))
+    monkeypatch.setattr(cmd_liveboard, "stream_request",
+                        lambda feature, path, station: JSONStream([text[:300], text[300:]], path))
+    result = run_liveboard(monkeypatch, load_fixture, "Gent-Sint-Pieters", "--stream")
+    assert result.exit_code == 0
+    assert result.output == run_liveboard(monkeypatch, load_fixture, "Gent-Sint-Pieters").output
+
+
+def test_truncated_stream(monkeypatch, load_fixture):
+    text = json.dumps(load_fixture("liveboard_gent_sint_pieters"))
+    cut = text.index('"departure"') + 300
+    monkeypatch.setattr(cmd_liveboard, "stream_request",
+                        lambda feature, path, station: JSONStream([text[:cut]], path))
+    result = run_liveboard(monkeypatch, load_fixture, "Gent-Sint-Pieters", "--stream")
+    assert result.exit_code == 1
+    assert "The api doesn't seem to be working properly." in result.output
+    result = run_liveboard(monkeypatch, load_fixture, "Gent-Sint-Pieters", "--stream", "-f", "csv")
+    assert result.exit_code == 1
+    assert "The api doesn't seem to be working properly." in result.output
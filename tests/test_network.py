@@ -0,0 +1,75 @@
+import json
+import threading
+from click.testing import CliRunner
+from irail.commands import cmd_network
+from irail.commands.network import NetworkSummary, sweep
+from irail.commands.records import parse_liveboard
+
+
+def test_vehicles_count_once_per_line(load_fixture):
+    summary = NetworkSummary()
+    board = parse_liveboard(load_fixture("liveboard_gent_sint_pieters"))
+    summary.add(board)
+    summary.add(board)
+    stations = summary.station_rows()
+    assert [row["trains"] for row in stations] == [2 * len(board.departures)]
+    assert sum(row["trains"] for row in summary.line_rows()) == len(board.departures)
+    assert summary.total().trains == len(board.departures)
+
+
+def test_vehicles_keep_their_first_departure(load_fixture):
+    summary = NetworkSummary()
+    board = parse_liveboard(load_fixture("liveboard_gent_sint_pieters"))
+    summary.add(board)
+    later = parse_liveboard(load_fixture("liveboard_gent_sint_pieters"))
+    for departure in later.departures:
+        departure.time += 600
+        departure.delay += 3600
+    summary.add(later)
+    assert max(row["max_delay"] for row in summary.line_rows()) < 3600
+
+
+def test_sweep_is_bounded():
+    lock = threading.Lock()
+    release = threading.Event()
+    counts = {"running": 0, "most running": 0, "taken": 0, "done": 0, "most outstanding": 0}
+
+    def stations():
+        for station in range(50):
+            with lock:
+                counts["taken"] += 1
+                counts["most outstanding"] = max(counts["most outstanding"],
+                                                 counts["taken"] - counts["done"])
+            yield station
+
+    def fetch(station):
+        with lock:
+            counts["running"] += 1
+            counts["most running"] = max(counts["most running"], counts["running"])
+        # Hold everything up until the sweep had the chance to queue too much.
+        release.wait(5)
+        with lock:
+            counts["running"] -= 1
+        return station * 2
+
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    results = []
+    for result in sweep(stations(), fetch, 4):
+        with lock:
+            counts["done"] += 1
+        results.append(result)
+    timer.join()
+    assert sorted(results) == [i * 2 for i in range(50)]
+    assert counts["most running"] == 4
+    assert counts["most outstanding"] == 2 * 4
+
+
+def test_network(fake_irail):
+    result = CliRunner().invoke(cmd_network.cli, ["-f", "json"])
+    assert result.exit_code == 0, result.output
+    rows = json.loads(result.stdout)
+    assert set(row["kind"] for row in rows) == {"station", "line"}
+    features = [feature for feature, _ in fake_irail.requests]
+    assert features.count("stations") == 1
+    assert features.count("liveboard") == 6
@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+from click.testing import CliRunner
+from irail.commands import cmd_liveboard, cmd_route, cmd_vehicle, output, utils
+from irail.commands.output import RowWriter
+
+
+def write_rows(capsys, format, rows):
+    writer = RowWriter(format, ["a", "b"])
+    writer.write_all(rows)
+    writer.close()
+    return capsys.readouterr().out
+
+
+def test_json_writer(capsys):
+    assert json.loads(write_rows(capsys, "json", [{"a": 1, "b": "x"}, {"a": 2, "b": "y"}])) == \
+        [{"a": 1, "b": "x"}, {"a": 2, "b": "y"}]
+    assert json.loads(write_rows(capsys, "json", [])) == []
+
+
+def test_ndjson_writer(capsys):
+    lines = write_rows(capsys, "ndjson", [{"a": 1, "b": ["x", "y"]}]).splitlines()
+    assert [json.loads(line) for line in lines] == [{"a": 1, "b": ["x", "y"]}]
+
+
+def test_csv_writer(capsys):
+    text = write_rows(capsys, "csv", [{"a": 1, "b": ["x", "y"]}, {"a": 2, "b": "with, comma"}])
+    assert list(csv.reader(io.StringIO(text))) == [["a", "b"], ["1", "x y"], ["2", "with, comma"]]
+
+
+def test_csv_writer_non_ascii(capsys):
+    text = write_rows(capsys, "csv", [{"a": u"Li\u00e8ge-Guillemins", "b": 1}])
+    assert list(csv.reader(io.StringIO(text)))[1] == [u"Li\u00e8ge-Guillemins", "1"]
+
+
+def test_writer_flushes_in_chunks(monkeypatch):
+    writes = []
+    monkeypatch.setattr(output, "BUFFER_SIZE", 100)
+    monkeypatch.setattr(output.click, "echo", lambda text, file=None, nl=True: writes.append(text))
+    writer = RowWriter("ndjson", ["a"])
+    writer.write_all({"a": "x" * 10} for _ in range(50))
+    assert 1 < len(writes) < 50
+    writer.close()
+    assert len("".join(writes).splitlines()) == 50
+
+
+def test_writer_flushes_each_row(monkeypatch):
+    writes = []
+    monkeypatch.setattr(output.click, "echo", lambda text, file=None, nl=True: writes.append(text))
+    writer = RowWriter("json", ["a"], flush_each_row=True)
+    writer.write({"a": 1})
+    assert writes == ['[\n{"a":1}']
+    writer.write({"a": 2})
+    writer.close()
+    assert json.loads("".join(writes)) == [{"a": 1}, {"a": 2}]
+
+
+def test_liveboard_csv(monkeypatch, load_fixture):
+    monkeypatch.setattr(utils, "find_stations", lambda s: [{"name": s}])
+    monkeypatch.setattr(cmd_liveboard, "liveboard_request",
+                        lambda station: load_fixture("liveboard_gent_sint_pieters"))
+    result = CliRunner().invoke(cmd_liveboard.cli, ["Gent-Sint-Pieters", "-f", "csv", "-t", "IC"])
+    assert result.exit_code == 0
+    assert "\x1b" not in result.output
+    rows = list(csv.DictReader(io.StringIO(result.output)))
+    assert rows and all(row["type"] == "IC" for row in rows)
+    assert rows[0]["station"] == "Gent-Sint-Pieters"
+
+
+def test_liveboard_format_rejects_continuous():
+    result = CliRunner().invoke(cmd_liveboard.cli, ["Gent-Sint-Pieters", "-f", "json", "-c"])
+    assert result.exit_code == 2
+
+
+def test_route_json(monkeypatch, load_fixture):
+    monkeypatch.setattr(utils, "find_stations", lambda s: [{"name": s}])
+    monkeypatch.setattr(cmd_route, "route_response",
+                        lambda *args: load_fixture("connections_gent_brussel"))
+    result = CliRunner().invoke(cmd_route.cli, ["Gent-Sint-Pieters", "Brussel-Zuid", "-f", "json"])
+    assert result.exit_code == 0
+    connections = json.loads(result.output)
+    assert len(connections) == 3
+    assert any(connection["vehicles"] == ["BE.NMBS.L568", "BE.NMBS.IC2318"]
+               for connection in connections)
+
+
+def test_vehicle_ndjson(monkeypatch, load_fixture):
+    monkeypatch.setattr(cmd_vehicle, "vehicle_request", lambda vehicle_id: load_fixture("vehicle_IC1530"))
+    result = CliRunner().invoke(cmd_vehicle.cli, ["IC1530", "-f", "ndjson"])
+    assert result.exit_code == 0
+    stops = [json.loads(line) for line in result.output.splitlines()]
+    assert len(stops) == 7
+    assert stops[0]["vehicle"] == "BE.NMBS.IC1530"
+    assert stops[0]["station"] == "Oostende"
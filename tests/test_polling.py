@@ -0,0 +1,12 @@
+from irail.commands.polling import AdaptivePoller
+
+
+def test_adaptive_polling():
+    poller = AdaptivePoller(minimum=30, maximum=120, backoff=2)
+    assert poller.next_interval(True, 1000) == 30
+    assert poller.next_interval(False, 1000) == 60
+    assert poller.next_interval(False, 1000) == 120
+    assert poller.next_interval(False, 1000) == 120
+    assert poller.next_interval(False, 1000, next_event=1045) == 45
+    assert poller.next_interval(False, 1000, next_event=1010) == 30
+    assert poller.next_interval(True, 1000) == 30
@@ -0,0 +1,59 @@
+from irail.commands.ratelimit import TokenBucket, parse_retry_after, get_limiter
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def make_bucket(clock, path=None):
+    return TokenBucket(rate=2, burst=3, path=path, clock=clock, sleep=clock.sleep)
+
+
+def test_burst_then_rate():
+    clock = FakeClock()
+    bucket = make_bucket(clock)
+    assert [bucket.acquire() for _ in range(3)] == [0, 0, 0]
+    assert bucket.acquire() == 0.5
+    clock.now += 10
+    assert [bucket.acquire() for _ in range(3)] == [0, 0, 0]
+
+
+def test_shared_through_file(tmpdir):
+    clock = FakeClock()
+    path = str(tmpdir.join("ratelimit.lock"))
+    first, second = make_bucket(clock, path), make_bucket(clock, path)
+    first.acquire()
+    first.acquire()
+    second.acquire()
+    assert second.acquire() == 0.5
+
+
+def test_pause_holds_back_everyone(tmpdir):
+    clock = FakeClock()
+    path = str(tmpdir.join("ratelimit.lock"))
+    first, second = make_bucket(clock, path), make_bucket(clock, path)
+    first.pause(5)
+    assert second.acquire() == 5
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", now=1445412470) == 10
+
+
+def test_get_limiter(monkeypatch):
+    monkeypatch.setenv("IRAIL_RATE_LIMIT", "0")
+    assert get_limiter() is None
+    monkeypatch.setenv("IRAIL_RATE_LIMIT", "10")
+    assert get_limiter().rate == 10
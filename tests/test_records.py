@@ -0,0 +1,55 @@
+import pytest
+from irail.commands.records import parse_liveboard, parse_connections, parse_vehicle_journey
+from irail.commands.records import parse_vehicle, JourneyTracker
+
+
+def test_parse_vehicle():
+    assert parse_vehicle("BE.NMBS.IC545") == ("IC", "545")
+    assert parse_vehicle("BE.NMBS.IC545") is parse_vehicle("BE.NMBS.IC545")
+    with pytest.raises(ValueError):
+        parse_vehicle("IC")
+
+
+def test_parse_liveboard(load_fixture):
+    board = parse_liveboard(load_fixture("liveboard_gent_sint_pieters"))
+    assert board.station == "Gent-Sint-Pieters"
+    assert board.timestamp == 1462782000
+    first, delayed, moved, cancelled = board.departures
+    assert (first.time, first.vehicle_type, first.vehicle_number, first.direction) == \
+        (1462782120, "IC", "1830", "Oostende")
+    assert first.station == "Gent-Sint-Pieters"
+    assert delayed.delay == 240 and delayed.actual_time == 1462782540
+    assert moved.platform.changed and not first.platform.changed
+    assert cancelled.cancelled and not first.cancelled
+
+
+def test_parse_connections(load_fixture):
+    direct, with_via, _ = parse_connections(load_fixture("connections_gent_brussel")["connection"])
+    assert direct.duration == 1980
+    assert direct.vias == ()
+    assert direct.departure.direction == "Antwerpen-Centraal"
+    via, = with_via.vias
+    assert via.station == "Denderleeuw"
+    assert via.departure.vehicle == "BE.NMBS.IC2318"
+    assert via.departure.direction == "Eupen"
+    assert via.departure.platform.changed and via.departure.delay == 60
+
+
+def test_parse_vehicle_journey(load_fixture):
+    vehicle = parse_vehicle_journey(load_fixture("vehicle_IC1530"))
+    assert vehicle.vehicle == "BE.NMBS.IC1530"
+    assert [stop.station for stop in vehicle.stops][:2] == ["Oostende", "Brugge"]
+    assert vehicle.stops[2].delay == 120
+
+
+def test_journey_tracker(load_fixture):
+    tracker = JourneyTracker()
+    response = load_fixture("vehicle_IC1530")
+    vehicle, changed = tracker.update(response)
+    assert changed == list(range(7))
+    first = vehicle.stops
+    response["stops"]["stop"][3]["delay"] = "300"
+    vehicle, changed = tracker.update(response)
+    assert changed == [3]
+    assert vehicle.stops[3].delay == 300
+    assert vehicle.stops[2] is first[2]
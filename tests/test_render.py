@@ -0,0 +1,70 @@
+import click
+from click.testing import CliRunner
+from irail.commands import cmd_route, utils
+from irail.commands.render import Frame, format_minutes, layout, style, style_sequence
+
+
+class CountingFile(object):
+    def __init__(self):
+        self.writes = []
+
+    def write(self, text):
+        self.writes.append(text)
+
+    def flush(self):
+        pass
+
+
+def test_style_matches_click():
+    assert style("+5 ", fg="red") == click.style("+5 ", fg="red")
+    assert style("3", reverse=True, dim=True) == click.style("3", dim=True, reverse=True)
+    assert style_sequence(fg="red") is style_sequence(fg="red")
+
+
+def test_layout():
+    columns = layout(80, (5, 3, 7, None))
+    assert columns.widths == (5, 3, 7, 62)
+    assert layout(80, (5, 3, 7, None)) is columns
+    assert layout(10, (5, 3, 7, None)).widths[3] == 0
+
+
+def test_layout_row():
+    columns = layout(12, (None, 3, 4))
+    assert columns.row(["Gent-Sint-Pieters", "12", "1.5"]) == "Gen  12  1.5"
+    assert columns.row(["Ay", "3", "-"]) == "Ay    3    -"
+
+
+def test_format_minutes():
+    assert format_minutes(90) == "1.5"
+    assert format_minutes(None) == "-"
+
+
+def test_frame_is_written_at_once():
+    out = CountingFile()
+    frame = Frame(out)
+    frame.line("header", reverse=True)
+    frame.lines(["a", "b"])
+    frame.flush()
+    frame.flush()
+    assert out.writes == ["header\na\nb\n"]
+    assert frame.parts == []
+
+
+def test_route_expansions_are_single_writes(monkeypatch, load_fixture):
+    writes = []
+    monkeypatch.setattr(cmd_route, "route_response",
+                        lambda *args, **kwargs: load_fixture("connections_gent_brussel"))
+    monkeypatch.setattr(utils, "find_stations", lambda s: [{"name": s}])
+    original = Frame.flush
+
+    def flush(frame):
+        if frame.parts:
+            writes.append("".join(frame.parts))
+        original(frame)
+
+    monkeypatch.setattr(Frame, "flush", flush)
+    result = CliRunner().invoke(cmd_route.cli, ["Gent-Sint-Pieters", "Brussel-Zuid"], input="y\n9\n")
+    # The header, the best connection and all other ones after "9".
+    assert len(writes) == 3
+    assert "Other options:" in writes[1]
+    assert click.unstyle(writes[2]) in result.output
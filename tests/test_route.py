@@ -1,6 +1,11 @@
+import json
 import random
 from datetime import datetime
+from click.testing import CliRunner
+from irail.commands import cmd_route, utils
 from irail.commands.cmd_route import verify_date, verify_time, duration_int_to_human_readable_duration
+from irail.commands.cmd_route import get_legs, get_stops_between, sort_connections
+from irail.commands.records import parse_connections, parse_vehicle_journey
 
 
 def test_time_verification():
@@ -28,4 +33,153 @@ def test_date_verification():
         assert verify_date(test_case) is True
 
 def test_duration_int_to_human_readable_duration():
-    pass
\ No newline at end of file
+    pass
+
+
+def test_get_legs(load_fixture):
+    connections = parse_connections(load_fixture("connections_gent_brussel")["connection"])
+    direct, with_via = connections[0], connections[1]
+    assert [(v.vehicle, f, t) for v, f, t in get_legs(direct)] == \
+        [("BE.NMBS.IC1530", "Gent-Sint-Pieters", "Brussel-Zuid")]
+    assert [(v.vehicle, f, t) for v, f, t in get_legs(with_via)] == \
+        [("BE.NMBS.L568", "Gent-Sint-Pieters", "Denderleeuw"),
+         ("BE.NMBS.IC2318", "Denderleeuw", "Brussel-Centraal")]
+
+
+def test_get_stops_between(load_fixture):
+    stops = parse_vehicle_journey(load_fixture("vehicle_IC1530")).stops
+    between = get_stops_between(stops, "Gent-Sint-Pieters", "Brussel-Zuid")
+    assert [stop.station for stop in between] == ["Aalst", "Brussel-Noord"]
+    assert get_stops_between(stops, "Gent-Sint-Pieters", "Eupen") == []
+
+
+def test_route_with_prefetched_stops(monkeypatch, load_fixture):
+    fetched = []
+
+    def fake_fetch(feature, id):
+        fetched.append(id)
+        return load_fixture("vehicle_" + id.split(".")[-1])
+
+    monkeypatch.setattr(utils, "find_stations", lambda s: [{"name": s}])
+    monkeypatch.setattr(cmd_route, "route_response",
+                        lambda *args: load_fixture("connections_gent_brussel"))
+    monkeypatch.setattr(cmd_route, "api_fetch", fake_fetch)
+    result = CliRunner().invoke(cmd_route.cli, ["Gent-Sint-Pieters", "Brussel-Zuid", "--stops"],
+                                input="y\n9\n")
+    assert sorted(fetched) == ["BE.NMBS.IC1530", "BE.NMBS.IC1830", "BE.NMBS.IC2318", "BE.NMBS.L568"]
+    assert "Aalst" in result.output
+    assert "Merelbeke" in result.output
+
+
+def ambiguous_stations(suggestion):
+    return [{"name": suggestion + "-" + suffix} for suffix in ("Sint-Pieters", "Dampoort")]
+
+
+def test_route_speculates_on_the_first_candidate(monkeypatch, load_fixture):
+    requests = []
+
+    def fake_route_response(from_station, to_station, date, time, selection, request=None):
+        requests.append((from_station, to_station, request is not None))
+        return load_fixture("connections_gent_brussel")
+
+    monkeypatch.setattr(utils, "find_stations",
+                        lambda s: ambiguous_stations(s) if s == "Gent" else [{"name": s}])
+    monkeypatch.setattr(cmd_route, "route_response", fake_route_response)
+    result = CliRunner().invoke(cmd_route.cli, ["Gent", "Brussel-Zuid", "-f", "json"], input="0\n")
+    assert result.exit_code == 0, result.output
+    # Only the speculative request, which doesn't exit on errors.
+    assert requests == [("Gent-Sint-Pieters", "Brussel-Zuid", True)]
+
+
+def test_route_drops_the_speculation_for_another_choice(monkeypatch, load_fixture):
+    requests = []
+
+    def fake_route_response(from_station, to_station, date, time, selection, request=None):
+        requests.append((from_station, to_station, request is not None))
+        return load_fixture("connections_gent_brussel")
+
+    monkeypatch.setattr(utils, "find_stations",
+                        lambda s: ambiguous_stations(s) if s == "Gent" else [{"name": s}])
+    monkeypatch.setattr(cmd_route, "route_response", fake_route_response)
+    result = CliRunner().invoke(cmd_route.cli, ["Gent", "Brussel-Zuid", "-f", "json"], input="1\n")
+    assert result.exit_code == 0, result.output
+    assert requests[-1] == ("Gent-Dampoort", "Brussel-Zuid", False)
+
+
+def test_stations_are_looked_up_concurrently(monkeypatch):
+    import threading
+    barrier = threading.Barrier(2, timeout=5)
+
+    def find_stations(suggestion):
+        barrier.wait()
+        return [{"name": suggestion}]
+
+    monkeypatch.setattr(utils, "find_stations", find_stations)
+    assert utils.get_stations_from_user_input(["Gent", "Brussel"]) == ["Gent", "Brussel"]
+
+
+def test_sort_connections(load_fixture):
+    connections = parse_connections(load_fixture("connections_gent_brussel")["connection"])
+    assert [c.departure.vehicle for c in sort_connections(connections)] == \
+        ["BE.NMBS.IC1530", "BE.NMBS.IC1830", "BE.NMBS.L568"]
+
+
+def test_parse_window():
+    from irail.commands.cmd_route import parse_window
+    assert parse_window("3h") == 3 * 3600
+    assert parse_window("90m") == 90 * 60
+    assert parse_window("1h30m") == 90 * 60
+    for invalid in ("", "3 hours", "h"):
+        try:
+            parse_window(invalid)
+        except ValueError:
+            continue
+        assert False, invalid
+
+
+def test_page_times():
+    from irail.commands.cmd_route import page_times
+    assert page_times(0, 3600, "depart") == [0, 1800, 3600]
+    assert page_times(3600, 3600, "arrive") == [3600, 1800, 0]
+
+
+def test_top_connections(load_fixture):
+    from irail.commands.cmd_route import TopConnections
+    page = parse_connections(load_fixture("connections_gent_brussel")["connection"])
+    top = TopConnections(2)
+    added = [top.add(connection) for connection in page + parse_connections(
+        load_fixture("connections_gent_brussel")["connection"])]
+    assert added == [True, True, True, False, False, False]
+    assert top.ranked() == sort_connections(page)[:2]
+
+
+def test_route_window(monkeypatch, load_fixture):
+    pages = []
+
+    def fake_route_request(from_station, to_station, date, time, selection):
+        pages.append(time)
+        if time == "1140":
+            raise utils.NoConnectionsFound
+        return load_fixture("connections_gent_brussel")["connection"]
+
+    monkeypatch.setattr(utils, "find_stations", lambda s: [{"name": s}])
+    monkeypatch.setattr(cmd_route, "verify_date", lambda date: True)
+    monkeypatch.setattr(cmd_route, "route_request", fake_route_request)
+    result = CliRunner().invoke(cmd_route.cli, ["Gent-Sint-Pieters", "Brussel-Zuid", "-d", "090516",
+                                                "-t", "1040", "-w", "1h", "-k", "2", "-f", "json"])
+    assert result.exit_code == 0, result.output
+    assert sorted(pages) == ["1040", "1110", "1140"]
+    # the 10:30 departure is before the window
+    assert [c["departure_time"] for c in json.loads(result.output)] == [1462784400, 1462783500]
+
+
+def test_route_window_text(monkeypatch, load_fixture):
+    monkeypatch.setattr(utils, "find_stations", lambda s: [{"name": s}])
+    monkeypatch.setattr(cmd_route, "verify_date", lambda date: True)
+    monkeypatch.setattr(cmd_route, "route_request",
+                        lambda *args: load_fixture("connections_gent_brussel")["connection"])
+    result = CliRunner().invoke(cmd_route.cli, ["Gent-Sint-Pieters", "Brussel-Zuid", "-d", "090516",
+                                                "-t", "1040", "-w", "1h", "-k", "2"], input="y\n9\n")
+    assert not isinstance(result.exception, NameError), result.output
+    assert result.exit_code == 1, result.output
+    assert "Which one" in result.output
@@ -0,0 +1,28 @@
+from irail.commands.screen import Screen, ERASE_LINE
+
+
+def test_first_frame_is_written_in_full():
+    assert Screen().render(["a", "b"]) == "a\nb\n"
+
+
+def test_only_changed_rows_are_rewritten():
+    screen = Screen()
+    screen.previous = ["header", "10:00 IC", "10:05 L", "10:10 S"]
+    assert screen.changed_rows(["header", "10:00 IC", "10:05 L +3", "10:10 S"]) == [2]
+    output = screen.render(["header", "10:00 IC", "10:05 L +3", "10:10 S"])
+    assert output == "\x1b[2F" + ERASE_LINE + "10:05 L +3\n\n"
+    assert screen.render(list(screen.previous)) == ""
+
+
+def test_shorter_frame_clears_leftover_rows():
+    screen = Screen()
+    screen.previous = ["header", "10:00 IC", "10:05 L"]
+    output = screen.render(["header", "10:05 L"])
+    assert output == ("\x1b[2F" + ERASE_LINE + "10:05 L\n" + ERASE_LINE + "\n" + "\x1b[1F")
+
+
+
+def test_longer_frame_only_appends_rows():
+    screen = Screen()
+    screen.previous = ["a", "b", "c"]
+    assert screen.render(["a", "b", "c", "d"]) == ERASE_LINE + "d\n"
@@ -0,0 +1,43 @@
+import threading
+import pytest
+from irail.commands.singleflight import SingleFlight
+
+
+def test_identical_calls_share_one_result():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return {"departures": []}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do("key", fetch)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flights.do("key", fetch)))
+                 for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    while flights.calls["key"].waiters < 3:
+        pass
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert all(result is results[0][0] for result, _ in results)
+
+
+def test_errors_are_shared_and_not_remembered():
+    flights = SingleFlight()
+
+    def fail():
+        raise ValueError("broken")
+
+    with pytest.raises(ValueError):
+        flights.do("key", fail)
+    assert flights.do("key", lambda: 1) == (1, False)
@@ -0,0 +1,47 @@
+import threading
+from irail.commands.speculation import Speculation
+
+
+def test_call_uses_the_speculation():
+    calls = []
+
+    def function(x):
+        calls.append(x)
+        return x * 2
+
+    speculation = Speculation(function)
+    speculation.start(2)
+    assert speculation.call(2) == 4
+    assert calls == [2]
+    speculation.shutdown()
+
+
+def test_call_with_other_arguments_calls_again():
+    calls = []
+    started = threading.Event()
+
+    def function(x):
+        calls.append(x)
+        started.set()
+        return x * 2
+
+    speculation = Speculation(function)
+    speculation.start(2)
+    started.wait(5)
+    assert speculation.call(3) == 6
+    assert calls == [2, 3]
+    speculation.shutdown()
+
+
+def test_failed_guess_falls_back_on_the_function():
+    def guess(x):
+        raise ValueError(x)
+
+    speculation = Speculation(lambda x: x * 2, guess)
+    speculation.start(2)
+    assert speculation.call(2) == 4
+    speculation.shutdown()
+
+
+def test_call_without_speculation():
+    assert Speculation(lambda x: x * 2).call(2) == 4
@@ -0,0 +1,47 @@
+import subprocess
+import sys
+import pytest
+from irail.manifest import build_manifest
+from irail.commands._manifest import COMMANDS
+
+
+# Cumulative import time of irail.cli for `irail --help`, in microseconds.
+# Measured at about 20ms; the budget leaves room for slower machines.
+STARTUP_BUDGET = 80000
+HEAVY_MODULES = ("requests", "pytz", "sqlite3", "concurrent.futures")
+
+needs_importtime = pytest.mark.skipif(sys.version_info < (3, 7),
+                                      reason="-X importtime needs Python 3.7")
+
+
+def import_times(*args):
+    code = "import sys; from irail.cli import cli; cli(%r)" % (list(args),)
+    process = subprocess.Popen([sys.executable, "-X", "importtime", "-c", code],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = process.communicate()
+    times = {}
+    for line in err.decode().splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_manifest_is_up_to_date():
+    assert build_manifest() == COMMANDS
+
+
+@needs_importtime
+def test_help_does_not_import_commands():
+    times = import_times("--help")
+    assert not any(name.startswith("irail.commands.cmd_") for name in times)
+    assert not any(name in times for name in HEAVY_MODULES)
+    assert times["irail.cli"] < STARTUP_BUDGET
+
+
+@needs_importtime
+def test_command_help_does_not_import_heavy_modules():
+    times = import_times("liveboard", "--help")
+    assert "irail.commands.cmd_liveboard" in times
+    assert not any(name in times for name in HEAVY_MODULES)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from irail.commands.stations import StationCatalogue, normalize
+
+
+GRAPH = [
+    {"@id": "http://irail.be/stations/NMBS/008892007", "name": "Gent-Sint-Pieters",
+     "alternative": [{"@language": "fr", "@value": "Gand-Saint-Pierre"}]},
+    {"@id": "http://irail.be/stations/NMBS/008893120", "name": "Gent-Dampoort",
+     "alternative": {"@language": "fr", "@value": "Gand-Dampoort"}},
+    {"@id": "http://irail.be/stations/NMBS/008892403", "name": "Gentbrugge"},
+    {"@id": "http://irail.be/stations/NMBS/008841004", "name": u"Liège-Guillemins",
+     "alternative": [{"@language": "nl", "@value": "Luik-Guillemins"}]},
+    {"@id": "http://irail.be/stations/NMBS/008814001", "name": "Brussel-Zuid",
+     "alternative": [{"@language": "fr", "@value": "Bruxelles-Midi"}]},
+]
+
+
+def names(suggestions):
+    return [s["name"] for s in suggestions]
+
+
+def test_normalize():
+    assert normalize(u"Liège-Guillemins") == u"liege guillemins"
+    assert normalize("  GENT-Sint-Pieters ") == u"gent sint pieters"
+
+
+def test_search():
+    catalogue = StationCatalogue.from_graph(GRAPH)
+    assert names(catalogue.search("gent")) == ["Gent-Dampoort", "Gent-Sint-Pieters", "Gentbrugge"]
+    assert names(catalogue.search("gent-sint-pieters")) == ["Gent-Sint-Pieters"]
+    assert names(catalogue.search("Bruxelles Midi")) == ["Brussel-Zuid"]
+    assert names(catalogue.search("liege")) == [u"Liège-Guillemins"]
+    assert names(catalogue.search("guillemins")) == [u"Liège-Guillemins"]
+    assert names(catalogue.search("gent sint pietres")) == ["Gent-Sint-Pieters"]
+    assert catalogue.search("") == []
+    assert catalogue.search("xyzzy") == []
+
+
+def test_save_and_load(tmpdir):
+    path = str(tmpdir.join("stations.json"))
+    catalogue = StationCatalogue.from_graph(GRAPH)
+    catalogue.save(path)
+    loaded = StationCatalogue.load(path)
+    assert loaded.fetched == catalogue.fetched
+    assert not loaded.is_stale()
+    assert names(loaded.search("gand")) == ["Gent-Dampoort", "Gent-Sint-Pieters"]
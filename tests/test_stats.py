@@ -0,0 +1,66 @@
+import json
+import pytest
+from click.testing import CliRunner
+from irail.commands import cmd_stats
+from irail.commands.history import History, history_path, CANCELLED
+from irail.commands.stats import delay_stats, grouped_percentiles, latest_observations
+
+numpy = pytest.importorskip("numpy")
+
+
+def make_history(rows):
+    store = History(history_path())
+    store.append(rows)
+    return store
+
+
+def test_latest_observations():
+    columns = {"observed": numpy.array([10, 20, 15]), "time": numpy.array([100, 100, 200]),
+               "station": numpy.array([0, 0, 0]), "vehicle": numpy.array([1, 1, 1])}
+    assert sorted(latest_observations(columns).tolist()) == [1, 2]
+
+
+def test_grouped_percentiles():
+    random = numpy.random.RandomState(0)
+    groups = random.randint(0, 5, 1000)
+    values = random.randint(0, 1200, 1000)
+    counts = numpy.bincount(groups, minlength=6)
+    p50, p90 = grouped_percentiles(groups, values, counts, (50, 90))
+    for group in range(5):
+        assert p50[group] == pytest.approx(numpy.percentile(values[groups == group], 50))
+        assert p90[group] == pytest.approx(numpy.percentile(values[groups == group], 90))
+    assert numpy.isnan(p50[5])
+
+
+def test_delay_stats():
+    store = make_history([
+        (1000, 3600, "Gent-Sint-Pieters", "BE.NMBS.IC1530", "Oostende", 600, 0),
+        # A later look at the same departure replaces the first one.
+        (1100, 3600, "Gent-Sint-Pieters", "BE.NMBS.IC1530", "Oostende", 120, 0),
+        (1100, 7200, "Gent-Sint-Pieters", "BE.NMBS.IC1531", "Oostende", 0, CANCELLED),
+        (1100, 7200, "Brugge", "BE.NMBS.L568", "Eeklo", 420, 0),
+    ])
+    rows = delay_stats(store.columns(), store.load_names(), "station")
+    assert rows[0] == {"group": "Gent-Sint-Pieters", "observations": 2, "punctuality": 1.0,
+                       "cancelled": 0.5, "delay_p50": 120.0, "delay_p90": 120.0, "delay_p99": 120.0}
+    assert rows[1]["punctuality"] == 0.0
+    lines = delay_stats(store.columns(), store.load_names(), "line")
+    assert [row["group"] for row in lines] == ["IC to Oostende", "L to Eeklo"]
+    hours = delay_stats(store.columns(), store.load_names(), "hour")
+    assert sorted(row["group"] for row in hours) == ["02:00", "03:00"]
+    assert delay_stats(store.columns(), store.load_names(), station="brugge")[0]["group"] == "Brugge"
+
+
+def test_stats_command(load_fixture):
+    History(history_path()).record("liveboard", load_fixture("liveboard_gent_sint_pieters"))
+    result = CliRunner().invoke(cmd_stats.cli, ["--by", "vehicle", "-f", "json"])
+    assert result.exit_code == 0, result.output
+    assert len(json.loads(result.output)) == 4
+    result = CliRunner().invoke(cmd_stats.cli, [])
+    assert result.output.splitlines()[1].startswith("Gent-Sint-Pieters")
+
+
+def test_stats_without_history():
+    result = CliRunner().invoke(cmd_stats.cli, [])
+    assert result.exit_code == 1
+    assert "IRAIL_RECORD=1" in result.output
@@ -0,0 +1,43 @@
+import json
+import pytest
+from irail.commands.streaming import JSONStream
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_items_and_header(load_fixture):
+    payload = load_fixture("liveboard_gent_sint_pieters")
+    text = json.dumps(payload, indent=1)
+    for size in (1, 7, 4096):
+        stream = JSONStream(chunked(text, size), ("departures", "departure"))
+        header = stream.read_header()
+        assert header["timestamp"] == payload["timestamp"]
+        assert header["stationinfo"] == payload["stationinfo"]
+        assert "departures" not in header
+        assert list(stream) == payload["departures"]["departure"]
+
+
+def test_items_are_yielded_before_the_end():
+    chunks = iter(['{"timestamp": "1", "stop": [{"a": 1}, ', '{"a": 2}', ']}'])
+    stream = iter(JSONStream(chunks, ("stop",)))
+    assert next(stream) == {"a": 1}
+    assert next(chunks) == '{"a": 2}'
+
+
+def test_numbers_split_across_chunks():
+    stream = JSONStream(['{"n": [12', '34, 5', '6]}'], ("n",))
+    assert list(stream) == [1234, 56]
+
+
+def test_empty_array_and_missing_path():
+    assert list(JSONStream(['{"stop": []}'], ("stop",))) == []
+    stream = JSONStream(['{"error": 404, "message": "Not found"}'], ("stop",))
+    assert list(stream) == []
+    assert stream.header == {"error": 404, "message": "Not found"}
+
+
+def test_truncated_stream():
+    with pytest.raises(ValueError):
+        list(JSONStream(['{"stop": [{"a": 1}, {"a"'], ("stop",)))
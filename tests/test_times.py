@@ -0,0 +1,33 @@
+import pytest
+from irail.commands import times
+from irail.commands.times import TimeFormatter
+
+
+def test_format_is_cached_per_minute():
+    formatter = TimeFormatter()
+    assert formatter.format("1462782390") == "10:26"
+    assert formatter.format(1462782359) == "10:25"
+    assert formatter.format(1462782390, include_date=True) == "10:26 (09/05/2016)"
+    assert len(formatter._cache) == 3
+
+
+def test_daylight_saving_time():
+    formatter = TimeFormatter()
+    # 27/03/2016: clocks go from 02:00 CET to 03:00 CEST
+    assert formatter.format(1459040340) == "01:59"
+    assert formatter.format(1459040400) == "03:00"
+
+
+def test_format_many():
+    formatter = TimeFormatter()
+    timestamps = ["1462782390", "1462782000", "1462782390"]
+    assert formatter.format_many(timestamps) == ["10:26", "10:20", "10:26"]
+
+
+def test_format_many_vectorized(monkeypatch):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(times, "VECTORIZE_THRESHOLD", 2)
+    formatter = TimeFormatter()
+    timestamps = [str(1459040340 + 30 * i) for i in range(6)]
+    assert formatter.format_many(timestamps) == \
+        ["01:59", "01:59", "03:00", "03:00", "03:01", "03:01"]
@@ -0,0 +1,122 @@
+import json
+from datetime import date
+from click.testing import CliRunner
+from irail.commands import cmd_route, cmd_timetable, utils
+from irail.commands.cache import ResponseCache
+from irail.commands.records import parse_connections
+from irail.commands.timetable import (TimetableBuilder, Timetable, build_from_cache,
+                                      build_from_gtfs, get_timetable, timetable_path)
+from irail.commands.times import formatter
+
+
+VEHICLES = ["vehicle_IC1530", "vehicle_L568", "vehicle_IC2318", "vehicle_IC1830"]
+
+
+def make_timetable(load_fixture):
+    builder = TimetableBuilder("fixtures")
+    for name in VEHICLES:
+        builder.add_vehicle_response(load_fixture(name))
+        builder.add_vehicle_response(load_fixture(name))
+    return builder.build()
+
+
+def test_connections_are_sorted(load_fixture):
+    timetable = make_timetable(load_fixture)
+    departures = list(timetable.columns["departure"])
+    assert departures == sorted(departures)
+    assert len(timetable.trips) == 4
+
+
+def test_earliest_arrival(load_fixture):
+    timetable = make_timetable(load_fixture)
+    connections = parse_connections(timetable.plan("Gent-Sint-Pieters", "Brussel-Zuid", 1462782000))
+    assert [(c.departure.vehicle, c.departure.time, c.arrival.time) for c in connections] == \
+        [("BE.NMBS.IC1530", 1462782600, 1462784580), ("BE.NMBS.IC1830", 1462784400, 1462786320)]
+
+
+def test_change_of_trains(load_fixture):
+    timetable = make_timetable(load_fixture)
+    connection, = parse_connections(timetable.plan("Merelbeke", "Eupen", 1462782000))
+    assert [leg.vehicle for leg, _, _ in connection.legs] == ["BE.NMBS.L568", "BE.NMBS.IC2318"]
+    assert connection.vias[0].station == "Denderleeuw"
+    assert connection.duration == 1462791000 - 1462783800
+
+
+def test_latest_departure(load_fixture):
+    timetable = make_timetable(load_fixture)
+    connections = parse_connections(timetable.plan("Gent-Sint-Pieters", "Brussel-Zuid",
+                                                   1462786000, "arrive"))
+    assert [c.departure.vehicle for c in connections] == ["BE.NMBS.IC1530"]
+
+
+def test_unknown_station(load_fixture):
+    assert make_timetable(load_fixture).plan("Gent-Sint-Pieters", "Namur", 1462782000) == []
+
+
+def test_save_and_load(load_fixture, tmpdir):
+    timetable = make_timetable(load_fixture)
+    timetable.save(str(tmpdir.join("timetable")))
+    loaded = Timetable.load(str(tmpdir.join("timetable")))
+    assert loaded.columns == timetable.columns
+    assert loaded.plan("Merelbeke", "Eupen", 1462782000) == timetable.plan("Merelbeke", "Eupen", 1462782000)
+
+
+def write_gtfs(directory):
+    files = {
+        "routes.txt": "route_id,route_short_name\nr1,IC\n",
+        "calendar.txt": ("service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,"
+                         "start_date,end_date\nweekdays,1,1,1,1,1,0,0,20160101,20161231\n"),
+        "calendar_dates.txt": "service_id,date,exception_type\nweekdays,20160510,2\n",
+        "trips.txt": ("route_id,service_id,trip_id,trip_short_name,trip_headsign\n"
+                      "r1,weekdays,t1,1530,Antwerpen-Centraal\n"),
+        "stops.txt": ("stop_id,stop_name,parent_station,platform_code\n"
+                      "S1,Gent-Sint-Pieters,,\nS1_4,Gent-Sint-Pieters,S1,4\nS2,Brussel-Zuid,,\n"),
+        "stop_times.txt": ("trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+                           "t1,09:50:00,09:50:00,S1_4,1\nt1,24:25:00,24:25:00,S2,2\n"),
+    }
+    for name, content in files.items():
+        directory.join(name).write(content)
+
+
+def test_gtfs_import(tmpdir):
+    feed = tmpdir.mkdir("gtfs")
+    write_gtfs(feed)
+    timetable = build_from_gtfs(str(feed), date(2016, 5, 9), 2)
+    assert len(timetable) == 1
+    connection, = parse_connections(timetable.plan("Gent-Sint-Pieters", "Brussel-Zuid", 0))
+    assert connection.departure.time == formatter.epoch(2016, 5, 9, 9 * 3600 + 50 * 60)
+    assert connection.arrival.time == formatter.epoch(2016, 5, 10, 25 * 60)
+    assert connection.departure.platform.name == "4"
+    assert connection.departure.direction == "Antwerpen-Centraal"
+
+
+def test_build_from_cache(load_fixture, tmpdir):
+    cache = ResponseCache(str(tmpdir.join("cache.sqlite")))
+    for name in VEHICLES:
+        cache.store(name, "vehicle", load_fixture(name))
+    cache.store("liveboard", "liveboard", load_fixture("liveboard_gent_sint_pieters"))
+    assert len(build_from_cache(cache).trips) == 4
+
+
+def test_timetable_command(load_fixture, monkeypatch):
+    monkeypatch.setattr(cmd_timetable, "get_cache", lambda: None)
+    assert CliRunner().invoke(cmd_timetable.cli, ["--update"]).exit_code == 1
+    assert CliRunner().invoke(cmd_timetable.cli, []).exit_code == 1
+    make_timetable(load_fixture).save(timetable_path())
+    result = CliRunner().invoke(cmd_timetable.cli, [])
+    assert result.exit_code == 0
+    assert "connections between 11 stations on 4 trips" in result.output
+
+
+def test_route_local(load_fixture, monkeypatch):
+    make_timetable(load_fixture).save(timetable_path())
+    monkeypatch.setattr(utils, "find_stations", lambda s: [{"name": s}])
+    monkeypatch.setattr(cmd_route, "route_request", None)
+    monkeypatch.setattr(cmd_route, "route_response", None)
+    # the recorded vehicles ran in 2016, which verify_date no longer accepts
+    monkeypatch.setattr(cmd_route, "verify_date", lambda date: True)
+    result = CliRunner().invoke(cmd_route.cli, ["Merelbeke", "Eupen", "--local", "-d", "090516",
+                                                "-t", "1000", "-f", "json"])
+    assert result.exit_code == 0, result.output
+    connection, = json.loads(result.output)
+    assert connection["vehicles"] == ["BE.NMBS.L568", "BE.NMBS.IC2318"]
@@ -0,0 +1,50 @@
+import json
+from irail.commands.trace import Tracer, trace_settings
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    with tracer.span("parse") as span:
+        span.set(rows=3)
+    tracer.count("requests.liveboard")
+    assert tracer.spans == [] and tracer.counters == {}
+
+
+def test_summary():
+    tracer = Tracer()
+    tracer.enable()
+    for _ in range(2):
+        with tracer.span("http liveboard", "http", status=200):
+            pass
+    with tracer.span("render"):
+        pass
+    tracer.count("cache.hit")
+    tracer.count("cache.hit")
+    assert [(name, calls) for name, calls, _, _ in tracer.summary()] == \
+        [("http liveboard", 2), ("render", 1)]
+    text = tracer.format_summary()
+    assert "wall time" in text
+    assert "cache.hit" in text
+
+
+def test_chrome_trace(tmpdir):
+    tracer = Tracer()
+    tracer.enable()
+    with tracer.span("decode vehicle", "decode") as span:
+        span.set(size=10)
+    path = str(tmpdir.join("trace.json"))
+    tracer.export(path)
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+    assert events[0]["name"] == "decode vehicle"
+    assert events[0]["ph"] == "X"
+    assert events[0]["args"] == {"size": 10}
+
+
+def test_trace_settings():
+    assert trace_settings(False, None, {}) == (False, None)
+    assert trace_settings(True, None, {}) == (True, None)
+    assert trace_settings(False, "out.json", {}) == (True, "out.json")
+    assert trace_settings(False, None, {"IRAIL_TRACE": "1"}) == (True, None)
+    assert trace_settings(False, None, {"IRAIL_TRACE": "0"}) == (False, None)
+    assert trace_settings(False, None, {"IRAIL_TRACE": "trace.json"}) == (True, "trace.json")
@@ -0,0 +1,47 @@
+import copy
+from click.testing import CliRunner
+from irail.commands import cmd_vehicle
+
+
+def test_vehicle(monkeypatch, load_fixture):
+    monkeypatch.setattr(cmd_vehicle, "vehicle_request", lambda vehicle_id: load_fixture("vehicle_IC1530"))
+    result = CliRunner().invoke(cmd_vehicle.cli, ["IC1530"])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert "BE.NMBS.IC1530" in lines[0]
+    assert lines[1].startswith("09:50")
+    assert lines[1].endswith("Oostende")
+    assert lines[3].startswith("10:30 +2")
+    assert len(lines) == 8
+
+
+def test_continuous_vehicle(monkeypatch, load_fixture):
+    first = load_fixture("vehicle_IC1530")
+    delayed = copy.deepcopy(first)
+    delayed["timestamp"] = "1462782700"
+    delayed["stops"]["stop"][3]["delay"] = "300"
+    arrived = copy.deepcopy(delayed)
+    arrived["timestamp"] = "1462787500"
+    responses = [first, delayed, arrived]
+    sleeps = []
+    monkeypatch.setattr(cmd_vehicle, "vehicle_request", lambda vehicle_id: responses.pop(0))
+    monkeypatch.setattr(cmd_vehicle, "sleep", sleeps.append)
+    result = CliRunner().invoke(cmd_vehicle.cli, ["IC1530", "-c"], color=True)
+    assert result.exit_code == 0, result.output
+    # Polling stops by itself once the last stop is reached.
+    assert not responses
+    assert sleeps == [30, 30]
+    first_frame, second_frame, last_frame = result.output.split("\x1b[8F")
+    assert first_frame.count("\n") == 8
+    # Only the header and the stop with a new delay are redrawn.
+    assert second_frame.count("\x1b[2K") == 2
+    assert "+5" in second_frame and "Aalst" in second_frame
+    assert "Oostende" not in last_frame
+
+
+def test_poll_interval(load_fixture):
+    stops = cmd_vehicle.parse_vehicle_journey(load_fixture("vehicle_IC1530")).stops
+    poller = cmd_vehicle.AdaptivePoller()
+    # Hours before departure, wait until shortly ahead of it.
+    assert cmd_vehicle.poll_interval(poller, stops, True, 1462780200 - 3600) == 3600 - poller.maximum
+    assert cmd_vehicle.poll_interval(poller, stops, False, 1462782000) == 45